@@ -1,15 +1,65 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     openai_api_key: str
     openalex_api_url: str = "https://api.openalex.org/works"
+    openalex_base_url: str = "https://api.openalex.org"
+    openai_base_url: Optional[str] = None  # Point at a local stand-in for benchmarks
+    http_replay_mode: Optional[str] = None  # "record" or "replay" upstream HTTP traffic
+    http_replay_archive: str = "http_archive.jsonl.gz"
+    http_replay_time_scale: float = 1.0  # 0 replays instantly, 0.5 twice as fast
     contact_email: str  # Add this for OpenAlex API polite pool
-    discord_bot_token: str
-    discord_guild_id: str
-    discord_channel_id: str
-    discord_client_id: str  # Application ID from Discord Developer Portal
+    openai_routes: Dict[str, Dict[str, Any]] = {}  # Per-stage model chain, max_tokens, timeout (see openai_service.DEFAULT_ROUTES)
+    openai_model_prices: Dict[str, List[float]] = {}  # USD per 1M prompt/completion tokens, added to the built-in table
+    openalex_max_concurrency: int = 8  # Parallel OpenAlex requests per enrichment/batch
+    openalex_saturation_patience: int = 1  # Stop a term's crawl after this many pages add no new funder; 0 disables
+    openalex_request_timeout: float = 30.0  # Upper bound per request; report deadlines can cut it shorter
+    openalex_hedging: bool = False  # Duplicate requests still unanswered after the endpoint's observed p95
+    openalex_hedge_percentile: float = 0.95
+    openalex_hedge_min_samples: int = 20  # Responses needed before the percentile is trusted
+    report_deadline: float = 120.0  # Seconds a report's OpenAlex calls may run; 0 disables
+    stage_budgets: Dict[str, Optional[float]] = {}  # Per-stage seconds over pipeline.DEFAULT_STAGE_BUDGETS; null disables
+    openalex_api_key: Optional[str] = None  # Premium key, needed for from_updated_date filters
+    # Local funder/grant store; enabled by setting a SQLite path
+    funder_store_path: Optional[str] = None
+    funder_store_topics: List[str] = []  # JSON list, e.g. ["crispr", "climate modeling"]
+    funder_store_sync_interval: float = 6 * 3600
+    funder_store_sync_max_pages: int = 25  # Per topic per pass
+    saved_reports_path: Optional[str] = None  # SQLite path; enables /saved_reports (incrementally refreshed reports)
+    term_extractor: str = "auto"  # auto (LLM with local fallback), llm or local
+    term_extractor_first_term_timeout: float = 5.0  # Seconds the LLM gets for its first term under "auto"
+    term_extractor_term_timeout: float = 2.0  # ...and for each term after that
+    speculative_prefetch: bool = False  # Crawl a local keyphrase while the LLM extracts search terms
+    speculative_overlap: float = 0.5  # Word overlap needed to reuse the speculative crawl for a term
+    stream_compression: bool = False  # Opt-in: gzip (or brotli, if installed) SSE/NDJSON streams for clients that accept it
+    loop_monitor_interval: float = 0.25  # Seconds between event loop lag samples (event_loop.lag_seconds); 0 disables
+    debug: bool = False  # Log the stack whenever the event loop is blocked for over LOOP_BLOCK_THRESHOLD
+    loop_block_threshold: float = 0.1
+    admin_token: Optional[str] = None  # Enables /admin endpoints and ?profile=true on reports; sent as X-Admin-Token
+    profile_sample_interval: float = 0.005  # Seconds between stack samples of a profiled report
+    batch_max_descriptions: int = 100
+    batch_concurrency: int = 4  # Parallel LLM calls per batch
+    # Discord is optional; the bot is only started when all of these are set
+    discord_bot_token: Optional[str] = None
+    discord_guild_id: Optional[str] = None
+    discord_channel_id: Optional[str] = None
+    discord_client_id: Optional[str] = None  # Application ID from Discord Developer Portal
+    discord_max_concurrent_commands: int = 4  # Commands running at once across all guilds
+    discord_guild_concurrency: int = 2  # ...and within one guild
+    discord_stream_answers: bool = True  # Stream !ask answers into edited messages as the model writes them
+    discord_stream_edit_interval: float = 1.0  # Seconds between edits of a streamed answer
 
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
-settings = Settings() 
\ No newline at end of file
+    @property
+    def discord_enabled(self) -> bool:
+        return bool(self.discord_bot_token and self.discord_channel_id and self.discord_client_id)
+
+@lru_cache
+def get_settings() -> Settings:
+    """Settings are read on first use rather than at import time."""
+    return Settings()
@@ -0,0 +1,111 @@
+"""Lazily constructed service singletons.
+
+Nothing here is built at import time: each service (and its heavy client
+library) is imported and constructed on first use, and shared afterwards.
+Routes receive them through FastAPI's `Depends`.
+"""
+import secrets
+from functools import lru_cache
+from typing import Optional
+from fastapi import Header, HTTPException, Query
+
+from .config import get_settings
+
+
+@lru_cache
+def get_openai_service():
+    from .services.openai_service import OpenAIService
+    return OpenAIService()
+
+
+@lru_cache
+def get_openalex_service():
+    from .services.openalex import OpenAlexService
+    return OpenAlexService()
+
+
+@lru_cache
+def get_discord_service():
+    """The Discord service, or None when the bot is not configured."""
+    if not get_settings().discord_enabled:
+        return None
+    from .services.discord_service import DiscordService
+    return DiscordService()
+
+
+def require_discord_service():
+    discord_service = get_discord_service()
+    if discord_service is None:
+        raise HTTPException(status_code=503, detail="Discord integration is not configured")
+    return discord_service
+
+
+@lru_cache
+def get_saved_report_store():
+    """The saved report store, or None when SAVED_REPORTS_PATH is not set."""
+    path = get_settings().saved_reports_path
+    if not path:
+        return None
+    from .services.saved_reports import SavedReportStore
+    return SavedReportStore(path)
+
+
+def require_saved_report_store():
+    store = get_saved_report_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Saved reports are not configured")
+    return store
+
+
+@lru_cache
+def get_term_extractor(name: str):
+    """Term extractor by name (see `services.term_extractors`); ValueError if unknown."""
+    from .services.term_extractors import TERM_EXTRACTORS, FallbackTermExtractor, LLMTermExtractor, LocalTermExtractor
+    if name not in TERM_EXTRACTORS:
+        raise ValueError(f"Unknown term extractor: {name} (expected one of {', '.join(TERM_EXTRACTORS)})")
+    if name == "llm":
+        return LLMTermExtractor(get_openai_service())
+    if name == "local":
+        return LocalTermExtractor()
+    settings = get_settings()
+    return FallbackTermExtractor(
+        get_term_extractor("llm"),
+        get_term_extractor("local"),
+        first_term_timeout=settings.term_extractor_first_term_timeout,
+        term_timeout=settings.term_extractor_term_timeout
+    )
+
+
+def select_term_extractor(term_extractor: Optional[str] = Query(None)):
+    """Per-request extractor choice, defaulting to the TERM_EXTRACTOR setting."""
+    try:
+        return get_term_extractor(term_extractor or get_settings().term_extractor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin-only routes: the ADMIN_TOKEN setting, sent as an X-Admin-Token header (not in the URL, where it gets logged)."""
+    expected = get_settings().admin_token
+    if not expected:
+        raise HTTPException(status_code=503, detail="Admin endpoints are not configured")
+    supplied = x_admin_token or ""
+    if not secrets.compare_digest(supplied.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def select_profiling(
+    profile: bool = Query(False),
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None),
+) -> bool:
+    """Whether to profile this report (`?profile=true` or `X-Profile: 1`, admins only; see app.profiling)."""
+    if not (profile or x_profile in ("1", "true")):
+        return False
+    require_admin(x_admin_token)
+    return True
+
+
+def select_report_format(report_format: str = Query("full", alias="format", pattern="^(full|compact)$")) -> str:
+    """`?format=compact` asks for `pipeline.compact_report`'s shape of the final report."""
+    return report_format
@@ -0,0 +1,83 @@
+"""Event loop lag monitoring and, in debug mode, a blocking-call watchdog.
+
+Every SSE stream and the co-hosted Discord bot share one event loop, so a
+single blocking call delays all of them. `LoopMonitor` sleeps `interval`
+seconds at a time and records how late each wake-up was as
+`event_loop.lag_seconds` in `GET /metrics`.
+
+With `watchdog_threshold` set (the `DEBUG` setting), a thread also pings the
+loop; when a ping goes unanswered for longer than the threshold, the loop is
+stuck (usually in one blocking callback), and the stack it is stuck in is
+logged while it is still blocking, once per episode.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .metrics import metrics
+
+# Buckets from 0.1ms to ~26s: healthy lag is well under a millisecond
+LAG_BUCKETS = tuple(0.0001 * 2 ** i for i in range(19))
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.25, watchdog_threshold: Optional[float] = None):
+        self.interval = interval
+        self.watchdog_threshold = watchdog_threshold
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        metrics.histogram("event_loop.lag_seconds", LAG_BUCKETS)
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample_lag())
+        if self.watchdog_threshold:
+            self._watchdog = threading.Thread(
+                target=self._watch, args=(loop, threading.get_ident()), name="loop-watchdog", daemon=True
+            )
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            metrics.observe("event_loop.lag_seconds", max(loop.time() - start - self.interval, 0.0))
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int):
+        while not self._stopped.is_set():
+            answered = threading.Event()
+            sent = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                return  # The loop is closed
+            if answered.wait(self.watchdog_threshold):
+                self._stopped.wait(self.interval)
+                continue
+
+            frame = sys._current_frames().get(loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no stack)\n"
+            print(f"Event loop blocked for over {self.watchdog_threshold * 1000:.0f}ms, in:\n{stack}", end="")
+            del frame
+            metrics.inc("event_loop.blocked")
+            while not answered.wait(1.0):
+                if self._stopped.is_set():
+                    return
+            print(f"Event loop unblocked after {(time.monotonic() - sent) * 1000:.0f}ms")
@@ -1,22 +1,87 @@
-from fastapi import FastAPI, HTTPException, Query
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sse_starlette.sse import EventSourceResponse
-import json
 import asyncio
 import traceback
 import logging
+from datetime import date
+from typing import Dict, Optional
 
-from .models import ProjectDescription
-from .services.openai_service import openai_service
-from .services.openalex import openalex_service
-from .services.discord_service import discord_service
+from .config import get_settings
+from .loop_monitor import LoopMonitor
+from .metrics import metrics
+from .serialization import FastJSONResponse, event_frame, maybe_compressed, ndjson_line
+from .models import BatchProjectDescriptions, SavedReportRequest
+from .dependencies import (
+    get_discord_service, get_openai_service, get_openalex_service, require_admin, require_discord_service,
+    require_saved_report_store, select_profiling, select_report_format, select_term_extractor
+)
+from .pipeline import ReportError, ReportPipeline, format_report
+from .profiling import Profile, profiler
+from .services.singleflight import SingleFlight
+from .services.funder_store import run_store_sync
+from .services.saved_reports import FULL_REFRESH_SINCE
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the Discord bot and the funder store sync with the application, if they are configured"""
+    settings = get_settings()
+    loop_monitor = None
+    if settings.loop_monitor_interval:
+        loop_monitor = LoopMonitor(
+            settings.loop_monitor_interval, settings.loop_block_threshold if settings.debug else None
+        )
+        loop_monitor.start()
+    store_sync = None
+    if settings.funder_store_path and settings.funder_store_topics:
+        logger.info(f"Starting funder store sync for {len(settings.funder_store_topics)} topics")
+        store_sync = asyncio.create_task(run_store_sync(
+            get_openalex_service(),
+            settings.funder_store_topics,
+            settings.funder_store_sync_interval,
+            settings.funder_store_sync_max_pages
+        ))
+
+    discord_service = get_discord_service()
+    if discord_service is None:
+        logger.info("Discord is not configured, skipping bot startup")
+    else:
+        logger.info("Starting Discord bot...")
+        try:
+            await discord_service.start_bot()
+            logger.info("Discord bot started successfully!")
+        except Exception as e:
+            logger.error(f"Failed to start Discord bot: {e}")
+            logger.error(traceback.format_exc())
+
+    yield
+
+    if discord_service is not None:
+        logger.info("Stopping Discord bot...")
+        try:
+            await discord_service.stop_bot()
+            logger.info("Discord bot stopped successfully!")
+        except Exception as e:
+            logger.error(f"Failed to stop Discord bot: {e}")
+
+    if store_sync is not None:
+        store_sync.cancel()
+        try:
+            await store_sync
+        except asyncio.CancelledError:
+            pass
+
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -28,29 +93,36 @@ app.add_middleware(
     expose_headers=["Content-Type", "text/event-stream"]  # Explicitly expose SSE headers
 )
 
-@app.on_event("startup")
-async def startup_event():
-    """Start the Discord bot when the FastAPI application starts"""
-    logger.info("Starting Discord bot...")
-    try:
-        await discord_service.start_bot()
-        logger.info("Discord bot started successfully!")
-    except Exception as e:
-        logger.error(f"Failed to start Discord bot: {e}")
-        logger.error(traceback.format_exc())
+@app.get("/health")
+async def health_check():
+    """Cheap liveness check that does not construct any service"""
+    return {"status": "healthy"}
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Stop the Discord bot when the FastAPI application shuts down"""
-    logger.info("Stopping Discord bot...")
-    try:
-        await discord_service.stop_bot()
-        logger.info("Discord bot stopped successfully!")
-    except Exception as e:
-        logger.error(f"Failed to stop Discord bot: {e}")
+@app.get("/metrics")
+async def get_metrics():
+    """Process-local counters and latency histograms (LLM routes, ...) as JSON"""
+    return metrics.snapshot()
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Profiled reports kept in memory, newest first, with their stage times and upstream waits"""
+    return [profile.summary() for profile in profiler.profiles()]
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    """A profiled report as a speedscope file (open it at https://www.speedscope.app)"""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    if profile.finished is None:
+        raise HTTPException(status_code=409, detail="Profile is still running")
+    return FastJSONResponse(
+        profile.speedscope(),
+        headers={"Content-Disposition": f'attachment; filename="report-{profile.id}.speedscope.json"'}
+    )
 
 @app.post("/discord/send")
-async def send_discord_message(message: str = Query(...)):
+async def send_discord_message(message: str = Query(...), discord_service=Depends(require_discord_service)):
     """Send a message to the configured Discord channel"""
     try:
         await discord_service.send_message(message)
@@ -59,185 +131,207 @@ async def send_discord_message(message: str = Query(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/generate_funding_report")
-async def generate_funding_report(description: str = Query(...)):
+async def generate_funding_report(
+    request: Request,
+    description: str = Query(...),
+    speculative: Optional[bool] = Query(None),
+    openai_service=Depends(get_openai_service),
+    openalex_service=Depends(get_openalex_service),
+    term_extractor=Depends(select_term_extractor),
+    report_format: str = Depends(select_report_format),
+    profiling: bool = Depends(select_profiling),
+):
+    settings = get_settings()
+    pipeline = ReportPipeline(
+        openai_service,
+        openalex_service,
+        speculative=settings.speculative_prefetch if speculative is None else speculative,
+        speculative_overlap=settings.speculative_overlap,
+        term_extractor=term_extractor,
+        deadline_seconds=settings.report_deadline,
+        stage_budgets=settings.stage_budgets
+    )
+
+    events = pipeline.events(description)
+    # Only this report is profiled: the profile follows its context into the tasks it starts
+    profile = Profile(description[:200], settings.profile_sample_interval) if profiling else None
+
     async def event_generator():
+        async for event in events:
+            yield event_frame(format_report(event, report_format))
+        logger.info("Results sent successfully")
+
+    async def profiled_event_generator():
+        with profiler.activate(profile):
+            async for frame in event_generator():
+                yield frame
+
+    stream = profiled_event_generator() if profile else event_generator()
+
+    async def close_report():
+        # Closing the stream ends its profile even if the client left while it was paused at a frame,
+        # and closing the pipeline cancels its upstream work if the client left mid-report
         try:
-            # Start search terms generation
-            print("Starting search terms generation...")  # Debug log
-            await asyncio.sleep(0.1)
-            yield {
-                "event": "message",
-                "data": json.dumps({"stage": "searchTerms", "status": "started"})
-            }
-            
-            try:
-                search_terms = await openai_service.extract_search_terms(description)
-                search_terms = search_terms[:3]
-                print(f"Generated search terms: {search_terms}")
-            except Exception as e:
-                print(f"Error in extract_search_terms: {str(e)}")
-                print(traceback.format_exc())
-                yield {
-                    "event": "message",
-                    "data": json.dumps({"error": f"Search terms error: {str(e)}"})
-                }
-                return
-
-            yield {
-                "event": "message",
-                "data": json.dumps({
-                    "stage": "searchTerms",
-                    "status": "completed",
-                    "data": search_terms
-                })
-            }
-
-            # Search for papers for each term
-            papers_found = 0
-            funders_data = []
-            
-            for term in search_terms:
-                print(f"Searching papers for term: {term}")  # Debug log
-                yield {
-                    "event": "message",
-                    "data": json.dumps({
-                        "stage": "paperSearch",
-                        "status": "started",
-                        "term": term
-                    })
-                }
-                
-                try:
-                    term_papers = await openalex_service.search_for_grants([term], 10)  # Reduced max_results for testing
-                    funders_data.extend(term_papers)
-                    papers_found += len(term_papers)
-                    print(f"Found {len(term_papers)} papers for term: {term}")  # Debug log
-                except Exception as e:
-                    print(f"Error searching papers for term {term}: {str(e)}")
-                    print(traceback.format_exc())
-                    # Continue with other terms instead of raising
-                    yield {
-                        "event": "message",
-                        "data": json.dumps({
-                            "stage": "paperSearch",
-                            "status": "error",
-                            "term": term,
-                            "error": str(e)
-                        })
-                    }
-                    continue
-
-                yield {
-                    "event": "message",
-                    "data": json.dumps({
-                        "stage": "paperSearch",
-                        "status": "completed",
-                        "term": term,
-                        "count": len(term_papers)
-                    })
-                }
-
-            # If we didn't find any papers with grants, return an empty result
-            if not funders_data:
-                print("No papers with grants found")
-                yield {
-                    "event": "message",
-                    "data": json.dumps({
-                        "error": "No papers with grants found for the given search terms."
-                    })
-                }
-                return
-
-            # Compile funding data
-            print("Starting funding data compilation...")  # Debug log
-            yield {
-                "event": "message",
-                "data": json.dumps({
-                    "stage": "fundingData",
-                    "status": "started"
-                })
-            }
-            
-            try:
-                enriched_data = await openalex_service.enrich_funders_data(funders_data)
-            except Exception as e:
-                print(f"Error enriching funders data: {str(e)}")
-                print(traceback.format_exc())
-                # Continue with unenriched data
-                enriched_data = funders_data
-                yield {
-                    "event": "message",
-                    "data": json.dumps({
-                        "stage": "fundingData",
-                        "status": "error",
-                        "error": str(e)
-                    })
-                }
-
-            yield {
-                "event": "message",
-                "data": json.dumps({
-                    "stage": "fundingData",
-                    "status": "completed"
-                })
-            }
-
-            # Generate summary
-            print("Generating summary...")  # Debug log
-            yield {
-                "event": "message",
-                "data": json.dumps({
-                    "stage": "summary",
-                    "status": "started"
-                })
-            }
-            
-            try:
-                summary = await openai_service.generate_summary(description, enriched_data)
-            except Exception as e:
-                print(f"Error generating summary: {str(e)}")
-                print(traceback.format_exc())
-                summary = "Unable to generate summary due to an error."
-                yield {
-                    "event": "message",
-                    "data": json.dumps({
-                        "stage": "summary",
-                        "status": "error",
-                        "error": str(e)
-                    })
-                }
-
-            yield {
-                "event": "message",
-                "data": json.dumps({
-                    "stage": "summary",
-                    "status": "completed"
-                })
-            }
-            
-            # Send final results
-            result = {
-                "search_terms": search_terms,
-                "funders_data": enriched_data,
-                "summary": summary
-            }
-            
-            print("Sending final results...")
-            yield {
-                "event": "message",
-                "data": json.dumps(result)
-            }
-            print("Results sent successfully")  # Add debug log
+            await stream.aclose()
+        finally:
+            await events.aclose()
 
-        except Exception as e:
-            print(f"Error in event_generator: {str(e)}")
-            print(traceback.format_exc())
-            yield {
-                "event": "message",
-                "data": json.dumps({"error": str(e)})
-            }
-
-    return EventSourceResponse(event_generator())
+    response = EventSourceResponse(
+        stream,
+        background=BackgroundTask(close_report),
+        headers={"X-Profile-Id": profile.id} if profile else None
+    )
+    return maybe_compressed(response, request.headers.get("accept-encoding"), settings.stream_compression)
+
+@app.post("/generate_funding_reports")
+async def generate_funding_reports(
+    request: Request,
+    batch: BatchProjectDescriptions,
+    openai_service=Depends(get_openai_service),
+    openalex_service=Depends(get_openalex_service),
+    term_extractor=Depends(select_term_extractor),
+    report_format: str = Depends(select_report_format),
+):
+    """Reports for many descriptions at once, streamed as NDJSON (one report per line)"""
+    settings = get_settings()
+    if not batch.descriptions:
+        raise HTTPException(status_code=400, detail="No descriptions provided")
+    if len(batch.descriptions) > settings.batch_max_descriptions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.batch_max_descriptions} descriptions per batch"
+        )
+    pipeline = ReportPipeline(
+        openai_service,
+        openalex_service,
+        max_results_per_term=batch.max_results_per_term,
+        term_extractor=term_extractor
+    )
+
+    reports = pipeline.batch(
+        batch.descriptions,
+        llm_concurrency=settings.batch_concurrency,
+        crawl_concurrency=settings.openalex_max_concurrency
+    )
+
+    async def ndjson_generator():
+        async for report in reports:
+            yield ndjson_line(format_report(report, report_format))
+
+    response = StreamingResponse(
+        ndjson_generator(), media_type="application/x-ndjson", background=BackgroundTask(reports.aclose)
+    )
+    return maybe_compressed(response, request.headers.get("accept-encoding"), settings.stream_compression)
+
+# Concurrent refreshes of one saved report share a single run
+saved_report_refreshes = SingleFlight("saved_report_refresh")
+
+def saved_report_view(report_id: str, description: str, last_run: str, report: Dict,
+                      report_format: str) -> FastJSONResponse:
+    """A saved report, shaped like the final report of the streamed endpoints.
+
+    Returned as a response so the typed works skip `jsonable_encoder`, which
+    would dump every unset field.
+    """
+    return FastJSONResponse(
+        {"id": report_id, "description": description, "last_run": last_run, **format_report(report, report_format)}
+    )
+
+@app.post("/saved_reports")
+async def create_saved_report(
+    body: SavedReportRequest,
+    openai_service=Depends(get_openai_service),
+    openalex_service=Depends(get_openalex_service),
+    term_extractor=Depends(select_term_extractor),
+    report_format: str = Depends(select_report_format),
+    store=Depends(require_saved_report_store),
+):
+    """Run a full report and save it for incremental refreshes"""
+    settings = get_settings()
+    pipeline = ReportPipeline(
+        openai_service,
+        openalex_service,
+        max_results_per_term=body.max_results_per_term,
+        term_extractor=term_extractor,
+        deadline_seconds=settings.report_deadline,
+        stage_budgets=settings.stage_budgets
+    )
+    # Taken before the run, so works published while it runs are picked up by the first refresh
+    last_run = date.today().isoformat()
+    try:
+        report = await pipeline.run(body.description)
+    except ReportError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "paperSearch" in report["partial"]:
+        # The search was cut short and may have missed older works, so the first refresh searches all dates
+        last_run = FULL_REFRESH_SINCE
+    report_id = await store.create(body.description, body.max_results_per_term, report, last_run)
+    return saved_report_view(report_id, body.description, last_run, report, report_format)
+
+@app.get("/saved_reports")
+async def list_saved_reports(store=Depends(require_saved_report_store)):
+    """Saved reports (without their works), newest first"""
+    return await store.list_reports()
+
+@app.get("/saved_reports/{report_id}")
+async def get_saved_report(
+    report_id: str,
+    report_format: str = Depends(select_report_format),
+    store=Depends(require_saved_report_store),
+):
+    saved = await store.get(report_id)
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Unknown saved report")
+    return saved_report_view(report_id, saved["description"], saved["last_run"], saved, report_format)
+
+@app.post("/saved_reports/{report_id}/refresh")
+async def refresh_saved_report(
+    report_id: str,
+    openai_service=Depends(get_openai_service),
+    openalex_service=Depends(get_openalex_service),
+    report_format: str = Depends(select_report_format),
+    store=Depends(require_saved_report_store),
+):
+    """Fetch only the works published (or updated) since the last run and merge them in.
+
+    The summary is regenerated only when the funder picture changed materially;
+    the response's `refresh` entry says what was fetched and what changed.
+    """
+    settings = get_settings()
+
+    async def refresh():
+        saved = await store.get(report_id)
+        if saved is None:
+            return None
+        started = date.today().isoformat()
+        pipeline = ReportPipeline(
+            openai_service,
+            openalex_service,
+            max_results_per_term=saved["max_results_per_term"],
+            deadline_seconds=settings.report_deadline,
+            stage_budgets=settings.stage_budgets
+        )
+        report = await pipeline.refresh(saved)
+        # A search cut short by the deadline may have missed works; look from the same date next time
+        last_run = saved["last_run"] if "paperSearch" in report["partial"] else started
+        await store.update(report_id, report, last_run)
+        return saved["description"], last_run, report
+
+    try:
+        refreshed = await saved_report_refreshes.do(report_id, refresh)
+    except Exception as e:
+        logger.exception(f"Error refreshing saved report {report_id}")
+        raise HTTPException(status_code=502, detail=f"Refresh failed, saved report unchanged: {str(e)}")
+    if refreshed is None:
+        raise HTTPException(status_code=404, detail="Unknown saved report")
+    description, last_run, report = refreshed
+    return saved_report_view(report_id, description, last_run, report, report_format)
+
+@app.delete("/saved_reports/{report_id}")
+async def delete_saved_report(report_id: str, store=Depends(require_saved_report_store)):
+    if not await store.delete(report_id):
+        raise HTTPException(status_code=404, detail="Unknown saved report")
+    return {"status": "deleted", "id": report_id}
 
 if __name__ == "__main__":
     import uvicorn
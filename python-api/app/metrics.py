@@ -0,0 +1,101 @@
+"""In-process counters and latency histograms, served as JSON by `GET /metrics`.
+
+Metrics are keyed by name plus keyword labels, e.g.
+
+    metrics.inc("llm.calls", stage="summary", model="gpt-4o")
+    metrics.observe("llm.latency_seconds", 1.8, stage="summary", model="gpt-4o")
+
+Everything lives in this process; nothing is exported or persisted.
+"""
+import bisect
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Sequence, Tuple
+
+# Exponential buckets from 1ms to ~2 minutes (upper bounds, in seconds)
+DEFAULT_BUCKETS = tuple(0.001 * 2 ** i for i in range(18))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are reported as bucket upper bounds."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is overflow
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for position, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(self.buckets[position], self.max) if position < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": round(self.max, 6),
+        }
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = defaultdict(dict)
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        with self._lock:
+            self.counters[name][_label_key(labels)] += amount
+
+    def histogram(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels) -> Histogram:
+        """The histogram for these labels, created on first use."""
+        key = _label_key(labels)
+        with self._lock:
+            if key not in self.histograms[name]:
+                self.histograms[name][key] = Histogram(buckets)
+            return self.histograms[name][key]
+
+    def observe(self, name: str, value: float, **labels):
+        histogram = self.histogram(name, **labels)
+        with self._lock:
+            histogram.observe(value)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": round(value, 6)} for key, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+                "histograms": {
+                    name: [{"labels": dict(key), **histogram.snapshot()} for key, histogram in series.items()]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+
+metrics = Metrics()
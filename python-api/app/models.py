@@ -1,12 +1,35 @@
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl, field_serializer, field_validator
 from typing import Optional, List, Dict
 from datetime import datetime
 
+class Funder(BaseModel):
+    id: str
+    display_name: str
+    alternate_titles: List[str] = []
+    country_code: Optional[str] = None
+    description: Optional[str] = None
+    homepage_url: Optional[HttpUrl] = None
+    image_url: Optional[HttpUrl] = None
+    works_count: int
+    cited_by_count: int
+    grants_count: Optional[int] = None
+
 class Grant(BaseModel):
     funder: Optional[str] = None
-    funder_id: Optional[str] = None
+    funder_display_name: Optional[str] = None
+    funder_id: Optional[str] = None  # Older data named the funder here instead of "funder"
     award_id: Optional[str] = None
     award_amount: Optional[float] = None
+    funder_details: Optional[Funder] = None  # Set by OpenAlexService.enrich_funders_data
+
+    @property
+    def funder_key(self) -> Optional[str]:
+        return self.funder or self.funder_id
+
+    @field_serializer("funder_details")
+    def _dump_funder_details(self, details: Optional[Funder]):
+        # Always the full funder record, even when the grant is dumped with exclude_unset
+        return details.model_dump(mode="json") if details is not None else None
 
 class Author(BaseModel):
     author_position: str
@@ -16,32 +39,45 @@ class Author(BaseModel):
 class Work(BaseModel):
     id: str
     doi: Optional[str] = None
-    title: str
+    title: Optional[str] = None
     publication_year: Optional[int] = None
     publication_date: Optional[datetime] = None
-    cited_by_count: int
+    cited_by_count: int = 0
     grants: List[Grant] = []
     authors: List[Author] = []
     abstract: Optional[str] = None
-    keywords: List[str] = []
+    keywords: List[Dict] = []
     primary_location: Optional[Dict] = None
 
-class Funder(BaseModel):
-    id: str
-    display_name: str
-    alternate_titles: List[str] = []
-    country_code: Optional[str] = None
-    description: Optional[str] = None
-    homepage_url: Optional[HttpUrl] = None
-    image_url: Optional[HttpUrl] = None
-    works_count: int
-    cited_by_count: int
-    grants_count: Optional[int] = None
+class WorksMeta(BaseModel):
+    count: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+class WorksPage(BaseModel):
+    """One page of OpenAlex `/works` results, validated in a single pass (see `openalex.decode_works_page`)."""
+    meta: WorksMeta = WorksMeta()
+    results: List[Work] = []
 
 class ProjectDescription(BaseModel):
     description: str
     max_results: int = 50  # Allow customizing result size
 
+class BatchProjectDescriptions(BaseModel):
+    descriptions: List[str]
+    max_results_per_term: int = Field(10, ge=1, le=200)
+
+    @field_validator("descriptions")
+    @classmethod
+    def _no_blank_descriptions(cls, descriptions: List[str]) -> List[str]:
+        blank = [index for index, description in enumerate(descriptions) if not description.strip()]
+        if blank:
+            raise ValueError(f"Descriptions must not be empty (index {', '.join(map(str, blank))})")
+        return descriptions
+
+class SavedReportRequest(BaseModel):
+    description: str
+    max_results_per_term: int = 10  # For the first run; refreshes fetch every new work (up to MAX_SAVED_WORKS per term)
+
 class FundingData(BaseModel):
     funder_name: str
     funder_id: str
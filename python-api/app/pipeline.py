@@ -0,0 +1,577 @@
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import math
+import time
+import traceback
+
+from . import profiling
+from .metrics import metrics
+from .serialization import Encoded
+from .services.funder_stats import compute_funder_stats, format_funder_stats_for_summary, funder_picture_changes
+from .services.keywords import extract_keyphrases, term_overlap
+from .services.saved_reports import FULL_REFRESH_SINCE, MAX_SAVED_WORKS, merge_works
+from .services.term_extractors import LLMTermExtractor, LocalTermExtractor
+
+# Seconds each stage may take before the pipeline moves on with what it has; None disables a budget
+DEFAULT_STAGE_BUDGETS = {
+    "searchTerms": 20.0,
+    "paperSearch": 60.0,
+    "fundingData": 30.0,
+    "summary": 60.0,
+}
+
+# Grant keys replaced by the funder index in the compact report format
+COMPACT_GRANT_DROPPED = {"funder", "funder_id", "funder_display_name", "funder_details"}
+
+# Slack past a stage deadline for calls that honour it themselves to return their partial results
+DEADLINE_GRACE = 1.0
+
+
+# Error event of a report whose search found nothing to report on
+NO_PAPERS_ERROR = "No papers with grants found for the given search terms."
+
+
+class ReportError(Exception):
+    """Raised by `ReportPipeline.run` when the pipeline ends without a report."""
+
+
+class NoPapersError(ReportError):
+    """`ReportError` for a search that found no papers with grants; not an upstream failure."""
+
+    def __init__(self, search_terms: List[str]):
+        super().__init__(NO_PAPERS_ERROR)
+        self.search_terms = search_terms
+
+    def empty_report(self) -> Dict:
+        return {
+            "search_terms": self.search_terms,
+            "funders_data": [],
+            "funder_stats": compute_funder_stats([]),
+            "summary": "No papers with grants were found for this project's search terms.",
+            "partial": [],
+        }
+
+
+def is_final(event: Dict) -> bool:
+    return "summary" in event and "search_terms" in event
+
+
+def compact_report(report: Dict) -> Encoded:
+    """Opt-in compact shape of a final report (`?format=compact`).
+
+    Funders are listed once in a top-level `funders` table (their details, or
+    id and name when unenriched) and each grant in `works` refers to its
+    funder by index there, instead of repeating `funder_details` per grant.
+    """
+    funder_index: Dict[str, int] = {}
+    funders, works = [], []
+    for work in report["funders_data"]:
+        grants = []
+        for grant in work.grants:
+            key = grant.funder_key or grant.funder_display_name or "Unknown Funder"
+            if key not in funder_index:
+                funder_index[key] = len(funders)
+                funders.append(grant.funder_details.model_dump(mode="json") if grant.funder_details else {
+                    "id": grant.funder_key,
+                    "display_name": grant.funder_display_name
+                })
+            compact_grant = grant.model_dump(mode="json", exclude_unset=True, exclude=COMPACT_GRANT_DROPPED)
+            compact_grant["funder"] = funder_index[key]
+            grants.append(compact_grant)
+        works.append({**work.model_dump(mode="json", exclude_unset=True, exclude={"grants"}), "grants": grants})
+
+    compact = Encoded({k: v for k, v in report.items() if k != "funders_data"})
+    compact.update(format="compact", funders=funders, works=works)
+    return compact
+
+
+def format_report(report: Dict, report_format: str = "full") -> Dict:
+    """`report` in the requested format; error entries and progress events pass through."""
+    if report_format == "compact" and "funders_data" in report:
+        return compact_report(report)
+    return report
+
+
+def normalize_term(term: str) -> str:
+    return " ".join(term.lower().split())
+
+
+def earliest(*deadlines: Optional[float]) -> Optional[float]:
+    known = [deadline for deadline in deadlines if deadline is not None]
+    return min(known) if known else None
+
+
+def seconds_left(deadline: Optional[float]) -> Optional[float]:
+    """Timeout for `asyncio.wait_for` until `deadline` (None waits forever)."""
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+def stats_only_summary(funder_stats: Dict) -> str:
+    """Stand-in summary built from the statistics alone, for when the LLM can't deliver one."""
+    return (
+        "The written analysis could not be generated in time. "
+        "Here are the funding statistics for the papers found:\n\n"
+        + format_funder_stats_for_summary(funder_stats)
+    )
+
+
+class ReportPipeline:
+    """Search terms -> paper search -> funder enrichment -> summary.
+
+    `events()` yields the progress payloads streamed to SSE clients, ending in
+    either the final report or an `{"error": ...}` payload; `run()` is the
+    non-streaming mode that only returns the final report.
+    """
+
+    def __init__(self, openai_service, openalex_service, max_terms: int = 3, max_results_per_term: int = 10,
+                 speculative: bool = False, speculative_overlap: float = 0.5, term_extractor=None,
+                 deadline_seconds: Optional[float] = None, stage_budgets: Optional[Dict[str, Optional[float]]] = None):
+        self.openai_service = openai_service
+        self.openalex_service = openalex_service
+        self.term_extractor = term_extractor or LLMTermExtractor(openai_service)
+        self.max_terms = max_terms
+        self.max_results_per_term = max_results_per_term
+        # Crawl a locally extracted keyphrase while the LLM is still producing search terms
+        self.speculative = speculative
+        self.speculative_overlap = speculative_overlap
+        # How long a report's OpenAlex calls may run; crawls and enrichment keep what they have by then
+        self.deadline_seconds = deadline_seconds
+        # Per-stage time budgets (see DEFAULT_STAGE_BUDGETS); the final report lists the stages that ran out
+        self.stage_budgets = {**DEFAULT_STAGE_BUDGETS, **(stage_budgets or {})}
+
+    @classmethod
+    def for_total_results(cls, openai_service, openalex_service, max_results: int, max_terms: int = 3, **options):
+        """Pipeline that spreads a total `max_results` budget across the search terms."""
+        return cls(openai_service, openalex_service, max_terms, max(1, math.ceil(max_results / max_terms)), **options)
+
+    def _deadline(self) -> Optional[float]:
+        return time.monotonic() + self.deadline_seconds if self.deadline_seconds else None
+
+    def _stage_deadline(self, stage: str, start: float) -> Optional[float]:
+        budget = self.stage_budgets.get(stage)
+        return start + budget if budget else None
+
+    def _crawl_deadline(self, deadline: Optional[float], terms_deadline: Optional[float], start: float) -> Optional[float]:
+        """Crawls start while terms are still streaming, so their budget runs on from the terms budget
+        (or from `start`, when the terms stage has no budget)."""
+        return earliest(deadline, self._stage_deadline("paperSearch", terms_deadline or start))
+
+    def _start_speculation(self, description: str, deadline: Optional[float]):
+        """Start crawling the description's top local keyphrase; returns (phrase, task) or None."""
+        keyphrases = extract_keyphrases(description, 1)
+        if not keyphrases:
+            return None
+        print(f"Speculatively searching papers for: {keyphrases[0]}")  # Debug log
+        task = asyncio.create_task(
+            self.openalex_service.search_for_grants([keyphrases[0]], self.max_results_per_term, deadline)
+        )
+        return keyphrases[0], task
+
+    def _claims_speculation(self, speculation, term: str) -> bool:
+        """Whether the speculative crawl can stand in for this search term."""
+        phrase, _ = speculation
+        if term_overlap(phrase, term) >= self.speculative_overlap:
+            print(f"Reusing speculative results for '{phrase}' as term: {term}")  # Debug log
+            return True
+        return False
+
+    async def _reuse_speculation(self, task: asyncio.Task, term: str, deadline: Optional[float]) -> List[Dict]:
+        try:
+            return await task
+        except Exception as e:
+            print(f"Speculative search failed, searching again: {str(e)}")
+            return await self.openalex_service.search_for_grants([term], self.max_results_per_term, deadline)
+
+    async def collect_terms(self, description: str) -> List[str]:
+        return [term async for term in self.term_extractor.stream_terms(description, self.max_terms)]
+
+    async def events(self, description: str) -> AsyncIterator[Dict]:
+        speculation = None
+        searches: Dict[str, asyncio.Task] = {}
+        deadline = self._deadline()
+        partial = []
+        stage = "searchTerms"
+        metrics.inc("pipeline.started")
+        profiling.stage(stage)
+        try:
+            # Start search terms generation
+            print("Starting search terms generation...")  # Debug log
+            yield {"stage": "searchTerms", "status": "started"}
+            terms_started = time.monotonic()
+            terms_deadline = self._stage_deadline("searchTerms", terms_started)
+            crawl_deadline = self._crawl_deadline(deadline, terms_deadline, terms_started)
+            if self.speculative:
+                speculation = self._start_speculation(description, crawl_deadline)
+
+            search_terms = []
+            speculative_term = None
+
+            def start_search(term: str):
+                nonlocal speculative_term
+                search_terms.append(term)
+                if speculation and speculative_term is None and self._claims_speculation(speculation, term):
+                    speculative_term = term
+                    searches[term] = asyncio.create_task(self._reuse_speculation(speculation[1], term, crawl_deadline))
+                else:
+                    searches[term] = asyncio.create_task(
+                        self.openalex_service.search_for_grants([term], self.max_results_per_term, crawl_deadline)
+                    )
+
+            # Each term's paper search starts as soon as the term has streamed in
+            terms = self.term_extractor.stream_terms(description, self.max_terms)
+            try:
+                while True:
+                    try:
+                        term = await asyncio.wait_for(terms.__anext__(), seconds_left(terms_deadline))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        print(f"Search terms budget ran out after {len(search_terms)} terms")
+                        partial.append("searchTerms")
+                        break
+                    start_search(term)
+                    yield {"stage": "searchTerms", "status": "progress", "term": term}
+                print(f"Generated search terms: {search_terms}")
+            except Exception as e:
+                print(f"Error extracting search terms: {str(e)}")
+                print(traceback.format_exc())
+                if not search_terms:
+                    yield {"error": f"Search terms error: {str(e)}"}
+                    return
+                # Keep the terms that made it before the stream broke
+            finally:
+                try:
+                    await terms.aclose()
+                except RuntimeError:
+                    # A repeated cancellation (the client left) cut wait_for short while the stream's
+                    # __anext__ was still running; that cancelled step closes the stream itself
+                    pass
+
+            if not search_terms and "searchTerms" in partial:
+                # Out of time with nothing to show: local keyphrases are instant
+                for term in await LocalTermExtractor().extract(description, self.max_terms):
+                    start_search(term)
+                    yield {"stage": "searchTerms", "status": "progress", "term": term}
+
+            if not search_terms:
+                yield {"error": "Search terms error: no search terms were generated"}
+                return
+
+            if speculation and speculative_term is None:
+                print(f"Discarding speculative search for: {speculation[0]}")  # Debug log
+                speculation[1].cancel()
+
+            completed = {"stage": "searchTerms", "status": "completed", "data": search_terms}
+            if "searchTerms" in partial:
+                completed["partial"] = True
+            yield completed
+
+            # Collect the paper searches in term order
+            stage = "paperSearch"
+            profiling.stage(stage)
+            funders_data = []
+
+            for term in search_terms:
+                print(f"Searching papers for term: {term}")  # Debug log
+                yield {"stage": "paperSearch", "status": "started", "term": term}
+
+                timeout = seconds_left(crawl_deadline)
+                try:
+                    # Crawls stop themselves at the deadline; the grace only guards against one that doesn't
+                    term_papers = await asyncio.wait_for(
+                        searches[term], None if timeout is None else timeout + DEADLINE_GRACE
+                    )
+                    funders_data.extend(term_papers)
+                    print(f"Found {len(term_papers)} papers for term: {term}")  # Debug log
+                except asyncio.TimeoutError:
+                    print(f"Paper search budget ran out for term: {term}")
+                    term_papers = []
+                except Exception as e:
+                    print(f"Error searching papers for term {term}: {str(e)}")
+                    print(traceback.format_exc())
+                    # Continue with other terms instead of raising
+                    yield {"stage": "paperSearch", "status": "error", "term": term, "error": str(e)}
+                    continue
+
+                completed = {"stage": "paperSearch", "status": "completed", "term": term, "count": len(term_papers)}
+                if term == speculative_term:
+                    completed["speculative"] = True
+                if crawl_deadline is not None and time.monotonic() >= crawl_deadline:
+                    completed["partial"] = True
+                    if "paperSearch" not in partial:
+                        partial.append("paperSearch")
+                yield completed
+
+            # If we didn't find any papers with grants, return an empty result
+            if not funders_data:
+                print("No papers with grants found")
+                yield {"error": NO_PAPERS_ERROR}
+                return
+
+            # Compile funding data
+            stage = "fundingData"
+            profiling.stage(stage)
+            print("Starting funding data compilation...")  # Debug log
+            yield {"stage": "fundingData", "status": "started"}
+            enrich_deadline = earliest(deadline, self._stage_deadline("fundingData", time.monotonic()))
+            timeout = seconds_left(enrich_deadline)
+
+            try:
+                enriched_data = await asyncio.wait_for(
+                    self.openalex_service.enrich_funders_data(funders_data, enrich_deadline),
+                    None if timeout is None else timeout + DEADLINE_GRACE
+                )
+            except asyncio.TimeoutError:
+                # Grants whose funder was fetched in time already carry its details; the rest stay as they were
+                print("Funding data budget ran out")
+                enriched_data = funders_data
+            except Exception as e:
+                print(f"Error enriching funders data: {str(e)}")
+                print(traceback.format_exc())
+                # Continue with unenriched data
+                enriched_data = funders_data
+                yield {"stage": "fundingData", "status": "error", "error": str(e)}
+
+            funder_stats = compute_funder_stats(enriched_data)
+            completed = {"stage": "fundingData", "status": "completed"}
+            if enrich_deadline is not None and time.monotonic() >= enrich_deadline:
+                completed["partial"] = True
+                partial.append("fundingData")
+            yield completed
+
+            # Generate summary
+            stage = "summary"
+            profiling.stage(stage)
+            print("Generating summary...")  # Debug log
+            yield {"stage": "summary", "status": "started"}
+
+            try:
+                summary = await asyncio.wait_for(
+                    self.openai_service.generate_summary(description, enriched_data, funder_stats),
+                    self.stage_budgets.get("summary")
+                )
+            except asyncio.TimeoutError:
+                print("Summary budget ran out, sending statistics only")
+                summary = stats_only_summary(funder_stats)
+                partial.append("summary")
+            except Exception as e:
+                print(f"Error generating summary: {str(e)}")
+                print(traceback.format_exc())
+                summary = stats_only_summary(funder_stats)
+                partial.append("summary")
+                yield {"stage": "summary", "status": "error", "error": str(e)}
+
+            completed = {"stage": "summary", "status": "completed"}
+            if "summary" in partial:
+                completed["partial"] = True
+            yield completed
+
+            # Send final results
+            stage = "done"
+            profiling.stage(None)
+            metrics.inc("pipeline.completed")
+            print("Sending final results...")
+            # Encoded: serialized once however many times it is sent
+            yield Encoded({
+                "search_terms": search_terms,
+                "funders_data": enriched_data,
+                "funder_stats": funder_stats,
+                "summary": summary,
+                "partial": partial
+            })
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # The consumer went away (SSE client disconnected); the finally below stops our upstream work
+            if stage != "done":
+                print(f"Report cancelled during {stage}")
+                metrics.inc("pipeline.cancelled", stage=stage)
+            raise
+        except Exception as e:
+            print(f"Error in report pipeline: {str(e)}")
+            print(traceback.format_exc())
+            yield {"error": str(e)}
+        finally:
+            # Nothing outlives the report (or the client that stopped reading it); crawls other
+            # reports are waiting on keep running inside OpenAlexService's single-flight
+            cancelled = 0
+            for task in [*searches.values(), *([speculation[1]] if speculation else [])]:
+                if not task.done():
+                    task.cancel()
+                    cancelled += 1
+            if cancelled:
+                metrics.inc("pipeline.cancelled_tasks", cancelled)
+
+    async def batch(self, descriptions: List[str], llm_concurrency: int = 4, crawl_concurrency: int = 8) -> AsyncIterator[Dict]:
+        """Reports for many descriptions at once, sharing work across the batch.
+
+        Search terms are extracted in parallel (bounded by `llm_concurrency`),
+        every distinct term is crawled once, funder enrichment runs once over
+        all works, and one report per description (tagged with its `index`) is
+        yielded as soon as its summary is ready.
+        """
+        llm_slots = asyncio.Semaphore(llm_concurrency)
+        crawl_slots = asyncio.Semaphore(crawl_concurrency)
+
+        async def bounded(slots: asyncio.Semaphore, coro):
+            async with slots:
+                return await coro
+
+        extracted = await asyncio.gather(
+            *(bounded(llm_slots, self.collect_terms(description)) for description in descriptions),
+            return_exceptions=True
+        )
+        terms_by_index = {}
+        for index, terms in enumerate(extracted):
+            if isinstance(terms, Exception):
+                print(f"Error in extract_search_terms for batch item {index}: {terms}")
+                yield {"index": index, "error": f"Search terms error: {str(terms)}"}
+            else:
+                terms_by_index[index] = terms
+
+        # Overlapping descriptions usually share terms; crawl each one once
+        unique_terms = {}
+        for terms in terms_by_index.values():
+            for term in terms:
+                unique_terms.setdefault(normalize_term(term), term)
+        print(f"Batch of {len(descriptions)} descriptions needs {len(unique_terms)} unique search terms")
+
+        crawled = await asyncio.gather(
+            *(bounded(crawl_slots, self.openalex_service.search_for_grants([term], self.max_results_per_term))
+              for term in unique_terms.values()),
+            return_exceptions=True
+        )
+        papers_by_term = {}
+        for key, papers in zip(unique_terms, crawled):
+            if isinstance(papers, Exception):
+                print(f"Error searching papers for term {unique_terms[key]}: {papers}")
+                papers = []
+            papers_by_term[key] = papers
+
+        # Enrichment updates grants in place, so every report sees the shared result
+        all_papers = [paper for papers in papers_by_term.values() for paper in papers]
+        if all_papers:
+            try:
+                await self.openalex_service.enrich_funders_data(all_papers)
+            except Exception as e:
+                print(f"Error enriching funders data: {str(e)}")
+                print(traceback.format_exc())
+
+        async def report(index: int) -> Dict:
+            search_terms = terms_by_index[index]
+            funders_data = [paper for term in search_terms for paper in papers_by_term[normalize_term(term)]]
+            if not funders_data:
+                return {"index": index, "error": NO_PAPERS_ERROR}
+            funder_stats = compute_funder_stats(funders_data)
+            try:
+                summary = await bounded(llm_slots, self.openai_service.generate_summary(descriptions[index], funders_data, funder_stats))
+            except Exception as e:
+                print(f"Error generating summary for batch item {index}: {str(e)}")
+                summary = "Unable to generate summary due to an error."
+            return Encoded({
+                "index": index,
+                "search_terms": search_terms,
+                "funders_data": funders_data,
+                "funder_stats": funder_stats,
+                "summary": summary
+            })
+
+        tasks = [asyncio.create_task(report(index)) for index in terms_by_index]
+        try:
+            for next_report in asyncio.as_completed(tasks):
+                yield await next_report
+        finally:
+            # A consumer that stops reading (NDJSON client gone) stops the summaries still being written
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def refresh(self, saved: Dict) -> Dict:
+        """Bring a saved report (see `services.saved_reports`) up to date incrementally.
+
+        Only works published (or updated) since the saved report's `last_run` are
+        fetched, for its saved search terms; they are enriched and merged into the
+        saved works and the statistics are recomputed. The summary is only
+        regenerated when the funder picture changed materially
+        (`funder_picture_changes`); otherwise the saved one is kept.
+
+        Each term is searched until OpenAlex has no more new works, up to
+        `MAX_SAVED_WORKS` (more could not be kept anyway). OpenAlex errors are
+        raised. A search cut short by the deadline or by that cap is marked
+        `partial` ("paperSearch"), and the caller should then not move `last_run` on.
+        A full refresh (`last_run` of `FULL_REFRESH_SINCE`) redoes the original
+        search instead: `max_results_per_term` works per term, as in `events`.
+        """
+        deadline = self._deadline()
+        since = saved["last_run"]
+        partial = []
+        metrics.inc("pipeline.refreshes")
+        full = since == FULL_REFRESH_SINCE
+        limit = self.max_results_per_term if full else MAX_SAVED_WORKS
+        works_by_term = await self.openalex_service.search_since(saved["search_terms"], since, limit, deadline)
+        new_works = [work for term_works in works_by_term.values() for work in term_works]
+        capped = [] if full else [term for term, term_works in works_by_term.items() if len(term_works) >= limit]
+        if capped:
+            print(f"Refresh stopped at {MAX_SAVED_WORKS} new works for terms: {capped}")  # Debug log
+        if capped or (deadline is not None and time.monotonic() >= deadline):
+            partial.append("paperSearch")
+        known = {work.id for work in saved["funders_data"]}
+        if new_works:
+            try:
+                await self.openalex_service.enrich_funders_data(new_works, deadline)
+            except Exception as e:
+                print(f"Error enriching funders data: {str(e)}")
+        funders_data = merge_works(saved["funders_data"], new_works)
+        funder_stats = compute_funder_stats(funders_data)
+        changes = funder_picture_changes(saved["funder_stats"], funder_stats)
+
+        summary = saved["summary"]
+        if changes:
+            print(f"Funder picture changed, regenerating summary: {changes}")  # Debug log
+            try:
+                summary = await asyncio.wait_for(
+                    self.openai_service.generate_summary(saved["description"], funders_data, funder_stats),
+                    self.stage_budgets.get("summary")
+                )
+            except Exception as e:
+                # Keep the saved summary rather than none; it describes the funders before this refresh
+                print(f"Error regenerating summary, keeping the saved one: {type(e).__name__}: {e}")
+                partial.append("summary")
+        regenerated = bool(changes) and "summary" not in partial
+        metrics.inc("pipeline.refresh_summaries", regenerated=regenerated)
+
+        return Encoded({
+            "search_terms": saved["search_terms"],
+            "funders_data": funders_data,
+            "funder_stats": funder_stats,
+            "summary": summary,
+            "partial": partial,
+            "refresh": {
+                "since": since,
+                "fetched_works": len(new_works),
+                "new_works": len([work for work in new_works if work.id not in known]),
+                "changes": changes,
+                "summary_regenerated": regenerated,
+            },
+        })
+
+    async def run(self, description: str) -> Dict:
+        """Run the whole pipeline and return the final report (non-streaming JSON mode)."""
+        events = self.events(description)
+        search_terms: List[str] = []
+        searched = False
+        try:
+            async for event in events:
+                if is_final(event):
+                    return event
+                if event.get("stage") == "searchTerms" and event.get("status") == "completed":
+                    search_terms = event["data"]
+                if event.get("stage") == "paperSearch" and event.get("status") == "completed":
+                    searched = True
+                if "error" in event and "stage" not in event:
+                    # No papers is only an empty result if a search actually ran; all searches failing is an error
+                    if event["error"] == NO_PAPERS_ERROR and searched:
+                        raise NoPapersError(search_terms)
+                    raise ReportError(event["error"])
+        finally:
+            await events.aclose()
+        raise ReportError("Report pipeline ended without a result")
@@ -0,0 +1,347 @@
+"""Opt-in profiling of a single report, exported as a speedscope file.
+
+An admin can ask for one `/generate_funding_report` run to be profiled (see
+`dependencies.select_profiling`). While it runs:
+
+- a sampler thread records the event loop thread's Python stack every
+  `interval` seconds, but only while one of the report's own tasks is running,
+  so other requests served meanwhile stay out of the samples
+- tasks created from the report's context are traced (creation to completion)
+- `span()` blocks around upstream calls record how long each await waited, and
+  `stage()` marks the pipeline stages
+
+Which report a task belongs to is carried by a context variable; a task
+factory is installed on the loop only while a profile is running. Finished
+profiles are kept in memory (the last `PROFILES_KEPT`) and served by
+`GET /admin/profiles/{id}` in speedscope's format (https://www.speedscope.app).
+"""
+import asyncio
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+PROFILES_KEPT = 20
+MAX_STACK_DEPTH = 128
+STAGES_LANE = "pipeline stages"
+
+current_profile: ContextVar[Optional["Profile"]] = ContextVar("current_profile", default=None)
+
+
+class Span:
+    __slots__ = ("profile", "lane", "name", "start", "end")
+
+    def __init__(self, profile: "Profile", lane: str, name: str, start: Optional[float] = None):
+        self.profile = profile
+        self.lane = lane
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.end: Optional[float] = None
+
+    def close(self, end: Optional[float] = None):
+        if self.end is None:
+            self.end = time.perf_counter() if end is None else end
+            self.profile.spans.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _NullSpan:
+    def close(self, end: Optional[float] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _task_lane(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "no task"
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', type(coro).__name__)})"
+
+
+class Profile:
+    def __init__(self, name: str, interval: float = 0.005):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.interval = interval
+        self.created = time.time()
+        self.started: Optional[float] = None  # perf_counter()
+        self.finished: Optional[float] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self._task_started: "weakref.WeakKeyDictionary[asyncio.Task, float]" = weakref.WeakKeyDictionary()
+        self.spans: List[Span] = []
+        self._stage: Optional[Span] = None
+        # Stack samples: frame indexes root first, and the seconds each one stands for
+        self.frames: Dict[Tuple[str, str, int], int] = {}
+        self.samples: List[Tuple[int, ...]] = []
+        self.weights: List[float] = []
+
+    def add_task(self, task: asyncio.Task):
+        self.tasks.add(task)
+        self._task_started[task] = time.perf_counter()
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        started = self._task_started.pop(task, None)
+        if started is not None and self.finished is None:
+            Span(self, _task_lane(task), "task", started).close()
+
+    def span(self, name: str) -> Span:
+        return Span(self, _task_lane(asyncio.current_task()), name)
+
+    def stage(self, name: Optional[str]):
+        if self._stage is not None:
+            self._stage.close()
+        self._stage = Span(self, STAGES_LANE, name) if name else None
+
+    def add_sample(self, frame, weight: float):
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+            index = self.frames.get(key)
+            if index is None:
+                index = self.frames[key] = len(self.frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        self.samples.append(tuple(stack))
+        self.weights.append(weight)
+
+    def finish(self):
+        self.stage(None)
+        end = time.perf_counter()
+        # Tasks still running (e.g. cancelled ones winding down) end with the profile
+        for task, started in list(self._task_started.items()):
+            Span(self, _task_lane(task), "task", started).close(end)
+        self._task_started.clear()
+        self.finished = end
+
+    @property
+    def duration(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def waits(self) -> Dict[str, Dict]:
+        """Per span name: how many awaits, and their total and longest wait in seconds."""
+        totals: Dict[str, Dict] = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+        for span in self.spans:
+            if span.lane == STAGES_LANE or span.name == "task":
+                continue
+            waited = span.end - span.start
+            entry = totals[span.name]
+            entry["count"] += 1
+            entry["total"] += waited
+            entry["max"] = max(entry["max"], waited)
+        return {name: {k: round(v, 6) for k, v in entry.items()} for name, entry in totals.items()}
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.created)),
+            "duration": round(self.duration, 6),
+            "running": self.finished is None,
+            "samples": len(self.samples),
+            "stages": {
+                span.name: round(span.end - span.start, 6) for span in self.spans if span.lane == STAGES_LANE
+            },
+            "waits": self.waits(),
+        }
+
+    def speedscope(self) -> Dict:
+        """The profile as a speedscope file: one sampled profile, plus one evented profile per lane."""
+        frames = [{"name": name, "file": file, "line": line} for name, file, line in self.frames]
+        span_frames: Dict[str, int] = {}
+
+        def span_frame(name: str) -> int:
+            if name not in span_frames:
+                span_frames[name] = len(frames)
+                frames.append({"name": name})
+            return span_frames[name]
+
+        end = self.duration
+        profiles = [{
+            "type": "sampled",
+            "name": "CPU samples (event loop thread, this report's tasks)",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": round(end, 6),
+            "samples": [list(stack) for stack in self.samples],
+            "weights": [round(weight, 6) for weight in self.weights],
+        }]
+        lanes: Dict[str, List[Span]] = defaultdict(list)
+        for span in self.spans:
+            lanes[span.lane].append(span)
+        for lane in sorted(lanes, key=lambda lane: (lane != STAGES_LANE, min(s.start for s in lanes[lane]))):
+            profiles.append({
+                "type": "evented",
+                "name": lane,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(end, 6),
+                "events": self._events(lanes[lane], span_frame, end),
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"report {self.id}: {self.name}",
+            "exporter": "plutusai",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def _events(self, spans: List[Span], span_frame, end: float) -> List[Dict]:
+        """Open/close events for one lane, nested the way speedscope requires (children clipped to parents)."""
+        events = []
+        open_spans: List[Tuple[int, float]] = []  # (frame, clipped end), innermost last
+
+        def close_until(at: float):
+            while open_spans and open_spans[-1][1] <= at:
+                frame, closed_at = open_spans.pop()
+                events.append({"type": "C", "frame": frame, "at": round(closed_at, 6)})
+
+        for span in sorted(spans, key=lambda s: (s.start, -s.end)):
+            start = max(span.start - self.started, 0.0)
+            stop = min(span.end - self.started, end)
+            close_until(start)
+            if open_spans:
+                stop = min(stop, open_spans[-1][1])
+            frame = span_frame(span.name)
+            events.append({"type": "O", "frame": frame, "at": round(start, 6)})
+            open_spans.append((frame, max(stop, start)))
+        close_until(float("inf"))
+        return events
+
+
+class Profiler:
+    """Runs the sampler thread and the task factory while any profile is active; keeps finished profiles."""
+
+    def __init__(self, keep: int = PROFILES_KEPT):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._active: List[Profile] = []
+        self._finished: "OrderedDict[str, Profile]" = OrderedDict()
+        self._sampler: Optional[threading.Thread] = None
+        self._previous_factory = None
+        self._factory = self._task_factory
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            for profile in self._active:
+                if profile.id == profile_id:
+                    return profile
+            return self._finished.get(profile_id)
+
+    def profiles(self) -> List[Profile]:
+        """Running profiles, then finished ones, newest first."""
+        with self._lock:
+            return list(self._active) + list(reversed(self._finished.values()))
+
+    @contextmanager
+    def activate(self, profile: Profile):
+        """Profile the current task, and every task created from it, until the block exits."""
+        loop = asyncio.get_running_loop()
+        profile.loop = loop
+        profile.thread_id = threading.get_ident()
+        profile.started = time.perf_counter()
+        token = current_profile.set(profile)
+        task = asyncio.current_task()
+        if task is not None:
+            profile.add_task(task)
+        if loop.get_task_factory() is not self._factory:
+            self._previous_factory = loop.get_task_factory()
+            loop.set_task_factory(self._factory)
+        with self._lock:
+            self._active.append(profile)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._sampler.start()
+        try:
+            yield profile
+        finally:
+            profile.finish()
+            try:
+                current_profile.reset(token)
+            except ValueError:
+                # Closed from another context (e.g. a generator finalized elsewhere)
+                pass
+            with self._lock:
+                self._active.remove(profile)
+                self._finished[profile.id] = profile
+                while len(self._finished) > self.keep:
+                    self._finished.popitem(last=False)
+                idle = not any(active.loop is loop for active in self._active)
+            if idle and loop.get_task_factory() is self._factory:
+                loop.set_task_factory(self._previous_factory)
+                self._previous_factory = None
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        profile = current_profile.get()
+        if profile is not None and profile.finished is None:
+            profile.add_task(task)
+        return task
+
+    def _sample(self):
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    self._sampler = None
+                    return
+            time.sleep(min(profile.interval for profile in active))
+            now = time.perf_counter()
+            weight, last = now - last, now
+            frames = sys._current_frames()
+            for profile in active:
+                task = asyncio.current_task(profile.loop)
+                frame = frames.get(profile.thread_id)
+                # Only this report's tasks count; the second check drops samples taken across a task switch
+                if task is None or frame is None or task not in profile.tasks:
+                    continue
+                if asyncio.current_task(profile.loop) is task:
+                    profile.add_sample(frame, weight)
+            del frames
+
+
+profiler = Profiler()
+
+
+def span(name: str):
+    """`with span("openalex.works"):` around an await records its wait time in the current profile, if any."""
+    profile = current_profile.get()
+    if profile is None:
+        return NULL_SPAN
+    return profile.span(name)
+
+
+def stage(name: Optional[str]):
+    """Marks the start of a pipeline stage (None ends the last one) in the current profile, if any."""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.stage(name)
@@ -0,0 +1,155 @@
+"""One serialization path for SSE events, NDJSON lines and JSON responses.
+
+Payloads are encoded with orjson straight to bytes, and SSE frames are built
+from those bytes (no str round-trip through sse-starlette). Constant progress
+events (`{"stage": ..., "status": ...}`) are encoded once per process, and an
+`Encoded` payload remembers its bytes, so a report sent to several listeners
+or kept for replay is only serialized once. Mutating an `Encoded` payload
+after its first encoding is not picked up.
+
+Pydantic models (the OpenAlex `Work`/`Grant`/`Funder` records a report carries)
+are written with the fields they were given, so a work keeps its source shape.
+
+Streams can also be compressed (gzip, or brotli when the `brotli` package is
+installed) as negotiated from Accept-Encoding; see `CompressedResponse`.
+"""
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+try:
+    import brotli
+except ImportError:  # Optional: without it streams are only offered gzip
+    brotli = None
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_unset=True)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(payload: Any) -> bytes:
+    return orjson.dumps(payload, default=_default, option=OPTIONS)
+
+
+class Encoded(dict):
+    """A payload dict that caches its JSON encoding."""
+    _json: Optional[bytes] = None
+
+
+def to_json(payload: Any) -> bytes:
+    if isinstance(payload, Encoded):
+        if payload._json is None:
+            payload._json = dumps(payload)
+        return payload._json
+    return dumps(payload)
+
+
+def sse_frame(data: bytes, event: str = "message") -> bytes:
+    # orjson escapes newlines inside strings, so the payload always fits on one data line
+    return b"event: " + event.encode() + b"\r\ndata: " + data + b"\r\n\r\n"
+
+
+@lru_cache(maxsize=None)
+def _progress_frame(stage: str, status: str) -> bytes:
+    return sse_frame(dumps({"stage": stage, "status": status}))
+
+
+def event_frame(event: Dict) -> bytes:
+    """The SSE frame for a pipeline event; bare stage/status events come pre-encoded."""
+    if len(event) == 2 and "stage" in event and "status" in event:
+        return _progress_frame(event["stage"], event["status"])
+    return sse_frame(to_json(event))
+
+
+def ndjson_line(payload: Any) -> bytes:
+    return to_json(payload) + b"\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (and an `Encoded` payload's cached bytes).
+
+    Return it directly from a route to skip FastAPI's `jsonable_encoder` pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best stream encoding the client accepts: "br" (if available), "gzip", or None."""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _GzipStream:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes, last: bool) -> bytes:
+        # A sync flush after every message, so each event reaches the client as soon as it is sent
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliStream:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def chunk(self, data: bytes, last: bool) -> bytes:
+        return self._compressor.process(data) + (self._compressor.finish() if last else self._compressor.flush())
+
+
+class CompressedResponse(Response):
+    """Wraps a streaming response and compresses every body message it sends.
+
+    Compression happens in the ASGI `send` call, which sse-starlette makes
+    under its send lock for data frames and keep-alive pings alike, so both go
+    through the one compressor in the order they reach the client.
+    """
+
+    def __init__(self, response: Response, encoding: str):
+        self.response = response
+        self.encoding = encoding
+        self.background = None
+        response.headers["content-encoding"] = encoding
+        response.headers["vary"] = "Accept-Encoding"
+
+    async def __call__(self, scope, receive, send):
+        stream = _BrotliStream() if self.encoding == "br" else _GzipStream()
+
+        async def compressed_send(message):
+            if message["type"] == "http.response.body":
+                last = not message.get("more_body", False)
+                message = {**message, "body": stream.chunk(message.get("body", b""), last)}
+            await send(message)
+
+        await self.response(scope, receive, compressed_send)
+        if self.background is not None:
+            await self.background()
+
+
+def maybe_compressed(response: Response, accept_encoding: Optional[str], enabled: bool = True) -> Response:
+    encoding = negotiate_encoding(accept_encoding) if enabled else None
+    return CompressedResponse(response, encoding) if encoding else response
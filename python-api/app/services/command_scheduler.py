@@ -0,0 +1,160 @@
+"""Fair scheduling of the Discord bot's commands.
+
+- per channel: one command at a time, in arrival order, so a `!search` and the
+  `!ask` after it never race on the channel's search context; a new `!search`
+  supersedes (cancels) the channel's queued or running search
+- per guild: at most `guild_limit` commands running at once
+- overall: at most `max_concurrent` commands running; a free slot goes to the
+  next guild in round-robin order, so one busy guild cannot starve the others
+"""
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from ..metrics import metrics
+
+
+class Job:
+    def __init__(self, guild_id: Hashable, channel_id: Hashable, kind: str, call: Callable[[], Awaitable]):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.kind = kind
+        self.call = call
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+        self.superseded = False
+        self.enqueued = time.monotonic()
+
+
+class CommandScheduler:
+    def __init__(self, max_concurrent: int = 4, guild_limit: int = 2):
+        self.max_concurrent = max_concurrent
+        self.guild_limit = guild_limit
+        self._queues: Dict[Hashable, Deque[Job]] = {}  # Waiting jobs per guild, FIFO
+        self._rotation: Deque[Hashable] = deque()  # Guilds with waiting jobs, in round-robin order
+        self._running: Dict[Hashable, int] = defaultdict(int)  # Running jobs per guild
+        self._busy_channels: Dict[Hashable, Job] = {}
+
+    @property
+    def running(self) -> int:
+        return len(self._busy_channels)
+
+    def submit(self, guild_id: Hashable, channel_id: Hashable, kind: str,
+               call: Callable[[], Awaitable], supersede: bool = False) -> Job:
+        """Queue `call()`; with `supersede`, the channel's earlier jobs of this kind are cancelled."""
+        if supersede:
+            self._supersede(channel_id, kind)
+        job = Job(guild_id, channel_id, kind, call)
+        if guild_id not in self._queues:
+            self._queues[guild_id] = deque()
+            self._rotation.append(guild_id)
+        self._queues[guild_id].append(job)
+        self._pump()
+        if job.task is None:
+            metrics.inc("discord.commands_queued", kind=kind)
+        return job
+
+    def position(self, job: Job) -> int:
+        """1-based place of a waiting job in the round-robin start order (0 once it runs).
+
+        Limits are ignored, so this is an estimate: a job behind a busy guild or
+        channel may be overtaken.
+        """
+        if job.task is not None:
+            return 0
+        queues = [list(self._queues[guild]) for guild in self._rotation]
+        order: List[Job] = []
+        for depth in range(max((len(queue) for queue in queues), default=0)):
+            order.extend(queue[depth] for queue in queues if depth < len(queue))
+        return order.index(job) + 1 if job in order else 0
+
+    def cancel(self, job: Job):
+        if job.task is not None:
+            job.task.cancel()
+            return
+        queue = self._queues.get(job.guild_id)
+        if queue is not None and job in queue:
+            queue.remove(job)
+            self._drop_if_empty(job.guild_id)
+        job.future.cancel()
+
+    async def run(self, guild_id: Hashable, channel_id: Hashable, kind: str, call: Callable[[], Awaitable],
+                  supersede: bool = False, on_queued: Optional[Callable[[int], Awaitable]] = None) -> bool:
+        """Submit and wait for `call()`. False if a newer command superseded it."""
+        job = self.submit(guild_id, channel_id, kind, call, supersede)
+        try:
+            if on_queued is not None and job.task is None:
+                await on_queued(self.position(job))
+            await job.future
+            return True
+        except asyncio.CancelledError:
+            if job.superseded:
+                return False
+            # Our caller went away: don't leave its work queued or running
+            self.cancel(job)
+            raise
+
+    def _supersede(self, channel_id: Hashable, kind: str):
+        for guild_id, queue in list(self._queues.items()):
+            for job in [job for job in queue if job.channel_id == channel_id and job.kind == kind]:
+                queue.remove(job)
+                job.superseded = True
+                job.future.cancel()
+                metrics.inc("discord.commands_superseded", kind=kind, state="queued")
+            self._drop_if_empty(guild_id)
+        running = self._busy_channels.get(channel_id)
+        if running is not None and running.kind == kind and not running.superseded:
+            running.superseded = True
+            running.task.cancel()
+            metrics.inc("discord.commands_superseded", kind=kind, state="running")
+
+    def _drop_if_empty(self, guild_id: Hashable):
+        if guild_id in self._queues and not self._queues[guild_id]:
+            del self._queues[guild_id]
+            self._rotation.remove(guild_id)
+
+    def _next_job(self) -> Optional[Job]:
+        for _ in range(len(self._rotation)):
+            guild_id = self._rotation[0]
+            self._rotation.rotate(-1)
+            if self._running[guild_id] >= self.guild_limit:
+                continue
+            queue = self._queues[guild_id]
+            for job in queue:
+                # A busy channel holds back all of its jobs, keeping them in order
+                if job.channel_id not in self._busy_channels:
+                    queue.remove(job)
+                    self._drop_if_empty(guild_id)
+                    return job
+        return None
+
+    def _pump(self):
+        while self.running < self.max_concurrent:
+            job = self._next_job()
+            if job is None:
+                return
+            self._running[job.guild_id] += 1
+            self._busy_channels[job.channel_id] = job
+            job.task = asyncio.create_task(self._run(job))
+            # A done callback rather than a finally: a task cancelled before its first step never runs `_run`
+            job.task.add_done_callback(lambda _, job=job: self._finish(job))
+
+    async def _run(self, job: Job):
+        metrics.observe("discord.queue_wait_seconds", time.monotonic() - job.enqueued, kind=job.kind)
+        try:
+            result = await job.call()
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+
+    def _finish(self, job: Job):
+        if not job.future.done():
+            job.future.cancel()
+        self._running[job.guild_id] -= 1
+        if not self._running[job.guild_id]:
+            del self._running[job.guild_id]
+        del self._busy_channels[job.channel_id]
+        self._pump()
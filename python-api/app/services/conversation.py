@@ -0,0 +1,79 @@
+"""Per-channel `!ask` conversation memory with rolling compaction.
+
+Only the last exchange is kept verbatim. After each answer, the exchanges
+before it are folded into a short running summary by a background LLM call,
+so the follow-up prompt carries the summary plus one exchange however long
+the conversation gets, and the answer is never waiting on the compaction.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..metrics import metrics
+
+# Exchanges kept verbatim next to the summary (a question and its answer each)
+RECENT_EXCHANGES = 1
+# Unfolded exchanges kept if compaction keeps failing; older ones are dropped
+MAX_PENDING_EXCHANGES = 4
+
+
+class Conversation:
+    def __init__(self):
+        self.summary = ""
+        self.messages: List[dict] = []  # Not yet folded into the summary, oldest first
+        self.last_active = time.monotonic()
+        self.compaction: Optional[asyncio.Task] = None
+
+
+class ConversationMemory:
+    """`compact(summary, messages)` returns the summary with `messages` folded in."""
+
+    def __init__(self, compact: Callable[[str, List[dict]], Awaitable[str]], idle_timeout: float = 1800):
+        self.compact = compact
+        self.idle_timeout = idle_timeout
+        self._conversations: Dict[str, Conversation] = {}
+
+    def context(self, channel_id: str) -> Tuple[str, List[dict]]:
+        """The running summary and the verbatim recent messages for the next prompt."""
+        conversation = self._conversations.get(channel_id)
+        if conversation is None:
+            return "", []
+        if time.monotonic() - conversation.last_active > self.idle_timeout:
+            # Start fresh after a long pause
+            self.forget(channel_id)
+            return "", []
+        # While a compaction is in flight the exchange it is folding is still here
+        return conversation.summary, list(conversation.messages)
+
+    def record(self, channel_id: str, question: str, answer: str):
+        """Add an exchange and fold everything before it into the summary in the background."""
+        conversation = self._conversations.setdefault(channel_id, Conversation())
+        conversation.messages += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+        conversation.last_active = time.monotonic()
+        dropped = len(conversation.messages) - 2 * MAX_PENDING_EXCHANGES
+        if dropped > 0:
+            conversation.messages = conversation.messages[dropped:]
+            metrics.inc("conversation.dropped_messages", dropped)
+        if conversation.compaction is None or conversation.compaction.done():
+            conversation.compaction = asyncio.create_task(self._compact(conversation))
+
+    def forget(self, channel_id: str):
+        conversation = self._conversations.pop(channel_id, None)
+        if conversation is not None and conversation.compaction is not None:
+            conversation.compaction.cancel()
+
+    async def _compact(self, conversation: Conversation):
+        # Exchanges recorded meanwhile are picked up by the next round
+        while len(conversation.messages) > 2 * RECENT_EXCHANGES:
+            folding = conversation.messages[:-2 * RECENT_EXCHANGES]
+            start = time.perf_counter()
+            try:
+                summary = await self.compact(conversation.summary, folding)
+            except Exception as e:
+                print(f"Conversation compaction failed, keeping the messages verbatim: {e}")
+                metrics.inc("conversation.compaction_failures")
+                return
+            metrics.observe("conversation.compaction_seconds", time.perf_counter() - start)
+            conversation.summary = summary
+            # Only appends (and drops from the front) happen meanwhile; remove what was folded
+            conversation.messages = [m for m in conversation.messages if not any(m is f for f in folding)]
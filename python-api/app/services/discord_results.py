@@ -0,0 +1,157 @@
+"""`!search` results as one paginated embed instead of a message per line.
+
+The papers are grouped and sorted once when the search finishes; a page (or
+its detailed variant) is only formatted when someone asks for it with the
+view's buttons.
+"""
+from typing import Dict, List, Optional
+
+import discord
+
+from ..models import Work
+
+PAPERS_PER_PAGE = 5
+MAX_FUNDERS_SHOWN = 4
+EMBED_COLOR = 0x2B6CB0
+
+
+def collect_papers(enriched_data: List[Work]) -> List[Dict]:
+    """Unique papers with their named funders, newest and most cited first."""
+    papers_data = {}  # title -> {paper_info, funders: []}
+    for item in enriched_data:
+        title = item.title or ''
+        if title in papers_data:
+            continue
+
+        paper_info = {
+            'title': title,
+            'year': item.publication_year or '',
+            'citations': item.cited_by_count,
+            'doi': item.doi or '',
+            'id': item.id,
+            'abstract': item.abstract or '',
+            'funders': []
+        }
+
+        # Collect all funders for this paper
+        for grant in item.grants:
+            funder_name = grant.funder_display_name or ''
+            if funder_name and funder_name not in ['Unknown Funder', 'N/A']:
+                funder_info = {
+                    'name': funder_name,
+                    'grant_id': grant.award_id or ''
+                }
+                if funder_info not in paper_info['funders']:
+                    paper_info['funders'].append(funder_info)
+
+        if paper_info['funders']:  # Only add papers that have funders
+            papers_data[title] = paper_info
+
+    return sorted(papers_data.values(), key=lambda x: (x['year'] or 0, x['citations'] or 0), reverse=True)
+
+
+def paper_link(paper: Dict) -> Optional[str]:
+    # OpenAlex already returns DOIs and ids as URLs, but older results may hold bare ones
+    if paper['doi']:
+        return paper['doi'] if paper['doi'].startswith('http') else f"https://doi.org/{paper['doi']}"
+    if paper['id']:
+        return paper['id'] if paper['id'].startswith('http') else f"https://openalex.org/{paper['id']}"
+    return None
+
+
+def clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _stats_line(paper: Dict) -> str:
+    stats = []
+    if paper['year']:
+        stats.append(f"Year: {paper['year']}")
+    if paper['citations']:
+        stats.append(f"Citations: {paper['citations']}")
+    return "   ".join(stats)
+
+
+def _funder_lines(paper: Dict, limit: Optional[int], with_grants: bool) -> List[str]:
+    if with_grants:
+        entries = [
+            f"{funder['name']} (Grant ID: {funder['grant_id']})" if funder['grant_id'] else funder['name']
+            for funder in paper['funders']
+        ]
+    else:
+        # Without grant IDs a funder with several grants is one line
+        entries = list(dict.fromkeys(funder['name'] for funder in paper['funders']))
+    shown = entries if limit is None else entries[:limit]
+    lines = [f"• {entry}" for entry in shown]
+    if len(entries) > len(shown):
+        lines.append(f"• …and {len(entries) - len(shown)} more")
+    return lines
+
+
+def page_count(papers: List[Dict]) -> int:
+    return max((len(papers) + PAPERS_PER_PAGE - 1) // PAPERS_PER_PAGE, 1)
+
+
+def results_embed(papers: List[Dict], page: int, details: bool = False) -> discord.Embed:
+    """Embed for one page of papers; `details` adds grant IDs, every funder and the abstract."""
+    pages = page_count(papers)
+    embed = discord.Embed(title="📊 Recent Funding Examples", color=EMBED_COLOR)
+    for paper in papers[page * PAPERS_PER_PAGE:(page + 1) * PAPERS_PER_PAGE]:
+        lines = [_stats_line(paper)] if _stats_line(paper) else []
+        lines += _funder_lines(paper, None if details else MAX_FUNDERS_SHOWN, with_grants=details)
+        if details and paper['abstract']:
+            lines.append(f"> {clip(paper['abstract'], 300)}")
+        link = paper_link(paper)
+        if link:
+            lines.append(f"[View Publication →]({link})")
+        # Discord caps a field at 256/1024 characters and a whole embed at 6000
+        embed.add_field(name=clip(paper['title'] or "Untitled", 200), value=clip("\n".join(lines), 900), inline=False)
+    embed.set_footer(text=f"Page {page + 1}/{pages} · {len(papers)} papers" + (" · details" if details else ""))
+    return embed
+
+
+class ResultsView(discord.ui.View):
+    """Prev / Next / Details buttons over a search's papers."""
+
+    def __init__(self, papers: List[Dict], timeout: float = 900):
+        super().__init__(timeout=timeout)
+        self.papers = papers
+        self.page = 0
+        self.details = False
+        self.message: Optional[discord.Message] = None
+        self._update_buttons()
+
+    def embed(self) -> discord.Embed:
+        return results_embed(self.papers, self.page, self.details)
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= page_count(self.papers) - 1
+        self.toggle_details.label = "Summary" if self.details else "Details"
+
+    async def _show(self, interaction: discord.Interaction):
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await self._show(interaction)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(self.page + 1, page_count(self.papers) - 1)
+        await self._show(interaction)
+
+    @discord.ui.button(label="Details", style=discord.ButtonStyle.primary)
+    async def toggle_details(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.details = not self.details
+        await self._show(interaction)
+
+    async def on_timeout(self):
+        # Leave the last page readable, just without buttons that no longer respond
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
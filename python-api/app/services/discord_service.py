@@ -1,9 +1,14 @@
 import discord
 from discord.ext import commands
-from ..config import settings
-from ..services.openai_service import openai_service
-from ..services.openalex import openalex_service
+from ..config import get_settings
+from ..dependencies import get_openai_service, get_openalex_service, get_term_extractor
+from .command_scheduler import CommandScheduler
+from .conversation import ConversationMemory
+from .discord_results import ResultsView, collect_papers
+from .discord_stream import ProgressiveMessage
+from .funder_stats import compute_funder_stats
 import asyncio
+import functools
 from typing import Optional, Callable
 import logging
 import sys
@@ -35,18 +40,53 @@ class DiscordBot(commands.Bot):
         super().__init__(
             command_prefix="!",
             intents=intents,
-            application_id=settings.discord_client_id
+            application_id=get_settings().discord_client_id
         )
         
         # Store search context per channel instead of globally
         self.search_contexts = {}
-        self.conversation_history = {}
         self.paper_details = {}
-        self.last_active = {}
+        # !ask history per channel, compacted into a running summary (a new conversation after 30 idle minutes)
+        self.conversations = ConversationMemory(
+            lambda summary, messages: get_openai_service().compact_conversation(summary, messages),
+            idle_timeout=1800
+        )
         self.api_url = API_URL
+        settings = get_settings()
+        self.scheduler = CommandScheduler(
+            max_concurrent=settings.discord_max_concurrent_commands,
+            guild_limit=settings.discord_guild_concurrency
+        )
+
+    def scheduled(self, kind: str, supersede: bool = False):
+        """Run a command through the scheduler: in order per channel, fairly across guilds."""
+        def decorator(command):
+            @functools.wraps(command)
+            async def wrapper(ctx, *args, **kwargs):
+                channel_id = str(ctx.channel.id)
+                guild_id = str(ctx.guild.id) if ctx.guild else f"dm-{channel_id}"
+
+                async def on_queued(position):
+                    await ctx.send(f"⏳ Busy right now, your `!{kind}` is #{position} in the queue")
+
+                # A bare `!search` is only a usage error and must not cancel the running one
+                has_input = any(arg is not None for arg in (*args, *kwargs.values()))
+                completed = await self.scheduler.run(
+                    guild_id, channel_id, kind, lambda: command(ctx, *args, **kwargs),
+                    supersede=supersede and has_input, on_queued=on_queued
+                )
+                if not completed:
+                    await ctx.send(f"⏹️ Stopped this `!{kind}`, a newer one in this channel replaces it")
+            return wrapper
+        return decorator
 
     async def setup_hook(self):
         logger.info(f"Bot is setting up... API URL: {self.api_url}")
+
+        # Build the services (importing their client libraries) off the event loop;
+        # built lazily inside the first command, they blocked it for over a second
+        await asyncio.to_thread(get_term_extractor, get_settings().term_extractor)
+        await asyncio.to_thread(get_openalex_service)
         
         # Remove default help command
         self.remove_command('help')
@@ -58,6 +98,7 @@ class DiscordBot(commands.Bot):
             await ctx.send(f"👋 Hello {ctx.author.name}! I'm a research funding expert. Use `!help` to see what I can do!")
 
         @self.command(name="ask")
+        @self.scheduled("ask")
         async def ask(ctx, *, question: str = None):
             """Ask a follow-up question about the previous search results or specific papers"""
             if question is None:
@@ -71,46 +112,40 @@ class DiscordBot(commands.Bot):
 
             try:
                 context = self.search_contexts[channel_id]
-                
-                # Initialize conversation history if it doesn't exist
-                if channel_id not in self.conversation_history:
-                    self.conversation_history[channel_id] = []
-                
-                # Check if this is a new conversation (more than 30 minutes since last message)
-                current_time = asyncio.get_event_loop().time()
-                if channel_id in self.last_active and current_time - self.last_active[channel_id] > 1800:  # 30 minutes
-                    self.conversation_history[channel_id] = []  # Start fresh conversation
-                
-                # Update last active timestamp
-                self.last_active[channel_id] = current_time
-                
-                # Add the current question to conversation history
-                self.conversation_history[channel_id].append({
-                    "role": "user",
-                    "content": question
-                })
-
-                await ctx.send("🤔 Analyzing your question...")
+                conversation_summary, conversation_history = self.conversations.context(channel_id)
+
+                thinking = await ctx.send("🤔 Analyzing your question...")
+
+                if get_settings().discord_stream_answers:
+                    # Edit the answer into place as it is written instead of waiting for all of it
+                    output = ProgressiveMessage(ctx, thinking, min_interval=get_settings().discord_stream_edit_interval)
+                    answer = ""
+                    async for delta in get_openai_service().stream_answer(
+                        question=question,
+                        search_description=context["description"],
+                        funders_data=context["funders_data"],
+                        conversation_history=conversation_history,
+                        paper_details=self.paper_details.get(channel_id, {}),
+                        conversation_summary=conversation_summary
+                    ):
+                        answer += delta
+                        await output.append(delta)
+                    await output.push()
+                    self.conversations.record(channel_id, question, answer)
+                    return
                 
                 # Get answer from OpenAI
-                answer = await openai_service.answer_question(
+                answer = await get_openai_service().answer_question(
                     question=question,
                     search_description=context["description"],
                     funders_data=context["funders_data"],
                     enriched_data=context["enriched_data"],
-                    conversation_history=self.conversation_history[channel_id],
-                    paper_details=self.paper_details.get(channel_id, {})
+                    conversation_history=conversation_history,
+                    paper_details=self.paper_details.get(channel_id, {}),
+                    conversation_summary=conversation_summary
                 )
                 
-                # Add the answer to conversation history
-                self.conversation_history[channel_id].append({
-                    "role": "assistant",
-                    "content": answer
-                })
-                
-                # Keep conversation history to last 10 exchanges (20 messages)
-                if len(self.conversation_history[channel_id]) > 20:
-                    self.conversation_history[channel_id] = self.conversation_history[channel_id][-20:]
+                self.conversations.record(channel_id, question, answer)
 
                 # Send the answer with improved formatting
                 await ctx.send("━━━━━━━━━━━━━━━━━━━━━━━\n🔍 **Analysis Results** ✨\n━━━━━━━━━━━━━━━━━━━━━━━")
@@ -158,6 +193,7 @@ class DiscordBot(commands.Bot):
                 await ctx.send(f"❌ An error occurred while processing your question: {str(e)}")
 
         @self.command(name="search")
+        @self.scheduled("search", supersede=True)
         async def search(ctx, *, description: str = None):
             """Search for funding opportunities with a project description"""
             if description is None:
@@ -173,8 +209,7 @@ class DiscordBot(commands.Bot):
 
                 # Generate search terms
                 await ctx.send("⚙️ Generating search terms...")
-                search_terms = await openai_service.extract_search_terms(description)
-                search_terms = search_terms[:3]
+                search_terms = await get_term_extractor(get_settings().term_extractor).extract(description, 3)
                 terms_msg = "🎯 **Search Terms**\n" + "\n".join([f"• {term}" for term in search_terms])
                 await ctx.send(terms_msg)
 
@@ -183,14 +218,14 @@ class DiscordBot(commands.Bot):
                 funders_data = []
                 for term in search_terms:
                     await ctx.send(f"📚 Searching papers for: {term}")
-                    term_papers = await openalex_service.search_for_grants([term], 5)
+                    term_papers = await get_openalex_service().search_for_grants([term], 5)
                     funders_data.extend(term_papers)
                     papers_found += len(term_papers)
                     await ctx.send(f"Found {len(term_papers)} papers for '{term}'")
 
                 # Compile funding data
                 await ctx.send("🔄 Compiling funding data...")
-                enriched_data = await openalex_service.enrich_funders_data(funders_data)
+                enriched_data = await get_openalex_service().enrich_funders_data(funders_data)
 
                 # Store the context for this channel
                 self.search_contexts[channel_id] = {
@@ -202,7 +237,9 @@ class DiscordBot(commands.Bot):
 
                 # Generate summary
                 await ctx.send("📝 Generating summary...")
-                summary = await openai_service.generate_summary(description, enriched_data)
+                summary = await get_openai_service().generate_summary(
+                    description, enriched_data, compute_funder_stats(enriched_data)
+                )
 
                 # First display search terms
                 await ctx.send("━━━━━━━━━━━━━━━━━━━━━━━\n🔍 **Search Terms** ✨\n━━━━━━━━━━━━━━━━━━━━━━━")
@@ -251,110 +288,33 @@ class DiscordBot(commands.Bot):
                     await ctx.send('\n'.join(section_content))
                     await asyncio.sleep(0.5)
 
-                # Send funding sources section
+                # Send funding sources as one paginated embed; pages are formatted when requested
                 if enriched_data:
-                    await ctx.send("\n━━━━━━━━━━━━━━━━━━━━━━━\n📊 **Recent Funding Examples** ✨\n━━━━━━━━━━━━━━━━━━━━━━━\n")
-                    
-                    # Track unique papers and their funders
-                    papers_data = {}  # title -> {paper_info, funders: []}
-                    
-                    # First pass: Group papers and their funders
-                    for item in enriched_data:
-                        title = item.get('title', '')
-                        if title in papers_data:
-                            continue
-                            
-                        paper_info = {
-                            'title': title,
-                            'year': item.get('publication_year', ''),
-                            'citations': item.get('cited_by_count', 0),
-                            'doi': item.get('doi', ''),
-                            'id': item.get('id', ''),
-                            'funders': []
-                        }
-                        
-                        # Collect all funders for this paper
-                        for grant in item.get('grants', []):
-                            funder_name = grant.get('funder_display_name', '')
-                            if funder_name and funder_name not in ['Unknown Funder', 'N/A']:
-                                grant_id = grant.get('award_id', '')
-                                funder_info = {
-                                    'name': funder_name,
-                                    'grant_id': grant_id
-                                }
-                                if funder_info not in paper_info['funders']:
-                                    paper_info['funders'].append(funder_info)
-                        
-                        if paper_info['funders']:  # Only add papers that have funders
-                            papers_data[title] = paper_info
-                    
-                    # Sort papers by year and citations
-                    sorted_papers = sorted(
-                        papers_data.values(),
-                        key=lambda x: (x['year'], x['citations']),
-                        reverse=True
-                    )
-                    
-                    # Display papers with their funders
-                    papers_shown = 0
-                    for paper in sorted_papers:
-                        if papers_shown >= 15:  # Show top 4 papers
-                            break
-                            
-                        # Paper title as main header (bold)
-                        await ctx.send(f"**{paper['title']}**")
-                        
-                        # Year and citations on same line
-                        stats = []
-                        if paper['year']:
-                            stats.append(f"Year: {paper['year']}")
-                        if paper['citations']:
-                            stats.append(f"Citations: {paper['citations']}")
-                        if stats:
-                            await ctx.send("   ".join(stats))
-                        
-                        # List funders
-                        founders_shown = 0
-                        for funder in paper['funders']:
-                            if founders_shown >= 4:
-                                break
-                            founders_shown += 1
-                            funder_line = funder['name']
-                            if funder['grant_id']:
-                                funder_line += f"\nGrant ID: {funder['grant_id']}"
-                            await ctx.send(f"• {funder_line}")
-                        
-                        # Add paper link as a separate line
-                        if paper['doi']:
-                            await ctx.send(f"[View Publication →](https://doi.org/{paper['doi']})")
-                        elif paper['id']:
-                            await ctx.send(f"[View Publication →](https://openalex.org/{paper['id']})")
-                        
-                        # Add blank line between papers
-                        if papers_shown < 10:  # Don't add blank line after last paper
-                            await ctx.send("``` ```")
-                        papers_shown += 1
+                    papers = collect_papers(enriched_data)
+                    if papers:
+                        view = ResultsView(papers)
+                        view.message = await ctx.send(embed=view.embed(), view=view)
 
                 # Store paper details for quick reference
                 paper_details = {}
                 for item in enriched_data:
-                    title = item.get('title', '')
+                    title = item.title
                     if title:
                         paper_details[title] = {
                             'title': title,
-                            'year': item.get('publication_year', ''),
-                            'citations': item.get('cited_by_count', 0),
-                            'doi': item.get('doi', ''),
-                            'id': item.get('id', ''),
-                            'abstract': item.get('abstract', ''),
+                            'year': item.publication_year,
+                            'citations': item.cited_by_count,
+                            'doi': item.doi,
+                            'id': item.id,
+                            'abstract': item.abstract,
                             'funders': [
                                 {
-                                    'name': grant.get('funder_display_name', ''),
-                                    'grant_id': grant.get('award_id', ''),
-                                    'details': grant.get('funder_details', {})
+                                    'name': grant.funder_display_name,
+                                    'grant_id': grant.award_id,
+                                    'details': grant.funder_details
                                 }
-                                for grant in item.get('grants', [])
-                                if grant.get('funder_display_name') not in ['Unknown Funder', 'N/A']
+                                for grant in item.grants
+                                if grant.funder_display_name not in ['Unknown Funder', 'N/A']
                             ]
                         }
                 self.paper_details[channel_id] = paper_details
@@ -433,7 +393,7 @@ class DiscordBot(commands.Bot):
         
         # Generate invite link with correct permissions
         invite_link = discord.utils.oauth_url(
-            settings.discord_client_id,
+            get_settings().discord_client_id,
             permissions=discord.Permissions(
                 send_messages=True,
                 read_messages=True,
@@ -474,7 +434,7 @@ class DiscordService:
         """Start the Discord bot"""
         try:
             self._task = asyncio.create_task(
-                self.bot.start(settings.discord_bot_token)
+                self.bot.start(get_settings().discord_bot_token)
             )
             logger.info("Discord bot started")
         except Exception as e:
@@ -496,7 +456,7 @@ class DiscordService:
     async def send_message(self, message: str):
         """Send a message to the configured Discord channel"""
         try:
-            channel = self.bot.get_channel(int(settings.discord_channel_id))
+            channel = self.bot.get_channel(int(get_settings().discord_channel_id))
             if channel:
                 await channel.send(message)
             else:
@@ -507,6 +467,3 @@ class DiscordService:
     def set_message_callback(self, callback: Callable[[str], None]):
         """Set a callback function to handle incoming messages"""
         self.bot.message_callback = callback
-
-# Create a singleton instance
-discord_service = DiscordService() 
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""Showing streamed model output in Discord by editing messages in place.
+
+Discord rate-limits message edits per channel (about five per five seconds),
+so text is buffered and pushed at most once per `min_interval`. A message that
+would pass Discord's 2000-character limit is frozen at a line break and the
+rest continues in a new message.
+"""
+import time
+from typing import List, Optional
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+
+def format_answer_line(line: str) -> str:
+    """Discord markdown for one line of a model answer (`###` headers, `- key: value` bullets)."""
+    line = line.strip()
+    if line.startswith('###'):
+        return f"**{line.replace('###', '').strip()}**"
+    if line.startswith('-'):
+        parts = line.strip('- ').split(':', 1)
+        if len(parts) > 1:
+            return f"• **{parts[0].strip()}**: {parts[1].strip()}"
+        return f"• {line.strip('- ')}"
+    return line
+
+
+def format_answer(text: str) -> str:
+    return "\n".join(format_answer_line(line) for line in text.split("\n"))
+
+
+class ProgressiveMessage:
+    """Streams text into a channel as a few messages that are edited as it grows.
+
+    `message` (e.g. a "thinking..." placeholder) is reused as the first one if given.
+    """
+
+    def __init__(self, ctx, message=None, min_interval: float = 1.0, limit: int = DISCORD_MESSAGE_LIMIT):
+        self.ctx = ctx
+        self.message = message  # The message being edited; None until the next send
+        self.min_interval = min_interval
+        self.limit = limit
+        self.text = ""  # Raw text of the current (last) message
+        self._shown: Optional[str] = None
+        self._last_push = 0.0
+
+    async def append(self, delta: str):
+        self.text += delta
+        if time.monotonic() - self._last_push >= self.min_interval:
+            await self.push()
+
+    async def push(self):
+        """Show everything received so far (also call once at the end)."""
+        self._last_push = time.monotonic()
+        while len(format_answer(self.text)) > self.limit:
+            head, self.text = self._split(self.text)
+            await self._show(format_answer(head))
+            # Leave that message as it is; the rest goes to a new one
+            self.message = None
+            self._shown = None
+        content = format_answer(self.text)
+        if content.strip():
+            await self._show(content)
+
+    def _split(self, text: str):
+        """The longest prefix of whole lines that fits in one message, and the remainder."""
+        lines = text.split("\n")
+        head: List[str] = []
+        for line in lines:
+            if len(format_answer("\n".join(head + [line]))) > self.limit:
+                break
+            head.append(line)
+        if not head:
+            # A single line longer than a message: cut it, leaving room for its markdown
+            cut = self.limit - 10
+            return text[:cut], text[cut:]
+        return "\n".join(head), "\n".join(lines[len(head):])
+
+    async def _show(self, content: str):
+        if content == self._shown:
+            return
+        if self.message is None:
+            self.message = await self.ctx.send(content)
+        else:
+            await self.message.edit(content=content)
+        self._shown = content
@@ -0,0 +1,191 @@
+"""Per-funder statistics over the works collected for a report.
+
+Grants are flattened once into NumPy arrays (funder index, work index, year,
+citations, award amount) and every statistic is computed from those arrays
+with grouped reductions, so the cost stays flat for thousands of works.
+The result is a compact JSON-ready dict sent to clients as `funder_stats`,
+and `format_funder_stats_for_summary` turns it into the prompt's data section.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+# np.unique imports numpy.ma on its first call; do that at startup, not on the event loop mid-report
+import numpy.ma  # noqa: F401
+
+from ..models import Work
+
+
+def _group_quantiles(groups: np.ndarray, values: np.ndarray, n_groups: int, quantiles) -> np.ndarray:
+    """Quantiles of `values` within each group (nearest rank); NaN for empty groups."""
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    has_values = counts > 0
+    for column, q in enumerate(quantiles):
+        positions = starts + np.floor(q * (counts - 1)).astype(int)
+        result[has_values, column] = sorted_values[positions[has_values]]
+    return result
+
+
+def _round(value: float, digits: int = 1) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def compute_funder_stats(funders_data: List[Work], top_n: int = 10, papers_per_funder: int = 2) -> Dict:
+    funder_index: Dict[str, int] = {}
+    funder_names: List[str] = []
+    grant_funder, grant_work, grant_award, grant_award_id = [], [], [], []
+    work_year, work_citations = [], []
+
+    # The only per-grant Python loop: flatten into columns
+    for work_position, work in enumerate(funders_data):
+        work_year.append(work.publication_year or 0)
+        work_citations.append(work.cited_by_count or 0)
+        for grant in work.grants:
+            key = grant.funder_key or grant.funder_display_name or "Unknown Funder"
+            if key not in funder_index:
+                funder_index[key] = len(funder_names)
+                funder_names.append(grant.funder_display_name or "Unknown Funder")
+            grant_funder.append(funder_index[key])
+            grant_work.append(work_position)
+            grant_award.append(grant.award_amount if grant.award_amount is not None else np.nan)
+            grant_award_id.append(grant.award_id)
+
+    n_works, n_funders = len(funders_data), len(funder_names)
+    if not grant_funder:
+        return {"total_works": n_works, "total_grants": 0, "total_funders": 0, "funders": [], "years": {}}
+
+    funder = np.asarray(grant_funder, dtype=np.int64)
+    work = np.asarray(grant_work, dtype=np.int64)
+    award = np.asarray(grant_award, dtype=np.float64)
+    years = np.asarray(work_year, dtype=np.int64)
+    citations = np.asarray(work_citations, dtype=np.float64)
+
+    grant_counts = np.bincount(funder, minlength=n_funders)
+
+    # A work funded twice by the same funder counts once for works/citations
+    pairs = np.unique(funder * n_works + work)
+    pair_funder, pair_work = pairs // n_works, pairs % n_works
+    work_counts = np.bincount(pair_funder, minlength=n_funders)
+    citation_totals = np.bincount(pair_funder, weights=citations[pair_work], minlength=n_funders)
+    citation_quantiles = _group_quantiles(pair_funder, citations[pair_work], n_funders, (0.5, 0.9))
+
+    # Year histogram per funder as one bincount over (funder, year) cells
+    known_year = years[pair_work] > 0
+    year_min = int(years[years > 0].min()) if (years > 0).any() else 0
+    year_span = int(years.max()) - year_min + 1 if year_min else 1
+    cells = pair_funder[known_year] * year_span + (years[pair_work][known_year] - year_min)
+    year_histogram = np.bincount(cells, minlength=n_funders * year_span).reshape(n_funders, year_span)
+
+    has_award = ~np.isnan(award)
+    award_counts = np.bincount(funder[has_award], minlength=n_funders)
+    award_totals = np.bincount(funder[has_award], weights=award[has_award], minlength=n_funders)
+    award_quantiles = _group_quantiles(funder[has_award], award[has_award], n_funders, (0.25, 0.5, 0.75))
+    with_award_id = np.bincount(funder, weights=[award_id is not None for award_id in grant_award_id], minlength=n_funders)
+
+    # Most-cited papers per funder: order pairs by (funder, -citations) and take each group's head
+    paper_order = np.lexsort((-citations[pair_work], pair_funder))
+    group_starts = np.searchsorted(pair_funder[paper_order], np.arange(n_funders))
+
+    ranked = np.lexsort((-citation_totals, -grant_counts))[:top_n]
+    funders = []
+    for f in ranked:
+        years_for_funder = np.nonzero(year_histogram[f])[0]
+        top_papers = []
+        for position in paper_order[group_starts[f]:group_starts[f] + min(papers_per_funder, work_counts[f])]:
+            paper = funders_data[pair_work[position]]
+            top_papers.append({
+                "title": paper.title,
+                "year": paper.publication_year,
+                "citations": paper.cited_by_count
+            })
+        funders.append({
+            "name": funder_names[f],
+            "grants": int(grant_counts[f]),
+            "works": int(work_counts[f]),
+            "share": round(float(grant_counts[f] / len(funder)), 3),
+            "grants_with_award_id": int(with_award_id[f]),
+            "citations": {
+                "total": int(citation_totals[f]),
+                "median": _round(citation_quantiles[f, 0]),
+                "p90": _round(citation_quantiles[f, 1])
+            },
+            "years": {
+                "first": int(year_min + years_for_funder[0]) if len(years_for_funder) else None,
+                "last": int(year_min + years_for_funder[-1]) if len(years_for_funder) else None,
+                "histogram": {str(year_min + y): int(year_histogram[f, y]) for y in years_for_funder}
+            },
+            "award_amounts": {
+                "count": int(award_counts[f]),
+                "total": round(float(award_totals[f]), 2),
+                "p25": _round(award_quantiles[f, 0], 2),
+                "median": _round(award_quantiles[f, 1], 2),
+                "p75": _round(award_quantiles[f, 2], 2)
+            } if award_counts[f] else None,
+            "top_papers": top_papers
+        })
+
+    overall_years = year_histogram.sum(axis=0)
+    return {
+        "total_works": n_works,
+        "total_grants": int(len(funder)),
+        "total_funders": n_funders,
+        "funders": funders,
+        "years": {str(year_min + y): int(count) for y, count in enumerate(overall_years) if count}
+    }
+
+
+def format_funder_stats_for_summary(stats: Dict) -> str:
+    """Compact text version of the statistics for the summary prompt."""
+    lines = [
+        f"Funding Organizations Analysis ({stats['total_works']} funded papers, "
+        f"{stats['total_grants']} grants, {stats['total_funders']} funders):"
+    ]
+    for funder in stats["funders"]:
+        years = funder["years"]
+        lines.append(f"\n{funder['name']}")
+        lines.append(
+            f"- {funder['grants']} grants ({funder['share']:.0%} of all) on {funder['works']} papers, "
+            f"{funder['grants_with_award_id']} with award IDs"
+        )
+        lines.append(
+            f"- Citations: {funder['citations']['total']} total, median {funder['citations']['median']}, "
+            f"p90 {funder['citations']['p90']}"
+        )
+        if years["first"]:
+            lines.append(f"- Active {years['first']}-{years['last']}")
+        if funder["award_amounts"]:
+            amounts = funder["award_amounts"]
+            lines.append(
+                f"- Award amounts ({amounts['count']} known): median {amounts['median']:,.0f}, "
+                f"IQR {amounts['p25']:,.0f}-{amounts['p75']:,.0f}, total {amounts['total']:,.0f}"
+            )
+        for paper in funder["top_papers"]:
+            lines.append(f"  * {paper['title']} ({paper['year']}, {paper['citations']} citations)")
+    return "\n".join(lines)
+
+
+def funder_picture_changes(old: Dict, new: Dict, top_n: int = 5, share_shift: float = 0.05) -> List[str]:
+    """Material differences between two `compute_funder_stats` results; empty when the picture held.
+
+    Material means a different leading funder, a funder entering the top `top_n`,
+    or a top funder's share of grants moving by `share_shift` or more.
+    Growth alone (more works from the same funders in the same proportions) is not.
+    """
+    old_top = [funder["name"] for funder in old.get("funders", [])[:top_n]]
+    new_top = [funder["name"] for funder in new.get("funders", [])[:top_n]]
+    changes = []
+    if new_top and (not old_top or new_top[0] != old_top[0]):
+        changes.append(f"Leading funder is now {new_top[0]}" + (f" (was {old_top[0]})" if old_top else ""))
+    entered = [name for name in new_top if name not in old_top]
+    if entered:
+        changes.append(f"New among the top {top_n} funders: {', '.join(entered)}")
+    old_shares = {funder["name"]: funder["share"] for funder in old.get("funders", [])}
+    new_shares = {funder["name"]: funder["share"] for funder in new.get("funders", [])}
+    for name in dict.fromkeys(old_top + new_top):
+        before, after = old_shares.get(name, 0.0), new_shares.get(name, 0.0)
+        if abs(after - before) >= share_shift:
+            changes.append(f"{name}: {before:.0%} -> {after:.0%} of grants")
+    return changes
@@ -0,0 +1,203 @@
+"""Local SQLite store of grant-bearing works and funder details.
+
+`OpenAlexService` answers searches and funder lookups from here first and only
+goes to the live API for gaps, writing what it fetches back. The store is kept
+fresh by `run_store_sync`, which incrementally pulls the configured topics from
+OpenAlex (see `OpenAlexService.sync_store_topic`). A single pass can also be run
+by hand:
+
+    python -m app.services.funder_store
+"""
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from pydantic import TypeAdapter
+
+from ..models import Funder, Grant, Work
+
+GRANTS = TypeAdapter(List[Grant])
+
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS works (
+    id TEXT PRIMARY KEY,
+    doi TEXT,
+    title TEXT,
+    publication_year INTEGER,
+    cited_by_count INTEGER,
+    grants TEXT NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS works_fts USING fts5(id UNINDEXED, title);
+CREATE TABLE IF NOT EXISTS funders (
+    id TEXT PRIMARY KEY,
+    details TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    topic TEXT PRIMARY KEY,
+    last_synced TEXT,
+    pass_started TEXT,
+    cursor TEXT
+);
+"""
+
+
+def fts_query(term: str) -> Optional[str]:
+    """All words of the term must appear in the title; quoted so FTS syntax can't leak in."""
+    words = re.findall(r"\w+", term.lower())
+    return " ".join(f'"{word}"' for word in words) or None
+
+
+class FunderStore:
+    def __init__(self, path: str, funder_ttl: float = 30 * 24 * 3600, work_ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.funder_ttl = funder_ttl
+        self.work_ttl = work_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        # Stores created before works kept their DOI
+        if "doi" not in {row[1] for row in self._conn.execute("PRAGMA table_info(works)")}:
+            self._conn.execute("ALTER TABLE works ADD COLUMN doi TEXT")
+
+    async def _run(self, fn, *args):
+        """Run a blocking sqlite call off the event loop, one at a time."""
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    # Works
+
+    def _search_works(self, term: str, limit: int) -> List[Work]:
+        query = fts_query(term)
+        if not query:
+            return []
+        rows = self._conn.execute(
+            """
+            SELECT w.id, w.doi, w.title, w.publication_year, w.cited_by_count, w.grants
+            FROM works_fts f JOIN works w ON w.id = f.id
+            WHERE works_fts MATCH ? AND w.stored_at > ?
+            ORDER BY f.rank, w.cited_by_count DESC
+            LIMIT ?
+            """,
+            (query, time.time() - self.work_ttl, limit)
+        ).fetchall()
+        # Same fields as `openalex.work_record`, with the stored grants decoded straight to models
+        return [
+            Work.model_construct(
+                id=work_id,
+                doi=doi,
+                title=title,
+                publication_year=publication_year,
+                grants=GRANTS.validate_json(grants),
+                cited_by_count=cited_by_count
+            )
+            for work_id, doi, title, publication_year, cited_by_count, grants in rows
+        ]
+
+    def _upsert_works(self, works: List[Work]):
+        now = time.time()
+        with self._conn:
+            for work in works:
+                # Grants are stored without enrichment; funder details live in their own table
+                grants = json.dumps([
+                    grant.model_dump(mode="json", exclude_unset=True, exclude={"funder_details"}) for grant in work.grants
+                ])
+                self._conn.execute(
+                    """
+                    INSERT OR REPLACE INTO works (id, doi, title, publication_year, cited_by_count, grants, stored_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (work.id, work.doi, work.title, work.publication_year, work.cited_by_count, grants, now)
+                )
+                self._conn.execute("DELETE FROM works_fts WHERE id = ?", (work.id,))
+                self._conn.execute("INSERT INTO works_fts (id, title) VALUES (?, ?)", (work.id, work.title or ""))
+
+    async def search_works(self, term: str, limit: int) -> List[Work]:
+        """Stored works whose title matches the term, skipping any stored longer ago than the TTL."""
+        return await self._run(self._search_works, term, limit)
+
+    async def upsert_works(self, works: List[Work]):
+        await self._run(self._upsert_works, works)
+
+    # Funders
+
+    def _get_funders(self, funder_ids: List[str]) -> Dict[str, Funder]:
+        placeholders = ",".join("?" for _ in funder_ids)
+        rows = self._conn.execute(
+            f"SELECT id, details FROM funders WHERE fetched_at > ? AND id IN ({placeholders})",
+            (time.time() - self.funder_ttl, *funder_ids)
+        ).fetchall()
+        return {funder_id: Funder.model_validate_json(details) for funder_id, details in rows}
+
+    def _upsert_funders(self, funders: Dict[str, Funder]):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO funders VALUES (?, ?, ?)",
+                [(funder_id, details.model_dump_json(), now) for funder_id, details in funders.items()]
+            )
+
+    async def get_funders(self, funder_ids: List[str]) -> Dict[str, Funder]:
+        """Stored details for the given funders, skipping any older than the TTL."""
+        if not funder_ids:
+            return {}
+        return await self._run(self._get_funders, list(funder_ids))
+
+    async def upsert_funders(self, funders: Dict[str, Funder]):
+        await self._run(self._upsert_funders, funders)
+
+    # Sync bookkeeping
+
+    def _get_sync_state(self, topic: str) -> Dict:
+        row = self._conn.execute(
+            "SELECT last_synced, pass_started, cursor FROM sync_state WHERE topic = ?", (topic,)
+        ).fetchone()
+        last_synced, pass_started, cursor = row or (None, None, None)
+        return {"last_synced": last_synced, "pass_started": pass_started, "cursor": cursor}
+
+    def _save_sync_state(self, topic: str, last_synced: Optional[str], pass_started: Optional[str], cursor: Optional[str]):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (topic, last_synced, pass_started, cursor)
+            )
+
+    async def get_sync_state(self, topic: str) -> Dict:
+        return await self._run(self._get_sync_state, topic)
+
+    async def save_sync_state(self, topic: str, last_synced: Optional[str], pass_started: Optional[str], cursor: Optional[str]):
+        await self._run(self._save_sync_state, topic, last_synced, pass_started, cursor)
+
+
+async def run_store_sync(openalex_service, topics: List[str], interval: float, max_pages: int):
+    """Keep the local store fresh: sync every topic, then sleep, forever."""
+    while True:
+        for topic in topics:
+            try:
+                await openalex_service.sync_store_topic(topic, max_pages)
+            except Exception as e:
+                print(f"Error syncing funder store topic {topic}: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    from ..config import get_settings
+    from ..dependencies import get_openalex_service
+
+    async def sync_once():
+        settings = get_settings()
+        service = get_openalex_service()
+        if not service.store:
+            raise SystemExit("FUNDER_STORE_PATH is not set")
+        for topic in settings.funder_store_topics:
+            await service.sync_store_topic(topic, settings.funder_store_sync_max_pages)
+
+    asyncio.run(sync_once())
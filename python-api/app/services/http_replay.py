@@ -0,0 +1,191 @@
+"""Record/replay of upstream HTTP traffic at the httpx transport level.
+
+With HTTP_REPLAY_MODE=record every OpenAlex/OpenAI response is captured (status,
+headers, body chunks and their timing) into a gzipped JSONL archive. With
+HTTP_REPLAY_MODE=replay the same requests are answered from that archive with
+no network access, at the original pace multiplied by HTTP_REPLAY_TIME_SCALE
+(0 replays instantly).
+"""
+import asyncio
+import atexit
+import codecs
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+
+from ..config import get_settings
+
+# Headers worth keeping; everything else (dates, cookies, request ids) is noise
+KEPT_HEADERS = {"content-type", "retry-after", "x-ratelimit-remaining-requests", "x-ratelimit-remaining-tokens"}
+
+
+def request_key(request: httpx.Request) -> str:
+    """Stable identity of a request: method, path with sorted query and a body hash.
+
+    The host is left out so traffic recorded against a stand-in replays the same
+    as traffic recorded against the real APIs.
+    """
+    # Credentials never end up in the archive
+    query = urlencode(sorted((k, v) for k, v in request.url.params.multi_items() if k != "api_key"))
+    body = hashlib.sha1(request.content).hexdigest()[:16] if request.content else ""
+    return f"{request.method} {request.url.path}?{query} {body}"
+
+
+class ReplayArchive:
+    """In-memory view of an archive file; new records are flushed as one gzip member."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, List[dict]] = defaultdict(list)
+        self.cursors: Dict[str, int] = defaultdict(int)
+        self.pending: List[dict] = []
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as archive:
+                for line in archive:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records[record["key"]].append(record)
+
+    def add(self, record: dict):
+        with self.lock:
+            self.records[record["key"]].append(record)
+            self.pending.append(record)
+
+    def next(self, key: str) -> Optional[dict]:
+        """Return recordings for a key in the order they were captured, repeating the last one."""
+        recorded = self.records.get(key)
+        if not recorded:
+            return None
+        index = min(self.cursors[key], len(recorded) - 1)
+        self.cursors[key] += 1
+        return recorded[index]
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with gzip.open(self.path, "at", encoding="utf-8") as archive:
+                for record in self.pending:
+                    archive.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.pending = []
+
+
+class RecordedStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: List[list], time_scale: float, started: float):
+        self.chunks = chunks
+        self.time_scale = time_scale
+        self.started = started
+
+    async def __aiter__(self):
+        for offset, text in self.chunks:
+            if self.time_scale:
+                delay = self.started + offset * self.time_scale - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield text.encode("utf-8")
+
+
+class CapturingStream(httpx.AsyncByteStream):
+    """Passes the upstream body through while recording each chunk's arrival time."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, record: dict, archive: ReplayArchive, started: float):
+        self.stream = stream
+        self.record = record
+        self.archive = archive
+        self.started = started
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.record["chunks"].append([round(time.monotonic() - self.started, 4), text])
+            yield chunk
+
+    async def aclose(self):
+        await self.stream.aclose()
+        self.archive.add(self.record)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, archive: ReplayArchive):
+        self.archive = archive
+        self.transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Ask for an uncompressed body so the archive stores plain text and compresses once as a whole
+        request.headers["Accept-Encoding"] = "identity"
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        record = {
+            "key": request_key(request),
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+            "elapsed": round(time.monotonic() - started, 4),
+            "chunks": [],
+        }
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=CapturingStream(response.stream, record, self.archive, started),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+        self.archive.flush()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, archive: ReplayArchive, time_scale: float):
+        self.archive = archive
+        self.time_scale = time_scale
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        record = self.archive.next(key)
+        if record is None:
+            raise httpx.ConnectError(f"No recorded response for {key}", request=request)
+        started = time.monotonic()
+        if self.time_scale:
+            await asyncio.sleep(record["elapsed"] * self.time_scale)
+        return httpx.Response(
+            status_code=record["status"],
+            headers=record["headers"],
+            stream=RecordedStream(record["chunks"], self.time_scale, started),
+        )
+
+
+_archives: Dict[str, ReplayArchive] = {}
+
+
+def get_archive(path: str) -> ReplayArchive:
+    if path not in _archives:
+        _archives[path] = ReplayArchive(path)
+        atexit.register(_archives[path].flush)
+    return _archives[path]
+
+
+def build_transport() -> Optional[httpx.AsyncBaseTransport]:
+    """Transport for upstream clients according to HTTP_REPLAY_MODE, or None for plain httpx."""
+    settings = get_settings()
+    mode = (settings.http_replay_mode or "").lower()
+    if not mode:
+        return None
+    archive = get_archive(settings.http_replay_archive)
+    if mode == "record":
+        return RecordingTransport(archive)
+    if mode == "replay":
+        return ReplayTransport(archive, settings.http_replay_time_scale)
+    raise ValueError(f"Unknown HTTP_REPLAY_MODE: {settings.http_replay_mode}")
@@ -0,0 +1,91 @@
+"""Cheap local keyphrase extraction, used where an LLM round-trip is too slow.
+
+Candidate phrases are runs of content words between stopwords and punctuation
+(a rough stand-in for noun phrases). They are scored TF-IDF style: term
+frequency in the description times a prior rarity weight, since there is no
+corpus to take document frequencies from: generic research vocabulary is
+down-weighted and longer, more technical words weigh more.
+"""
+import re
+from collections import Counter
+from typing import List
+
+STOPWORDS = set("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her here
+hers herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off
+on once only or other our ours ourselves out over own same she should so some such than that the their theirs
+them themselves then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours yourself yourselves via within without across per upon
+""".split())
+
+# Words that show up in almost every project description and say little about its field
+GENERIC_WORDS = set("""
+research project study studies approach approaches method methods methodology novel new using use used develop
+developing development based aim aims goal goals propose proposed proposal work investigate investigating analysis
+data results improve improving understanding understand application applications framework system systems model
+models towards toward focus focusing including include potential impact key first also well large
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9\-]*|[.,;:!?()\[\]{}\"/]")
+
+
+def candidate_phrases(text: str, max_words: int = 3) -> List[List[str]]:
+    """Split text into runs of content words, broken at stopwords and punctuation."""
+    phrases, current = [], []
+    for token in TOKEN_PATTERN.findall(text):
+        word = token.lower()
+        if word in STOPWORDS or not word[0].isalpha():
+            if current:
+                phrases.append(current)
+            current = []
+        else:
+            current.append(word)
+    if current:
+        phrases.append(current)
+
+    # Long runs become overlapping windows so every candidate stays phrase-sized
+    candidates = []
+    for phrase in phrases:
+        if len(phrase) <= max_words:
+            candidates.append(phrase)
+        else:
+            candidates.extend(phrase[i:i + max_words] for i in range(len(phrase) - max_words + 1))
+    return candidates
+
+
+def word_weight(word: str) -> float:
+    if word in GENERIC_WORDS:
+        return 0.2
+    return 1.0 + min(len(word), 12) / 12
+
+
+def extract_keyphrases(text: str, max_phrases: int = 3) -> List[str]:
+    """Top TF-IDF-style phrases of a description, most relevant first."""
+    candidates = candidate_phrases(text)
+    frequency = Counter(word for phrase in candidates for word in phrase)
+    scored = {}
+    for phrase in candidates:
+        key = " ".join(phrase)
+        if key not in scored:
+            scored[key] = sum(frequency[word] * word_weight(word) for word in phrase)
+
+    keyphrases = []
+    for phrase, _ in sorted(scored.items(), key=lambda item: item[1], reverse=True):
+        # Skip phrases mostly covered by a better-scoring one
+        if any(term_overlap(phrase, chosen) >= 0.5 for chosen in keyphrases):
+            continue
+        keyphrases.append(phrase)
+        if len(keyphrases) >= max_phrases:
+            break
+    return keyphrases
+
+
+def term_overlap(a: str, b: str) -> float:
+    """Jaccard overlap of the (crudely singularized) content words of two phrases."""
+    def words(phrase: str):
+        return {word.rstrip("s") for word in re.findall(r"\w+", phrase.lower()) if word not in STOPWORDS}
+    left, right = words(a), words(b)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
@@ -1,51 +1,193 @@
-from typing import List
-from openai import AsyncOpenAI
-from time import sleep
-from ..config import settings
+from typing import AsyncIterator, List, Optional, Tuple
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+from pydantic import BaseModel
+from ..config import get_settings
+from ..metrics import metrics
+from ..models import Work
+from ..profiling import span
+from .funder_stats import format_funder_stats_for_summary
+from .http_replay import build_transport
+import asyncio
 import httpx
+import time
+
+
+class ModelRoute(BaseModel):
+    """Which models serve a stage, in fallback order, and how each call is bounded."""
+    models: List[str] = ["gpt-4o"]
+    max_tokens: Optional[int] = None
+    timeout: float = 60.0
+    max_retries: int = 2  # Client-side retries per model before falling back to the next
+
+
+# Per-stage defaults; OPENAI_ROUTES overrides any field, e.g.
+# OPENAI_ROUTES='{"search_terms": {"models": ["gpt-4o-mini", "gpt-4o"], "timeout": 5, "max_retries": 0}}'
+DEFAULT_ROUTES = {
+    "search_terms": ModelRoute(max_tokens=100, timeout=30.0),
+    "summary": ModelRoute(max_tokens=1000),
+    "answer": ModelRoute(max_tokens=1000),
+    "compaction": ModelRoute(models=["gpt-4o-mini", "gpt-4o"], max_tokens=300, timeout=30.0),
+}
+
+# USD per 1M (prompt, completion) tokens; OPENAI_MODEL_PRICES adds or overrides models
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+# Errors that mean "this model is unavailable right now", so the next one is tried
+FALLBACK_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, asyncio.TimeoutError)
+
+
+def search_terms_messages(description: str) -> List[dict]:
+    return [
+        {"role": "system", "content": """Extract 5-10 highly relevant search terms for academic research funding.
+                    Focus on specific technical terms and methodologies that funding agencies typically look for.
+                    Return only the terms without numbers or newlines, separated by commas."""},
+        {"role": "user", "content": description}
+    ]
+
+
+def clean_search_term(term: str) -> str:
+    return term.strip().lstrip('0123456789. ')
+
 
 class OpenAIService:
     def __init__(self):
+        settings = get_settings()
         # Create a custom httpx client without proxies
         http_client = httpx.AsyncClient(
             timeout=60.0,
-            follow_redirects=True
+            follow_redirects=True,
+            transport=build_transport()
         )
         
         self.client = AsyncOpenAI(
             api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
             http_client=http_client
         )
 
-    async def extract_search_terms(self, description: str) -> List[str]:
-        """Uses OpenAI to extract relevant search terms with better prompt."""
+        self.routes = {
+            stage: ModelRoute(**{**route.model_dump(), **settings.openai_routes.get(stage, {})})
+            for stage, route in DEFAULT_ROUTES.items()
+        }
+        self.prices = {**MODEL_PRICES, **{model: tuple(price) for model, price in settings.openai_model_prices.items()}}
+        self._route_clients = {
+            stage: self.client.with_options(max_retries=route.max_retries) for stage, route in self.routes.items()
+        }
+
+    async def _create(self, stage: str, messages: List[dict], **kwargs) -> Tuple[object, str, float]:
+        """Chat completion on the stage's route, falling back along its model chain.
+
+        Returns the response (a stream when `stream=True`), the model that
+        served it and the start time of the successful attempt.
+        """
+        route = self.routes[stage]
+        if route.max_tokens is not None:
+            kwargs.setdefault("max_tokens", route.max_tokens)
+        last_error = None
+        for position, model in enumerate(route.models):
+            start = time.perf_counter()
+            try:
+                with span(f"openai.{stage}"):
+                    response = await self._route_clients[stage].chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        timeout=route.timeout,
+                        **kwargs
+                    )
+            except FALLBACK_ERRORS as e:
+                metrics.inc("llm.failures", stage=stage, model=model, error=type(e).__name__)
+                print(f"OpenAI {stage} call to {model} failed: {type(e).__name__}: {e}")
+                last_error = e
+                continue
+            if position:
+                metrics.inc("llm.fallbacks", stage=stage, model=model)
+            return response, model, start
+        raise last_error
+
+    def _record(self, stage: str, model: str, start: float, prompt_tokens: int, completion_tokens: int):
+        """Per-route latency, token and cost accounting (see app.metrics)."""
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        metrics.observe("llm.latency_seconds", time.perf_counter() - start, stage=stage, model=model)
+        metrics.inc("llm.calls", stage=stage, model=model)
+        metrics.inc("llm.prompt_tokens", prompt_tokens, stage=stage, model=model)
+        metrics.inc("llm.completion_tokens", completion_tokens, stage=stage, model=model)
+        metrics.inc(
+            "llm.cost_usd",
+            (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000,
+            stage=stage, model=model
+        )
+
+    async def _complete(self, stage: str, messages: List[dict], **kwargs) -> str:
+        response, model, start = await self._create(stage, messages, **kwargs)
+        usage = response.usage
+        self._record(stage, model, start, usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0)
+        return response.choices[0].message.content
+
+    async def _stream(self, stage: str, messages: List[dict], **kwargs) -> AsyncIterator[str]:
+        """Streamed chat completion on the stage's route, yielding content deltas.
+
+        Closing the generator early closes the response, which stops the generation.
+        """
+        stream, model, start = await self._create(stage, messages, stream=True, **kwargs)
+        chunks = 0
+        # The span above covers the wait for the response; this one the streamed body
+        receiving = span(f"openai.{stage}.stream")
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": """Extract 5-10 highly relevant search terms for academic research funding.
-                    Focus on specific technical terms and methodologies that funding agencies typically look for.
-                    Return only the terms without numbers or newlines, separated by commas."""},
-                    {"role": "user", "content": description}
-                ]
-            )
-            # Clean up the response - remove numbers, newlines, and extra whitespace
-            terms = response.choices[0].message.content
-            terms = [term.strip().lstrip('0123456789. ') for term in terms.split(',')]
-            return [term for term in terms if term]  # Remove any empty terms
-        except Exception as e:
-            sleep(1)  # Basic rate limit handling
-            return await self.extract_search_terms(description)
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if not chunks:
+                    metrics.observe("llm.first_token_seconds", time.perf_counter() - start, stage=stage, model=model)
+                chunks += 1
+                yield chunk.choices[0].delta.content
+        finally:
+            receiving.close()
+            await stream.response.aclose()
+            # Streams carry no usage, so estimate: ~4 characters per prompt token, one token per chunk
+            self._record(stage, model, start, sum(len(m["content"]) for m in messages) // 4, chunks)
 
-    async def format_funders_data_for_summary(self, funders_data: list) -> str:
+    async def stream_search_terms(self, description: str, max_terms: int) -> AsyncIterator[str]:
+        """Uses OpenAI to extract search terms, yielding each one as soon as its comma arrives.
+
+        Generation is cut off once `max_terms` terms have been yielded, so the
+        caller can start searching on the first term while the rest are still
+        being written and the unused terms are never generated.
+        """
+        deltas = self._stream("search_terms", search_terms_messages(description))
+        buffer = ""
+        seen = set()
+        try:
+            async for delta in deltas:
+                buffer += delta
+                *complete, buffer = buffer.split(',')
+                for term in map(clean_search_term, complete):
+                    if term and term.lower() not in seen:
+                        seen.add(term.lower())
+                        yield term
+                        if len(seen) >= max_terms:
+                            return
+            # The last term has no trailing comma
+            term = clean_search_term(buffer)
+            if term and term.lower() not in seen:
+                yield term
+        finally:
+            await deltas.aclose()
+
+    async def format_funders_data_for_summary(self, funders_data: List[Work]) -> str:
         """Format funders data into a clear, structured text format for the AI."""
         formatted_text = []
         
         # Group by funder for better analysis
         funder_groups = {}
         for work in funders_data:
-            for grant in work.get("grants", []):
-                funder_name = grant.get("funder_display_name", "Unknown Funder")
+            for grant in work.grants:
+                funder_name = grant.funder_display_name or "Unknown Funder"
                 if funder_name not in funder_groups:
                     funder_groups[funder_name] = {
                         "papers": [],
@@ -55,14 +197,14 @@ class OpenAIService:
                     }
                 
                 funder_groups[funder_name]["papers"].append({
-                    "title": work["title"],
-                    "year": work["publication_year"],
-                    "citations": work["cited_by_count"],
-                    "award_id": grant.get("award_id")
+                    "title": work.title,
+                    "year": work.publication_year,
+                    "citations": work.cited_by_count,
+                    "award_id": grant.award_id
                 })
-                if grant.get("award_id"):
-                    funder_groups[funder_name]["award_ids"].add(grant["award_id"])
-                funder_groups[funder_name]["total_citations"] += work["cited_by_count"]
+                if grant.award_id:
+                    funder_groups[funder_name]["award_ids"].add(grant.award_id)
+                funder_groups[funder_name]["total_citations"] += work.cited_by_count
                 funder_groups[funder_name]["grant_count"] += 1
 
         # Format the grouped data
@@ -89,9 +231,16 @@ class OpenAIService:
         
         return "\n".join(formatted_text)
 
-    async def generate_summary(self, description: str, funders_data: list) -> str:
-        """Uses OpenAI to summarize findings and recommend next steps."""
-        formatted_data = await self.format_funders_data_for_summary(funders_data)
+    async def generate_summary(self, description: str, funders_data: list, funder_stats: Optional[dict] = None) -> str:
+        """Uses OpenAI to summarize findings and recommend next steps.
+
+        With precomputed `funder_stats` the prompt carries those compact facts
+        instead of the per-paper listing.
+        """
+        if funder_stats:
+            formatted_data = format_funder_stats_for_summary(funder_stats)
+        else:
+            formatted_data = await self.format_funders_data_for_summary(funders_data)
         
         prompt = f"""
         Project Description: {description}
@@ -134,22 +283,19 @@ class OpenAIService:
         """
         
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
+            return await self._complete(
+                "summary",
+                [
                     {"role": "system", "content": "You are a research funding expert. Provide clear, structured, and non-repetitive advice for grant acquisition. Focus on specific, actionable recommendations and clear organization of information."},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.1,  # Lower temperature for more structured output
-                max_tokens=1000
+                temperature=0.1  # Lower temperature for more structured output
             )
-            return response.choices[0].message.content
         except Exception as e:
             print(f"Error generating summary: {e}")
             raise
 
-    async def answer_question(self, question: str, search_description: str, funders_data: list, enriched_data: list, conversation_history: list = None, paper_details: dict = None) -> str:
-        """Uses OpenAI to answer questions about the search results and specific papers."""
+    async def _answer_messages(self, question: str, search_description: str, funders_data: list, conversation_history: list = None, paper_details: dict = None, conversation_summary: str = "") -> List[dict]:
         formatted_data = await self.format_funders_data_for_summary(funders_data)
         
         # Format paper details for the prompt
@@ -169,12 +315,13 @@ class OpenAIService:
                         papers_context += f" (Grant ID: {funder['grant_id']})"
                 papers_context += "\n"
         
-        # Build conversation context
+        # Build conversation context: the compacted summary of older exchanges, then the recent ones verbatim
         conversation_context = ""
-        if conversation_history and len(conversation_history) > 2:  # Include context if there's more than the current exchange
-            conversation_context = "\nPrevious Conversation:\n"
-            # Include last 3 exchanges (6 messages) before the current one
-            for msg in conversation_history[-7:-2]:  # Exclude current exchange
+        if conversation_summary:
+            conversation_context += f"\nSummary of the Earlier Conversation:\n{conversation_summary}\n"
+        if conversation_history:
+            conversation_context += "\nPrevious Conversation:\n"
+            for msg in conversation_history:
                 role = "User" if msg["role"] == "user" else "Assistant"
                 conversation_context += f"\n{role}: {msg['content']}\n"
         
@@ -213,19 +360,51 @@ class OpenAIService:
         - If suggesting next steps, make them specific and actionable
         """
         
+        return [
+            {"role": "system", "content": "You are a research funding expert specializing in analyzing grant opportunities and providing strategic advice. Your responses should be clear, specific, and grounded in the data provided. You can discuss specific papers in detail and maintain context across a conversation."},
+            {"role": "user", "content": prompt}
+        ]
+
+    async def answer_question(self, question: str, search_description: str, funders_data: list, enriched_data: list, conversation_history: list = None, paper_details: dict = None, conversation_summary: str = "") -> str:
+        """Uses OpenAI to answer questions about the search results and specific papers.
+
+        `conversation_history` holds the earlier messages to quote verbatim (not
+        the current question), `conversation_summary` the compacted ones before them.
+        """
+        messages = await self._answer_messages(question, search_description, funders_data, conversation_history, paper_details, conversation_summary)
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a research funding expert specializing in analyzing grant opportunities and providing strategic advice. Your responses should be clear, specific, and grounded in the data provided. You can discuss specific papers in detail and maintain context across a conversation."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,  # Lower temperature for more focused responses
-                max_tokens=1000
+            return await self._complete(
+                "answer",
+                messages,
+                temperature=0.1  # Lower temperature for more focused responses
             )
-            return response.choices[0].message.content
         except Exception as e:
             print(f"Error answering question: {e}")
             raise
 
-openai_service = OpenAIService() 
\ No newline at end of file
+    async def stream_answer(self, question: str, search_description: str, funders_data: list, conversation_history: list = None, paper_details: dict = None, conversation_summary: str = "") -> AsyncIterator[str]:
+        """`answer_question`, yielding the answer's text as the model writes it."""
+        messages = await self._answer_messages(question, search_description, funders_data, conversation_history, paper_details, conversation_summary)
+        deltas = self._stream("answer", messages, temperature=0.1)
+        try:
+            async for delta in deltas:
+                yield delta
+        except Exception as e:
+            print(f"Error answering question: {e}")
+            raise
+        finally:
+            await deltas.aclose()
+
+    async def compact_conversation(self, summary: str, messages: List[dict]) -> str:
+        """Folds `messages` into the running `summary` of an !ask conversation."""
+        transcript = "\n".join(
+            f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in messages
+        )
+        return await self._complete(
+            "compaction",
+            [
+                {"role": "system", "content": "You maintain a running summary of a conversation between a researcher and a research funding assistant. Merge the new exchanges into the summary. Keep what later questions may refer to: the researcher's goals and constraints, funders, grants, amounts and papers discussed, conclusions reached and open questions. Drop pleasantries and formatting. Reply with the updated summary only, at most 150 words."},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew exchanges:\n{transcript}"}
+            ],
+            temperature=0
+        )
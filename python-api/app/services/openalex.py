@@ -1,125 +1,438 @@
-from typing import List, Dict, Optional
-import requests
-from time import sleep
-from ..config import settings
-from ..models import Work, Funder
+from collections import defaultdict, deque
+from datetime import date
+from typing import Dict, FrozenSet, List, Optional
+from ..config import get_settings
+from ..metrics import metrics
+from ..profiling import span
+from ..models import Work, Funder, Grant, WorksPage
+from pydantic import ValidationError
+from .funder_store import FunderStore
+from .http_replay import build_transport
+from .singleflight import SingleFlight
 import httpx
+import orjson
 import asyncio
+import time
+
+def decode_works_page(content: bytes) -> WorksPage:
+    """A `/works` response as typed models: one parse and one validation pass for the whole page.
+
+    orjson does the parse: on real pages, which are mostly authorships, concepts
+    and references the models ignore, it is faster than pydantic's own JSON
+    parser (`model_validate_json`); see benchmarks/decode_bench.py.
+    """
+    return WorksPage.model_validate(orjson.loads(content))
+
+def work_url(work_id: str) -> str:
+    """Full OpenAlex URL for a work id; OpenAlex already returns URLs, so this only fixes bare ids."""
+    return f"https://openalex.org/{work_id.rsplit('/', 1)[-1]}"
+
+def work_record(work: Work) -> Work:
+    """The subset of an OpenAlex work the report pipeline carries around.
+
+    Only these fields are set, so a report (dumped with `exclude_unset`) shows just them.
+    """
+    return Work.model_construct(
+        id=work_url(work.id),
+        doi=work.doi,
+        title=work.title,
+        publication_year=work.publication_year,
+        grants=work.grants,
+        cited_by_count=work.cited_by_count
+    )
+
+class FunderSaturation:
+    """Tracks the distinct funders a term's pages have produced.
+
+    The summary is about funders, not paper counts, so once `patience`
+    consecutive pages add no new funder the crawl for that term can stop.
+    A patience of 0 disables the check.
+    """
+
+    def __init__(self, patience: int):
+        self.patience = patience
+        self.funders = set()
+        self.stale_pages = 0
+
+    def observe(self, page_papers: List[Work]) -> bool:
+        """Record one page's papers; True when the funder set has stopped growing."""
+        known = len(self.funders)
+        for paper in page_papers:
+            for grant in paper.grants:
+                self.funders.add(grant.funder_key or grant.funder_display_name)
+        if len(self.funders) > known:
+            self.stale_pages = 0
+        elif self.funders:
+            self.stale_pages += 1
+        return bool(self.patience) and self.stale_pages >= self.patience
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before an OpenAlex request could be made."""
+
+class LatencyWindow:
+    """Recent successful response times of one endpoint; the hedging threshold comes from here."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
 
 class OpenAlexService:
     def __init__(self):
-        self.base_url = "https://api.openalex.org"
+        settings = get_settings()
+        self.base_url = settings.openalex_base_url.rstrip("/")
         self.headers = {"User-Agent": f"mailto:{settings.contact_email}"}
+        self.max_concurrent_requests = settings.openalex_max_concurrency
+        self.saturation_patience = settings.openalex_saturation_patience
+        self._funder_cache: Dict[str, Funder] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+        self.api_key = settings.openalex_api_key
+        self.store = FunderStore(settings.funder_store_path) if settings.funder_store_path else None
+        self.request_timeout = settings.openalex_request_timeout
+        self.hedging = settings.openalex_hedging
+        self.hedge_percentile = settings.openalex_hedge_percentile
+        self.hedge_min_samples = settings.openalex_hedge_min_samples
+        self._latency: Dict[str, LatencyWindow] = defaultdict(LatencyWindow)
+        # In-flight crawls and funder lookups, shared between concurrent reports (the first caller's deadline applies)
+        self._crawls = SingleFlight("crawl")
+        self._funder_fetches = SingleFlight("funder")
+
+    def _client(self) -> httpx.AsyncClient:
+        """One pooled client for the service; building a client per call costs an SSL context each time."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.request_timeout, transport=build_transport())
+        return self._http
+
+    async def _timed_get(self, client: httpx.AsyncClient, endpoint: str, url: str,
+                         params: Optional[Dict], timeout: float) -> httpx.Response:
+        start = time.monotonic()
+        with span(f"openalex.{endpoint}"):
+            response = await client.get(url, params=params, headers=self.headers, timeout=timeout)
+        response.raise_for_status()
+        elapsed = time.monotonic() - start
+        self._latency[endpoint].add(elapsed)
+        metrics.observe("openalex.latency_seconds", elapsed, endpoint=endpoint)
+        return response
+
+    async def _get(self, client: httpx.AsyncClient, endpoint: str, url: str,
+                   params: Optional[Dict] = None, deadline: Optional[float] = None) -> httpx.Response:
+        """GET bounded by the caller's deadline (a `time.monotonic()` value), optionally hedged.
+
+        The deadline covers the whole request (httpx timeouts only bound each
+        connect/read/write phase, so a slowly trickling response could outlive it).
+        With hedging on, a request still unanswered after the endpoint's observed
+        p95 gets a duplicate; the first successful response wins and the other
+        request is cancelled.
+        """
+        timeout = self.request_timeout
+        if deadline is None:
+            return await self._hedged_get(client, endpoint, url, params, timeout)
 
-    async def search_for_grants(self, search_terms: List[str], max_results: int) -> List[Dict]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"No time left for OpenAlex {endpoint} request")
+        try:
+            return await asyncio.wait_for(
+                self._hedged_get(client, endpoint, url, params, min(timeout, remaining)), remaining
+            )
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            if time.monotonic() < deadline:
+                raise
+            raise DeadlineExceeded(f"OpenAlex {endpoint} request cut off by the deadline") from e
+
+    async def _hedged_get(self, client: httpx.AsyncClient, endpoint: str, url: str,
+                          params: Optional[Dict], timeout: float) -> httpx.Response:
+        window = self._latency[endpoint]
+        hedge_after = None
+        if self.hedging and len(window) >= self.hedge_min_samples:
+            hedge_after = window.percentile(self.hedge_percentile)
+
+        primary = asyncio.create_task(self._timed_get(client, endpoint, url, params, timeout))
+        attempts = [primary]
+        try:
+            if hedge_after is not None and hedge_after < timeout:
+                done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+                if not done:
+                    metrics.inc("openalex.hedged_requests", endpoint=endpoint)
+                    attempts.append(asyncio.create_task(
+                        self._timed_get(client, endpoint, url, params, timeout - hedge_after)
+                    ))
+
+            pending, error = set(attempts), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is not primary:
+                            metrics.inc("openalex.hedge_wins", endpoint=endpoint)
+                        return attempt.result()
+                    error = attempt.exception()
+            raise error
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+            # Let the losing request release its connection before returning
+            await asyncio.gather(*attempts, return_exceptions=True)
+
+    async def search_for_grants(self, search_terms: List[str], max_results: int,
+                                deadline: Optional[float] = None) -> List[Work]:
+        """Works with grants for the terms; crawls stop early (keeping what they found) at `deadline`."""
         funders_data = []
-        papers_found = 0
         
         print(f"Starting search with terms: {search_terms}")  # Debug log
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            for term in search_terms:
-                if papers_found >= max_results:
-                    break
-                    
-                cursor = "*"
-                papers_for_term = 0
-                max_empty_pages = 3
-                empty_page_count = 0
+        client = self._client()
+        for term in search_terms:
+            needed = max_results - len(funders_data)
+            if needed <= 0:
+                break
+
+            # Local store hits count towards the term; only the rest is crawled
+            local_papers = []
+            if self.store:
+                local_papers = await self.store.search_works(term, needed)
+                if local_papers:
+                    print(f"Found {len(local_papers)} papers with grants in local store for term: {term}")  # Debug log
+                    funders_data.extend(local_papers)
+                    needed -= len(local_papers)
+                    if needed <= 0:
+                        continue
+
+            # Reports crawling the same term at the same time share one crawl
+            skip = frozenset(work.id for work in local_papers)
+            term_papers = await self._crawls.do(
+                (" ".join(term.lower().split()), needed, skip),
+                lambda: self._crawl_and_store(client, term, needed, deadline, skip=skip)
+            )
+            funders_data.extend(term_papers)
+            print(f"Found {len(term_papers)} papers with grants for term: {term}")  # Debug log
+                        
+        print(f"Search complete. Found {len(funders_data)} papers with grants")  # Debug log
+        return funders_data
+
+    async def search_since(self, search_terms: List[str], since: str, max_results_per_term: int,
+                           deadline: Optional[float] = None) -> Dict[str, List[Work]]:
+        """Works with grants per term, only those published on or after `since` (YYYY-MM-DD).
+
+        With an API key the filter is `from_updated_date` instead, which also
+        catches older works whose grants or citations changed since then.
+        Each term is paged through until the filter is exhausted (funder
+        saturation doesn't stop it) or `max_results_per_term` works are found;
+        a term at that cap may have more. Always crawls live: the local store
+        can't tell how new a work is. Unlike `search_for_grants`, a failed
+        request raises instead of ending the crawl quietly, so the caller
+        doesn't mistake it for "nothing new".
+        """
+        filters = f"from_updated_date:{since}" if self.api_key else f"from_publication_date:{since}"
+        client = self._client()
+        works_by_term = {}
+        for term in search_terms:
+            term_papers = await self._crawls.do(
+                (" ".join(term.lower().split()), max_results_per_term, filters),
+                lambda: self._crawl_and_store(client, term, max_results_per_term, deadline, filters, strict=True)
+            )
+            print(f"Found {len(term_papers)} new papers with grants for term: {term} ({filters})")  # Debug log
+            works_by_term[term] = term_papers
+        return works_by_term
+
+    async def _crawl_and_store(self, client: httpx.AsyncClient, term: str, max_results: int,
+                               deadline: Optional[float], filters: Optional[str] = None,
+                               strict: bool = False, skip: FrozenSet[str] = frozenset()) -> List[Work]:
+        term_papers = await self._crawl_term(client, term, max_results, deadline, filters, strict, skip)
+        if self.store and term_papers:
+            await self.store.upsert_works(term_papers)
+        return term_papers
+
+    async def _crawl_term(self, client: httpx.AsyncClient, term: str, max_results: int,
+                          deadline: Optional[float] = None, filters: Optional[str] = None,
+                          strict: bool = False, skip: FrozenSet[str] = frozenset()) -> List[Work]:
+        """Page through OpenAlex search results for one term, keeping works that carry grants.
+
+        Works whose ID is in `skip` are passed over (they still count towards
+        funder saturation). Errors end the crawl with what it has so far; with
+        `strict` they are raised.
+        """
+        papers = []
+        cursor = "*"
+        max_empty_pages = 3
+        empty_page_count = 0
+        # A date-filtered crawl is after every new work, not a picture of the funders, so it never saturates
+        saturation = FunderSaturation(0 if filters else self.saturation_patience)
+        
+        while len(papers) < max_results and cursor and empty_page_count < max_empty_pages:
+            params = {
+                "search": term.strip(),
+                "per_page": 50,
+                "cursor": cursor
+            }
+            if filters:
+                params["filter"] = filters
+                if self.api_key:
+                    params["api_key"] = self.api_key  # from_updated_date needs a premium key
+            
+            try:
+                response = await self._get(client, "works", f"{self.base_url}/works", params, deadline)
+                page = decode_works_page(response.content)
                 
-                while papers_found < max_results and cursor and empty_page_count < max_empty_pages:
-                    params = {
-                        "search": term.strip(),
-                        "per_page": 50,
-                        "cursor": cursor
-                    }
+                results = page.results
+                print(f"Got response with {len(results)} results")  # Debug log
+                
+                if not results:
+                    empty_page_count += 1
+                    break
                     
-                    try:
-                        response = await client.get(
-                            f"{self.base_url}/works",
-                            params=params,
-                            headers=self.headers
-                        )
-                        response.raise_for_status()
-                        data = response.json()
+                page_papers = []
+                papers_with_grants = 0
+                for work in results:
+                    grants = work.grants
+                    if grants and len(grants) > 0:  # Check if grants array exists and is not empty
+                        record = work_record(work)
+                        page_papers.append(record)
+                        papers_with_grants += 1
+                        if record.id in skip:
+                            continue  # The caller already has it
+                        print(f"Found work with {len(grants)} grants: {work.title or ''}")  # Debug log
+                        papers.append(record)
                         
-                        results = data.get("results", [])
-                        print(f"Got response with {len(results)} results")  # Debug log
-                        
-                        if not results:
-                            empty_page_count += 1
+                        if len(papers) >= max_results:
                             break
-                            
-                        papers_with_grants = 0
-                        for work in results:
-                            grants = work.get("grants", [])
-                            if grants and len(grants) > 0:  # Check if grants array exists and is not empty
-                                print(f"Found work with {len(grants)} grants: {work.get('title', '')}")  # Debug log
-                                funders_data.append({
-                                    "id": f"https://openalex.org/{work.get('id')}",  # Changed to full URL
-                                    "title": work.get("title"),
-                                    "publication_year": work.get("publication_year"),
-                                    "grants": grants,
-                                    "cited_by_count": work.get("cited_by_count", 0)
-                                })
-                                papers_found += 1
-                                papers_for_term += 1
-                                papers_with_grants += 1
-                                
-                                if papers_found >= max_results:
-                                    break
-                        
-                        if papers_with_grants == 0:
-                            empty_page_count += 1
-                        else:
-                            empty_page_count = 0  # Reset counter if we found papers with grants
-                        
-                        cursor = data.get("meta", {}).get("next_cursor")
-                        print(f"Next cursor: {cursor}")  # Debug log
-                        await asyncio.sleep(0.1)  # Rate limiting
-                        
-                    except Exception as e:
-                        print(f"Error fetching data for term {term}: {e}")
-                        break
                 
-                print(f"Found {papers_for_term} papers with grants for term: {term}")  # Debug log
-                        
-        print(f"Search complete. Found {len(funders_data)} papers with grants")  # Debug log
-        return funders_data
+                if papers_with_grants == 0:
+                    empty_page_count += 1
+                else:
+                    empty_page_count = 0  # Reset counter if we found papers with grants
 
-    async def get_funder_details(self, funder_id: str) -> Optional[Funder]:
-        """Fetch detailed information about a specific funder."""
-        try:
-            response = requests.get(
-                f"{self.base_url}/funders/{funder_id}",
+                if saturation.observe(page_papers):
+                    print(f"Funder set saturated for term {term} after {len(papers)} papers and "
+                          f"{len(saturation.funders)} funders")  # Debug log
+                    break
+                
+                cursor = page.meta.next_cursor
+                print(f"Next cursor: {cursor}")  # Debug log
+                await asyncio.sleep(0.1)  # Rate limiting
+                
+            except DeadlineExceeded:
+                print(f"Deadline reached for term {term} after {len(papers)} papers")
+                metrics.inc("openalex.deadline_exceeded", endpoint="works")
+                break
+            except Exception as e:
+                print(f"Error fetching data for term {term}: {e}")
+                if strict:
+                    raise
+                break
+
+        return papers
+
+    async def sync_store_topic(self, topic: str, max_pages: int) -> int:
+        """Pull works for a topic updated since the last completed pass into the local store.
+
+        Cursor progress is saved after every page, so a pass cut short by
+        `max_pages` (or a restart) resumes where it stopped on the next run.
+        Returns the number of grant-bearing works stored. Without an API key
+        (`from_updated_date` needs one) later passes can only ask for works
+        published since the last pass, so changes to older works are missed.
+        """
+        state = await self.store.get_sync_state(topic)
+        pass_started = state["pass_started"] or date.today().isoformat()
+        cursor = state["cursor"] or "*"
+        params = {"search": topic, "per_page": 200}
+        if state["last_synced"]:
+            since = "from_updated_date" if self.api_key else "from_publication_date"
+            params["filter"] = f"{since}:{state['last_synced']}"
+        if self.api_key:
+            params["api_key"] = self.api_key  # from_updated_date needs a premium key
+
+        stored = 0
+        pages = 0
+        client = self._client()
+        while cursor and pages < max_pages:
+            response = await client.get(
+                f"{self.base_url}/works",
+                params={**params, "cursor": cursor},
                 headers=self.headers
             )
             response.raise_for_status()
-            return Funder(**response.json())
-        except requests.exceptions.RequestException:
+            page = decode_works_page(response.content)
+            works = [work_record(work) for work in page.results if work.grants]
+            if works:
+                await self.store.upsert_works(works)
+                await self.enrich_funders_data(works)
+                stored += len(works)
+            cursor = page.meta.next_cursor
+            pages += 1
+            await self.store.save_sync_state(topic, state["last_synced"], pass_started, cursor)
+            await asyncio.sleep(0.1)  # Rate limiting
+
+        if not cursor:
+            # Pass complete: the next one only needs works updated since this one began
+            await self.store.save_sync_state(topic, pass_started, None, None)
+        print(f"Synced {stored} works with grants for topic: {topic}")  # Debug log
+        return stored
+
+    async def get_funder_details(self, funder_id: str, deadline: Optional[float] = None) -> Optional[Funder]:
+        """Fetch detailed information about a specific funder."""
+        # Grants carry full OpenAlex URLs ("https://openalex.org/F...") but the endpoint wants the short ID
+        short_id = funder_id.rsplit("/", 1)[-1]
+        try:
+            response = await self._get(self._client(), "funders", f"{self.base_url}/funders/{short_id}", deadline=deadline)
+            return Funder.model_validate_json(response.content)
+        except (httpx.HTTPError, ValidationError, DeadlineExceeded):
             return None
 
-    async def enrich_funders_data(self, funders_data: List[Dict]) -> List[Dict]:
-        """Enrich funders data with additional information from OpenAlex."""
-        unique_funder_ids = {
-            grant["funder_id"] 
-            for work in funders_data 
-            for grant in work.get("grants", [])
-            if grant.get("funder_id")
-        }
-        
-        funder_details = {}
-        for funder_id in unique_funder_ids:
-            details = await self.get_funder_details(funder_id)
-            if details:
-                funder_details[funder_id] = details.dict()
-        
-        # Enrich the original data with funder details
+    async def enrich_funders_data(self, funders_data: List[Work], deadline: Optional[float] = None) -> List[Work]:
+        """Enrich funders data with additional information from OpenAlex.
+
+        Funder details are fetched concurrently and cached on the service, so a
+        funder shared by many works (or many reports) is only looked up once.
+        Funders not fetched by `deadline` are left unenriched. Grants get their
+        funder's details as soon as it is fetched, and fetched funders are
+        stored even if the caller gives up waiting, so a cancelled call keeps
+        everything it got.
+        """
+        grants_by_funder: Dict[str, List[Grant]] = {}
         for work in funders_data:
-            for grant in work.get("grants", []):
-                if grant.get("funder_id") in funder_details:
-                    grant["funder_details"] = funder_details[grant["funder_id"]]
-        
-        return funders_data
+            for grant in work.grants:
+                if grant.funder_key:
+                    grants_by_funder.setdefault(grant.funder_key, []).append(grant)
+
+        def assign(funder_id: str, details: Funder):
+            for grant in grants_by_funder[funder_id]:
+                grant.funder_details = details
+
+        missing = [funder_id for funder_id in grants_by_funder if funder_id not in self._funder_cache]
+        if self.store and missing:
+            self._funder_cache.update(await self.store.get_funders(missing))
+            missing = [funder_id for funder_id in missing if funder_id not in self._funder_cache]
+        for funder_id in grants_by_funder:
+            if funder_id in self._funder_cache:
+                assign(funder_id, self._funder_cache[funder_id])
 
-openalex_service = OpenAlexService() 
\ No newline at end of file
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        fetched: Dict[str, Funder] = {}
+
+        async def fetch(funder_id: str):
+            async with semaphore:
+                details = await self._funder_fetches.do(funder_id, lambda: self.get_funder_details(funder_id, deadline))
+            if details:
+                self._funder_cache[funder_id] = fetched[funder_id] = details
+                assign(funder_id, details)
+
+        try:
+            await asyncio.gather(*(fetch(funder_id) for funder_id in missing))
+        finally:
+            if self.store and fetched:
+                # Shielded so a timed-out (cancelled) enrichment still stores what it fetched
+                await asyncio.shield(self.store.upsert_funders(dict(fetched)))
+
+        return funders_data
@@ -0,0 +1,153 @@
+"""SQLite store of saved reports, for re-running a description incrementally.
+
+A saved report keeps everything a refresh needs: the description and search
+terms, the merged works (with their funder details), the funder statistics and
+summary, and the date of the last run. `ReportPipeline.refresh` then only asks
+OpenAlex for works published (or updated) since that date.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date
+from typing import Dict, List, Optional
+
+from pydantic import TypeAdapter
+
+from ..models import Work
+
+WORKS = TypeAdapter(List[Work])
+
+# Works kept per saved report; the oldest and least cited go first
+MAX_SAVED_WORKS = 500
+
+# last_run of a report whose paper search was cut short: its next refresh searches works of any date
+FULL_REFRESH_SINCE = "1900-01-01"
+
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS saved_reports (
+    id TEXT PRIMARY KEY,
+    description TEXT NOT NULL,
+    max_results_per_term INTEGER NOT NULL,
+    search_terms TEXT NOT NULL,
+    works TEXT NOT NULL,
+    funder_stats TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    last_run TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    refreshed_at REAL,
+    refreshes INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+COLUMNS = (
+    "id", "description", "max_results_per_term", "search_terms", "works", "funder_stats", "summary",
+    "last_run", "created_at", "refreshed_at", "refreshes"
+)
+
+
+def merge_works(saved: List[Work], new: List[Work], limit: int = MAX_SAVED_WORKS) -> List[Work]:
+    """`saved` with `new` added; a work fetched again replaces its saved copy (grants or citations may have changed)."""
+    merged = {work.id: work for work in saved}
+    merged.update((work.id, work) for work in new)
+    works = list(merged.values())
+    if len(works) > limit:
+        works = sorted(works, key=lambda w: (w.publication_year or 0, w.cited_by_count), reverse=True)[:limit]
+    return works
+
+
+def _dump_works(works: List[Work]) -> str:
+    return json.dumps([work.model_dump(mode="json", exclude_unset=True) for work in works])
+
+
+class SavedReportStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    async def _run(self, fn, *args):
+        """Run a blocking sqlite call off the event loop, one at a time."""
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    def _row(self, row) -> Dict:
+        saved = dict(zip(COLUMNS, row))
+        saved["search_terms"] = json.loads(saved["search_terms"])
+        saved["funders_data"] = WORKS.validate_json(saved.pop("works"))
+        saved["funder_stats"] = json.loads(saved["funder_stats"])
+        return saved
+
+    def _get(self, report_id: str) -> Optional[Dict]:
+        row = self._conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM saved_reports WHERE id = ?", (report_id,)
+        ).fetchone()
+        return self._row(row) if row else None
+
+    def _list(self) -> List[Dict]:
+        rows = self._conn.execute(
+            """
+            SELECT id, description, search_terms, json_array_length(works), last_run, created_at, refreshed_at, refreshes
+            FROM saved_reports ORDER BY created_at DESC
+            """
+        ).fetchall()
+        return [
+            {
+                "id": report_id, "description": description, "search_terms": json.loads(search_terms),
+                "works": works, "last_run": last_run, "created_at": created_at, "refreshed_at": refreshed_at,
+                "refreshes": refreshes
+            }
+            for report_id, description, search_terms, works, last_run, created_at, refreshed_at, refreshes in rows
+        ]
+
+    def _create(self, report_id: str, description: str, max_results_per_term: int, report: Dict, last_run: str):
+        with self._conn:
+            self._conn.execute(
+                f"INSERT INTO saved_reports ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+                (report_id, description, max_results_per_term, json.dumps(report["search_terms"]),
+                 _dump_works(report["funders_data"]), json.dumps(report["funder_stats"]), report["summary"],
+                 last_run, time.time(), None, 0)
+            )
+
+    def _update(self, report_id: str, report: Dict, last_run: str):
+        with self._conn:
+            self._conn.execute(
+                """
+                UPDATE saved_reports
+                SET works = ?, funder_stats = ?, summary = ?, last_run = ?, refreshed_at = ?, refreshes = refreshes + 1
+                WHERE id = ?
+                """,
+                (_dump_works(report["funders_data"]), json.dumps(report["funder_stats"]), report["summary"],
+                 last_run, time.time(), report_id)
+            )
+
+    def _delete(self, report_id: str) -> bool:
+        with self._conn:
+            return self._conn.execute("DELETE FROM saved_reports WHERE id = ?", (report_id,)).rowcount > 0
+
+    async def get(self, report_id: str) -> Optional[Dict]:
+        """The saved report with its works decoded, or None."""
+        return await self._run(self._get, report_id)
+
+    async def list_reports(self) -> List[Dict]:
+        """Saved reports without their works, newest first."""
+        return await self._run(self._list)
+
+    async def create(self, description: str, max_results_per_term: int, report: Dict,
+                     last_run: Optional[str] = None) -> str:
+        report_id = uuid.uuid4().hex[:12]
+        await self._run(self._create, report_id, description, max_results_per_term, report,
+                        last_run or date.today().isoformat())
+        return report_id
+
+    async def update(self, report_id: str, report: Dict, last_run: str):
+        await self._run(self._update, report_id, report, last_run)
+
+    async def delete(self, report_id: str) -> bool:
+        return await self._run(self._delete, report_id)
@@ -0,0 +1,61 @@
+"""Coalescing of identical in-flight upstream calls.
+
+Concurrent reports often need the same term crawl or funder lookup. `SingleFlight`
+runs one task per key and lets every caller wait on it. Callers wait through
+`asyncio.shield`, so a caller that goes away (its SSE client disconnected) only
+drops its own interest: the shared task keeps running for the others and is
+cancelled only when its last waiter leaves.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from ..metrics import metrics
+from ..profiling import span
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Result of `call()`, shared with any concurrent caller using the same key."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.create_task(call()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            metrics.inc("singleflight.coalesced", flight=self.name)
+
+        flight.waiters += 1
+        try:
+            with span(f"singleflight.{self.name}"):
+                return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.done():
+                raise
+            if flight.waiters == 1:
+                # Nobody else wants it: stop the upstream work, and make later callers start afresh
+                self._forget(key, flight)
+                flight.task.cancel()
+                metrics.inc("singleflight.cancelled", flight=self.name)
+            else:
+                metrics.inc("singleflight.detached", flight=self.name)
+            raise
+        finally:
+            flight.waiters -= 1
@@ -0,0 +1,94 @@
+"""Search-term extractors the report pipeline can choose between per request.
+
+- `llm`: the model writes the terms (streamed, see `OpenAIService.stream_search_terms`)
+- `local`: CPU-only keyphrase statistics over the description (`keywords.extract_keyphrases`),
+  no network round-trip at all
+- `auto`: the LLM, falling back to the local extractor when it is slow to produce
+  terms, rate-limited or erroring
+
+Every extractor streams terms through `stream_terms`, so the pipeline can start
+searching on the first one whatever produced it.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List
+
+from .keywords import extract_keyphrases, term_overlap
+
+# Names accepted by the TERM_EXTRACTOR setting and the ?term_extractor= parameter
+TERM_EXTRACTORS = ("auto", "llm", "local")
+
+
+class TermExtractor(ABC):
+    name = "base"
+
+    @abstractmethod
+    def stream_terms(self, description: str, max_terms: int) -> AsyncIterator[str]:
+        """Yield up to `max_terms` distinct search terms, each as soon as it is known."""
+
+    async def extract(self, description: str, max_terms: int) -> List[str]:
+        return [term async for term in self.stream_terms(description, max_terms)]
+
+
+class LLMTermExtractor(TermExtractor):
+    name = "llm"
+
+    def __init__(self, openai_service):
+        self.openai_service = openai_service
+
+    async def stream_terms(self, description: str, max_terms: int) -> AsyncIterator[str]:
+        async for term in self.openai_service.stream_search_terms(description, max_terms):
+            yield term
+
+
+class LocalTermExtractor(TermExtractor):
+    name = "local"
+
+    async def stream_terms(self, description: str, max_terms: int) -> AsyncIterator[str]:
+        for term in extract_keyphrases(description, max_terms):
+            yield term
+
+
+class FallbackTermExtractor(TermExtractor):
+    """`primary`, topped up from `fallback` when it fails or stalls.
+
+    The primary gets `first_term_timeout` seconds to produce its first term and
+    `term_timeout` for each one after that. Terms it already produced are kept;
+    the fallback only fills the remaining slots, skipping near-duplicates.
+    """
+    name = "auto"
+
+    def __init__(self, primary: TermExtractor, fallback: TermExtractor,
+                 first_term_timeout: float = 5.0, term_timeout: float = 2.0):
+        self.primary = primary
+        self.fallback = fallback
+        self.first_term_timeout = first_term_timeout
+        self.term_timeout = term_timeout
+
+    async def stream_terms(self, description: str, max_terms: int) -> AsyncIterator[str]:
+        terms = []
+        stream = self.primary.stream_terms(description, max_terms)
+        try:
+            while len(terms) < max_terms:
+                timeout = self.term_timeout if terms else self.first_term_timeout
+                term = await asyncio.wait_for(stream.__anext__(), timeout)
+                terms.append(term)
+                yield term
+            return
+        except StopAsyncIteration:
+            if terms:
+                return
+            print(f"{self.primary.name} term extraction returned no terms, using {self.fallback.name}")
+        except asyncio.TimeoutError:
+            print(f"{self.primary.name} term extraction too slow after {len(terms)} terms, using {self.fallback.name}")
+        except Exception as e:
+            print(f"{self.primary.name} term extraction failed after {len(terms)} terms ({e!r}), using {self.fallback.name}")
+        finally:
+            await stream.aclose()
+
+        for term in await self.fallback.extract(description, max_terms):
+            if len(terms) >= max_terms:
+                break
+            if all(term_overlap(term, existing) < 0.5 for existing in terms):
+                terms.append(term)
+                yield term
@@ -0,0 +1,138 @@
+"""Offline comparison of the local term extractor against the LLM's terms.
+
+For every description in a corpus it runs the local extractor and gets the LLM
+terms, either from the corpus itself (`llm_terms` in a JSONL line) or from the
+model, and reports how well they agree:
+
+- exact: share of LLM terms the local extractor produced verbatim
+- soft recall / precision: mean best word overlap (`keywords.term_overlap`) of
+  each LLM term against the local ones, and of each local term against the LLM's
+- speculation hits: how often the top local keyphrase would be reused as one of
+  the LLM's terms at the speculative-prefetch threshold
+
+    python -m benchmarks.compare_term_extractors --corpus descriptions.jsonl --output terms.json
+    python -m benchmarks.compare_term_extractors --upstream live --save-corpus descriptions.jsonl
+
+The corpus is a text file with one description per line, or JSONL with
+`description` and optional `llm_terms`; `--save-corpus` writes the latter so
+later runs need no LLM calls at all.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from .run_benchmark import API_DIR, DESCRIPTIONS, git_revision, summarize, upstream_env
+
+
+def load_corpus(path: str) -> List[Dict]:
+    lines = [line.strip() for line in Path(path).read_text().splitlines() if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line) for line in lines]
+    return [{"description": line} for line in lines]
+
+
+def best_overlaps(terms: List[str], others: List[str]) -> List[float]:
+    from app.services.keywords import term_overlap
+    return [max((term_overlap(term, other) for other in others), default=0.0) for term in terms]
+
+
+def compare_terms(llm_terms: List[str], local_terms: List[str], threshold: float) -> Dict:
+    llm_normalized = {" ".join(term.lower().split()) for term in llm_terms}
+    exact = sum(" ".join(term.lower().split()) in llm_normalized for term in local_terms)
+    recall = best_overlaps(llm_terms, local_terms)
+    precision = best_overlaps(local_terms, llm_terms)
+    top_local = best_overlaps(local_terms[:1], llm_terms)
+    return {
+        "exact": exact / len(llm_terms) if llm_terms else 0.0,
+        "soft_recall": sum(recall) / len(recall) if recall else 0.0,
+        "soft_precision": sum(precision) / len(precision) if precision else 0.0,
+        "speculation_hit": bool(top_local and top_local[0] >= threshold),
+    }
+
+
+async def main(args):
+    os.environ.update(upstream_env(args, None))
+    sys.path.insert(0, str(API_DIR))
+    from app.config import get_settings
+    from app.dependencies import get_term_extractor
+
+    corpus = load_corpus(args.corpus) if args.corpus else [{"description": d} for d in DESCRIPTIONS]
+    threshold = args.threshold if args.threshold is not None else get_settings().speculative_overlap
+    local = get_term_extractor("local")
+
+    rows = []
+    local_seconds, llm_seconds = [], []
+    for entry in corpus:
+        description = entry["description"]
+        if entry.get("llm_terms") is None:
+            start = time.perf_counter()
+            entry["llm_terms"] = await get_term_extractor("llm").extract(description, args.max_terms)
+            llm_seconds.append(time.perf_counter() - start)
+        llm_terms = entry["llm_terms"][:args.max_terms]
+
+        start = time.perf_counter()
+        local_terms = await local.extract(description, args.max_terms)
+        local_seconds.append(time.perf_counter() - start)
+
+        rows.append({
+            "description": description,
+            "llm_terms": llm_terms,
+            "local_terms": local_terms,
+            **compare_terms(llm_terms, local_terms, threshold),
+        })
+
+    n = len(rows) or 1
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "descriptions": len(rows),
+            "max_terms": args.max_terms,
+            "threshold": threshold,
+        },
+        "exact": sum(row["exact"] for row in rows) / n,
+        "soft_recall": sum(row["soft_recall"] for row in rows) / n,
+        "soft_precision": sum(row["soft_precision"] for row in rows) / n,
+        "speculation_hit_rate": sum(row["speculation_hit"] for row in rows) / n,
+        "latency": {"local": summarize(local_seconds), "llm": summarize(llm_seconds)},
+        "descriptions": rows,
+    }
+
+    for row in rows:
+        print(f"- {row['description'][:70]}")
+        print(f"    llm:   {', '.join(row['llm_terms'])}")
+        print(f"    local: {', '.join(row['local_terms'])}")
+    print(f"\n{len(rows)} descriptions: exact {report['exact']:.2f}, soft recall {report['soft_recall']:.2f}, "
+          f"soft precision {report['soft_precision']:.2f}, speculation hits {report['speculation_hit_rate']:.0%}")
+    for name, stats in report["latency"].items():
+        if stats["p50"] is not None:
+            print(f"  {name:>5} latency: p50 {stats['p50']*1000:9.2f}ms  p95 {stats['p95']*1000:9.2f}ms")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    if args.save_corpus:
+        Path(args.save_corpus).write_text(
+            "".join(json.dumps({"description": e["description"], "llm_terms": e["llm_terms"]}) + "\n" for e in corpus)
+        )
+        print(f"Corpus with LLM terms written to {args.save_corpus}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare local and LLM search-term extraction")
+    parser.add_argument("--corpus", help="descriptions: one per line, or JSONL with description/llm_terms")
+    parser.add_argument("--max-terms", type=int, default=3)
+    parser.add_argument("--threshold", type=float, help="speculation overlap threshold (default: settings)")
+    parser.add_argument("--upstream", choices=["live", "replay"], default="live",
+                        help="where LLM terms missing from the corpus come from")
+    parser.add_argument("--record", action="store_true", help="record LLM traffic into --archive")
+    parser.add_argument("--archive", default="http_archive.jsonl.gz")
+    parser.add_argument("--replay-time-scale", type=float, default=1.0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--save-corpus", help="write the corpus with LLM terms as JSONL")
+    asyncio.run(main(parser.parse_args()))
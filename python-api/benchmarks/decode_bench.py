@@ -0,0 +1,197 @@
+"""Micro-benchmark of decoding OpenAlex responses: dicts vs pydantic models.
+
+Compares, per `/works` page and per `/funders` response, the old dict path
+(`json.loads`, then dict records and `.get` access; `Funder(**response.json())`)
+with the typed path (`openalex.decode_works_page` / `Funder.model_validate_json`,
+then attribute access). `works_page.validate_json` is the typed path with
+pydantic's own JSON parser, for comparison:
+
+    python -m benchmarks.decode_bench
+    python -m benchmarks.decode_bench --page saved_works_page.json --output decode.json
+
+Without `--page` the pages are synthetic, padded with authorships, concepts,
+referenced works and an abstract index so their size resembles real OpenAlex
+works (which the typed path has to skip over while validating).
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from .run_benchmark import API_DIR, git_revision
+
+sys.path.insert(0, str(API_DIR))
+
+from app.models import Funder, WorksPage  # noqa: E402
+from app.services.openalex import decode_works_page, work_record  # noqa: E402
+
+WORDS = ["protein", "climate", "neural", "sequencing", "imaging", "ecology", "quantum", "battery", "cohort", "signal"]
+
+
+def synthetic_work(rng: random.Random, index: int, padded: bool) -> Dict:
+    work_id = f"W{rng.randrange(10**9, 10**10)}"
+    grants = [
+        {
+            "funder": f"https://openalex.org/F{4320000000 + rng.randrange(40)}",
+            "funder_display_name": f"Funder {index % 40}",
+            "award_id": f"AW-{rng.randrange(10**5, 10**6)}" if rng.random() < 0.7 else None,
+        }
+        for _ in range(rng.randint(0, 3))
+    ]
+    work = {
+        "id": f"https://openalex.org/{work_id}",
+        "doi": f"https://doi.org/10.5555/{work_id.lower()}",
+        "title": " ".join(rng.sample(WORDS, 5)).title(),
+        "publication_year": rng.randint(2000, 2024),
+        "publication_date": f"{rng.randint(2000, 2024)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+        "cited_by_count": rng.randrange(500),
+        "grants": grants,
+    }
+    if padded:
+        work.update({
+            "authorships": [
+                {
+                    "author_position": "middle",
+                    "author": {"id": f"https://openalex.org/A{rng.randrange(10**9)}", "display_name": f"Author {a}"},
+                    "institutions": [{"id": f"https://openalex.org/I{rng.randrange(10**6)}", "display_name": "University"}],
+                    "raw_author_name": f"Author {a}",
+                }
+                for a in range(rng.randint(2, 10))
+            ],
+            "concepts": [
+                {"id": f"https://openalex.org/C{rng.randrange(10**6)}", "display_name": word, "level": 1,
+                 "score": round(rng.random(), 3)}
+                for word in rng.sample(WORDS, 6)
+            ],
+            "keywords": [{"id": f"https://openalex.org/keywords/{word}", "display_name": word,
+                          "score": round(rng.random(), 3)} for word in rng.sample(WORDS, 3)],
+            "referenced_works": [f"https://openalex.org/W{rng.randrange(10**9)}" for _ in range(rng.randint(10, 40))],
+            "abstract_inverted_index": {word + str(i): [rng.randrange(200)] for i, word in enumerate(rng.choices(WORDS, k=120))},
+            "primary_location": {"is_oa": False, "landing_page_url": f"https://doi.org/10.5555/{work_id.lower()}"},
+        })
+    return work
+
+
+def synthetic_page(seed: int, per_page: int, padded: bool) -> bytes:
+    rng = random.Random(seed)
+    return json.dumps({
+        "meta": {"count": 10000, "next_cursor": "abc"},
+        "results": [synthetic_work(rng, i, padded) for i in range(per_page)],
+    }).encode()
+
+
+FUNDER_BODY = json.dumps({
+    "id": "https://openalex.org/F4320306076", "display_name": "National Science Foundation",
+    "alternate_titles": ["NSF", "US NSF"], "country_code": "US",
+    "description": "United States government agency", "homepage_url": "https://www.nsf.gov/",
+    "image_url": "https://upload.wikimedia.org/nsf.png", "works_count": 123456, "cited_by_count": 9876543,
+    "grants_count": 0, "ids": {"openalex": "https://openalex.org/F4320306076", "ror": "https://ror.org/021nxhr62"},
+    "counts_by_year": [{"year": y, "works_count": 1000, "cited_by_count": 50000} for y in range(2012, 2025)],
+}).encode()
+
+
+# The report path for one page: decode, keep works with grants, then read them like funder_stats does
+
+def dict_path(body: bytes) -> int:
+    data = json.loads(body)
+    papers = [
+        {
+            "id": work.get("id"),
+            "title": work.get("title"),
+            "publication_year": work.get("publication_year"),
+            "grants": work.get("grants", []),
+            "cited_by_count": work.get("cited_by_count", 0),
+        }
+        for work in data.get("results", []) if work.get("grants")
+    ]
+    touched = 0
+    for paper in papers:
+        touched += (paper.get("publication_year") or 0) + (paper.get("cited_by_count") or 0)
+        for grant in paper.get("grants", []):
+            touched += len(grant.get("funder") or grant.get("funder_id") or "") + (grant.get("award_id") is not None)
+    return touched + len(data.get("meta", {}).get("next_cursor") or "")
+
+
+def typed_path(body: bytes, decode: Callable[[bytes], WorksPage] = decode_works_page) -> int:
+    page = decode(body)
+    papers = [work_record(work) for work in page.results if work.grants]
+    touched = 0
+    for paper in papers:
+        touched += (paper.publication_year or 0) + paper.cited_by_count
+        for grant in paper.grants:
+            touched += len(grant.funder_key or "") + (grant.award_id is not None)
+    return touched + len(page.meta.next_cursor or "")
+
+
+def validate_json_path(body: bytes) -> int:
+    return typed_path(body, WorksPage.model_validate_json)
+
+
+def funder_dict_path(body: bytes) -> str:
+    return Funder(**json.loads(body)).display_name
+
+
+def funder_typed_path(body: bytes) -> str:
+    return Funder.model_validate_json(body).display_name
+
+
+def time_per_call(fn: Callable, arg, repeat: int, number: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(arg)
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def main(args):
+    if args.page:
+        body = Path(args.page).read_bytes()
+    else:
+        body = synthetic_page(args.seed, args.per_page, padded=not args.lean)
+    assert dict_path(body) == typed_path(body), "the two paths disagree"
+
+    cases = {
+        "works_page.dict": (dict_path, body),
+        "works_page.typed": (typed_path, body),
+        "works_page.validate_json": (validate_json_path, body),
+        "funder.dict": (funder_dict_path, FUNDER_BODY),
+        "funder.typed": (funder_typed_path, FUNDER_BODY),
+    }
+    results = {}
+    for name, (fn, payload) in cases.items():
+        number = args.number if name.startswith("works") else args.number * 20
+        samples = time_per_call(fn, payload, args.repeat, number)
+        results[name] = {"median_us": statistics.median(samples) * 1e6, "min_us": min(samples) * 1e6}
+
+    print(f"works page: {len(body) / 1024:.1f} KiB, {args.per_page if not args.page else '?'} works")
+    for name, stats in results.items():
+        print(f"  {name:<24} median {stats['median_us']:10.1f}us   min {stats['min_us']:10.1f}us")
+    for kind in ("works_page", "funder"):
+        speedup = results[f"{kind}.dict"]["median_us"] / results[f"{kind}.typed"]["median_us"]
+        print(f"  {kind}: typed path is {speedup:.2f}x the speed of the dict path")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            "meta": {"revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "page_bytes": len(body), "padded": not args.lean and not args.page},
+            "results": results,
+        }, indent=2))
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dict vs typed decoding of OpenAlex responses")
+    parser.add_argument("--page", help="a saved OpenAlex /works response to decode instead of a synthetic one")
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--lean", action="store_true", help="synthetic works without the bulky OpenAlex fields")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--number", type=int, default=50)
+    parser.add_argument("--output", help="write results JSON here")
+    main(parser.parse_args())
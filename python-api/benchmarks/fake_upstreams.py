@@ -0,0 +1,253 @@
+"""Local stand-ins for the OpenAlex and OpenAI APIs used by the benchmark harness.
+
+Run it on its own with:
+
+    python -m benchmarks.fake_upstreams --port 8900 --openalex-latency 120
+
+then point the API at it with OPENALEX_BASE_URL=http://127.0.0.1:8900 and
+OPENAI_BASE_URL=http://127.0.0.1:8900/v1.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass, field, asdict
+from typing import List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "adaptive analysis bayesian cellular climate cohort computational dynamics "
+    "ecology embedding genomic imaging inference learning longitudinal metabolic "
+    "microbial modeling network neural optimization protein quantum robust "
+    "sensing sequencing signal spatial statistical synthesis therapeutic"
+).split()
+
+
+@dataclass
+class FakeConfig:
+    # OpenAlex
+    openalex_latency: float = 80.0  # ms, mean per request
+    openalex_jitter: float = 40.0  # ms, uniform +/- around the mean
+    openalex_slow_rate: float = 0.0  # fraction of requests hitting the slow tail
+    openalex_slow_latency: float = 2000.0  # ms
+    pages_per_term: int = 5
+    grant_density: float = 0.3  # fraction of works carrying grants
+    funder_pool: int = 40
+    award_amount_rate: float = 0.0  # fraction of grants carrying an award_amount
+    new_works_fraction: float = 0.1  # share of a term's results matching a from_publication/updated_date filter
+    max_rps: float = 0.0  # 0 disables the 429 limiter
+    throttle_rate: float = 0.0  # random 429 probability per request
+    # OpenAI
+    openai_latency: float = 400.0  # ms until the first token
+    openai_token_latency: float = 5.0  # ms per streamed token
+    summary_tokens: int = 400
+    openai_unavailable_models: str = ""  # comma-separated models answered with 503, to exercise fallbacks
+    seed: int = 7
+    counters: dict = field(default_factory=dict)
+
+
+def _rng(*parts) -> random.Random:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def build_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    limiter = {"window": 0, "count": 0}
+
+    def count(name: str):
+        config.counters[name] = config.counters.get(name, 0) + 1
+
+    def throttled() -> bool:
+        if config.throttle_rate and random.random() < config.throttle_rate:
+            return True
+        if config.max_rps:
+            window = int(time.monotonic())
+            if limiter["window"] != window:
+                limiter["window"], limiter["count"] = window, 0
+            limiter["count"] += 1
+            return limiter["count"] > config.max_rps
+        return False
+
+    async def openalex_delay():
+        delay = config.openalex_latency + random.uniform(-config.openalex_jitter, config.openalex_jitter)
+        if config.openalex_slow_rate and random.random() < config.openalex_slow_rate:
+            delay = config.openalex_slow_latency
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+    def make_work(term: str, page: int, index: int, since: str = "") -> dict:
+        # Works newer than a date filter are a separate, deterministic set per date
+        rng = _rng(config.seed, term, page, index, *([since] if since else []))
+        work_id = f"W{rng.randrange(10**9, 10**10)}"
+        grants = []
+        if rng.random() < config.grant_density:
+            for _ in range(rng.randint(1, 3)):
+                # Zipf-ish: a handful of funders dominate, like real results
+                funder = min(int(rng.paretovariate(1.2)) - 1, config.funder_pool - 1)
+                grant = {
+                    "funder": f"https://openalex.org/F{4320000000 + funder}",
+                    "funder_display_name": f"Funder {funder}",
+                    "award_id": f"AW-{rng.randrange(10**5, 10**6)}" if rng.random() < 0.7 else None,
+                }
+                if rng.random() < config.award_amount_rate:
+                    grant["award_amount"] = round(rng.lognormvariate(12, 1), 2)
+                grants.append(grant)
+        return {
+            "id": f"https://openalex.org/{work_id}",
+            "doi": f"https://doi.org/10.5555/{work_id.lower()}",
+            "title": f"{term.title()} {' '.join(rng.sample(WORDS, 4))}",
+            "publication_year": rng.randint(2000, 2024),
+            "publication_date": f"{rng.randint(2000, 2024)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            "updated_date": "2024-01-01T00:00:00",
+            "cited_by_count": int(rng.paretovariate(1.1) * 3),
+            "grants": grants,
+        }
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "counters": config.counters}
+
+    @app.get("/works")
+    async def works(search: str = "", per_page: int = 25, cursor: str = "*", page: int = 1, filter: str = ""):
+        count("openalex.works")
+        await openalex_delay()
+        if throttled():
+            count("openalex.429")
+            return JSONResponse({"error": "Too Many Requests"}, status_code=429, headers={"Retry-After": "1"})
+
+        page_number = 1 if cursor == "*" else int(cursor) if cursor else page
+        # from_publication_date / from_updated_date: only a fraction of the term's works are that recent
+        since = next((part.split(":", 1)[1] for part in filter.split(",") if part.startswith("from_")), "")
+        total = config.pages_per_term * per_page
+        if since:
+            total = int(total * config.new_works_fraction)
+        results = [
+            make_work(search.lower(), page_number, i, since)
+            for i in range(max(min(per_page, total - (page_number - 1) * per_page), 0))
+        ]
+        next_cursor = str(page_number + 1) if page_number * per_page < total else None
+        return {
+            "meta": {"count": total, "per_page": per_page, "next_cursor": next_cursor},
+            "results": results,
+        }
+
+    @app.get("/funders/{funder_id}")
+    async def funder(funder_id: str):
+        count("openalex.funders")
+        await openalex_delay()
+        if throttled():
+            count("openalex.429")
+            return JSONResponse({"error": "Too Many Requests"}, status_code=429, headers={"Retry-After": "1"})
+
+        rng = _rng(config.seed, funder_id)
+        index = funder_id.lstrip("F")
+        return {
+            "id": f"https://openalex.org/{funder_id}",
+            "display_name": f"Funder {int(index) - 4320000000 if index.isdigit() else index}",
+            "alternate_titles": [],
+            "country_code": rng.choice(["US", "GB", "DE", "CN", "JP"]),
+            "description": "research funding agency",
+            "homepage_url": f"https://funder{index}.example.org/",
+            "image_url": None,
+            "works_count": rng.randint(1000, 500000),
+            "cited_by_count": rng.randint(10000, 9000000),
+            "grants_count": rng.randint(100, 50000),
+        }
+
+    def completion_text(messages: List[dict]) -> str:
+        system = messages[0]["content"] if messages else ""
+        user = messages[-1]["content"] if messages else ""
+        if "search terms" in system.lower():
+            rng = _rng(config.seed, user)
+            words = [w.strip(".,;:()").lower() for w in user.split() if len(w) > 4] or WORDS
+            terms = [" ".join(rng.sample(words, min(2, len(words)))) for _ in range(8)]
+            return ", ".join(terms)
+        rng = _rng(config.seed, user[:200])
+        sections = [
+            "1. Top Funding Organizations Most Relevant to This Project",
+            "2. Typical Grant Sizes or Patterns",
+            "3. Specific Recommendations for Approaching These Funders",
+            "4. Strategic Next Steps for Grant Applications",
+        ]
+        per_section = max(config.summary_tokens // len(sections), 1)
+        body = []
+        for header in sections:
+            body.append(header)
+            body.append("- " + " ".join(rng.choice(WORDS) for _ in range(per_section)))
+        return "\n".join(body)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        count("openai.chat")
+        payload = await request.json()
+        model = payload.get("model", "gpt-4o")
+        if model in config.openai_unavailable_models.split(","):
+            count("openai.unavailable")
+            return JSONResponse({"error": {"message": f"{model} is unavailable", "type": "server_error"}}, status_code=503)
+        text = completion_text(payload.get("messages", []))
+        tokens = text.split(" ")
+        created = int(time.time())
+        completion_id = f"chatcmpl-{hashlib.sha1(text.encode()).hexdigest()[:12]}"
+
+        if not payload.get("stream"):
+            await asyncio.sleep((config.openai_latency + config.openai_token_latency * len(tokens)) / 1000)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(json.dumps(payload)) // 4, "completion_tokens": len(tokens),
+                          "total_tokens": len(json.dumps(payload)) // 4 + len(tokens)},
+            }
+
+        async def stream():
+            await asyncio.sleep(config.openai_latency / 1000)
+            for i, token in enumerate(tokens):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token if i == 0 else " " + token},
+                                 "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                count("openai.streamed_tokens")
+                await asyncio.sleep(config.openai_token_latency / 1000)
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Expose every FakeConfig knob as a --dashed-option."""
+    for name, default in asdict(FakeConfig()).items():
+        if name == "counters":
+            continue
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    fields = {k: v for k, v in asdict(FakeConfig()).items() if k != "counters"}
+    return FakeConfig(**{name: getattr(args, name) for name in fields})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAlex/OpenAI upstreams for benchmarking")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(build_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
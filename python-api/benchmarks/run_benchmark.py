@@ -0,0 +1,437 @@
+"""End-to-end load/latency benchmark for the report pipeline.
+
+Starts the fake upstreams and the API as subprocesses, drives N concurrent SSE
+clients against /generate_funding_report and writes per-stage percentiles,
+throughput and memory to a JSON file:
+
+    python -m benchmarks.run_benchmark --clients 8 --requests 4 --output bench.json
+    python -m benchmarks.run_benchmark --compare bench.json --output bench-new.json
+
+`--target discord` runs the Discord `!search` command in-process against the
+same stand-ins instead.
+
+Event loop lag (see app/loop_monitor.py) is reported for either target; with
+`--max-loop-lag SECONDS` the run fails when its p99 is higher, so CI catches
+new blocking calls:
+
+    python -m benchmarks.run_benchmark --max-loop-lag 0.05
+
+Traffic can also be captured once and replayed without any network:
+
+    python -m benchmarks.run_benchmark --upstream live --record --archive traffic.jsonl.gz
+    python -m benchmarks.run_benchmark --upstream replay --archive traffic.jsonl.gz --replay-time-scale 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from .fake_upstreams import add_arguments
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+DESCRIPTIONS = [
+    "Deep learning models for early detection of diabetic retinopathy from retinal imaging",
+    "Microbial community dynamics in permafrost soils under climate warming",
+    "Quantum error correction codes for near-term superconducting processors",
+    "Single-cell RNA sequencing of tumor microenvironments in pancreatic cancer",
+    "Robust optimization of renewable energy dispatch in distribution networks",
+    "Longitudinal cohort study of air pollution exposure and childhood asthma",
+]
+
+# Discord progress messages that mark stage boundaries of `!search`
+DISCORD_MARKERS = [
+    ("⚙️ Generating search terms", "searchTerms"),
+    ("📚 Searching papers for", "paperSearch"),
+    ("🔄 Compiling funding data", "fundingData"),
+    ("📝 Generating summary", "summary"),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def read_memory(pid: int) -> Dict[str, float]:
+    """Current and peak RSS in MB from /proc (Linux only)."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    memory[key] = int(value.split()[0]) / 1024
+    except OSError:
+        return {}
+    return {"rss_mb": memory.get("VmRSS"), "rss_peak_mb": memory.get("VmHWM")}
+
+
+def loop_lag(snapshot: dict) -> Optional[dict]:
+    """The `event_loop.lag_seconds` histogram from a metrics snapshot (`GET /metrics`)."""
+    series = snapshot.get("histograms", {}).get("event_loop.lag_seconds")
+    if not series:
+        return None
+    return {key: series[0][key] for key in ("count", "mean", "p50", "p95", "p99", "max")}
+
+
+async def wait_for(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def upstream_env(args, fake_url: Optional[str]) -> Dict[str, str]:
+    # Never let the benchmark log a real Discord bot in; an empty token disables it
+    env = {"DISCORD_BOT_TOKEN": "", "LOOP_MONITOR_INTERVAL": str(args.loop_lag_interval)}
+    if args.debug_loop:
+        env.update({"DEBUG": "true", "LOOP_BLOCK_THRESHOLD": str(args.debug_loop)})
+    if args.upstream != "live":
+        env.update({"OPENAI_API_KEY": "benchmark", "CONTACT_EMAIL": "benchmark@example.org"})
+    if args.upstream == "fake":
+        env.update({"OPENALEX_BASE_URL": fake_url, "OPENAI_BASE_URL": f"{fake_url}/v1"})
+    if args.upstream == "replay" or args.record:
+        env.update({
+            "HTTP_REPLAY_MODE": "replay" if args.upstream == "replay" else "record",
+            "HTTP_REPLAY_ARCHIVE": str(Path(args.archive).resolve()),
+            "HTTP_REPLAY_TIME_SCALE": str(args.replay_time_scale),
+        })
+    return env
+
+
+class StageTimer:
+    """Turns a stream of stage started/completed events into per-stage durations."""
+
+    def __init__(self, samples: Dict[str, List[float]]):
+        self.samples = samples
+        self.started: Dict[tuple, float] = {}
+
+    def event(self, payload: dict, now: float):
+        stage, status = payload.get("stage"), payload.get("status")
+        if not stage:
+            return
+        key = (stage, payload.get("term"))
+        if status == "started":
+            self.started[key] = now
+        elif status in ("completed", "error") and key in self.started:
+            self.samples[stage].append(now - self.started.pop(key))
+
+
+async def sse_client(client: httpx.AsyncClient, api_url: str, description: str,
+                     samples: Dict[str, List[float]], errors: List[str]):
+    timer = StageTimer(samples)
+    start = time.perf_counter()
+    first_event = None
+    try:
+        async with client.stream("GET", f"{api_url}/generate_funding_report",
+                                 params={"description": description}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                now = time.perf_counter()
+                if first_event is None:
+                    first_event = now
+                    samples["first_event"].append(now - start)
+                payload = json.loads(line[5:].strip())
+                if "error" in payload and "stage" not in payload:
+                    errors.append(payload["error"])
+                    return False
+                timer.event(payload, now)
+                if "summary" in payload and "search_terms" in payload:
+                    samples["total"].append(now - start)
+                    return True
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    return False
+
+
+class FakeContext:
+    """Minimal stand-in for a discord.py Context that timestamps every send."""
+
+    def __init__(self, channel_id: int, sent: List[tuple]):
+        self.channel = type("Channel", (), {"id": channel_id})()
+        self.guild = type("Guild", (), {"id": channel_id % 3})()
+        self.author = type("Author", (), {"id": channel_id, "name": "benchmark"})()
+        self.sent = sent
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((time.perf_counter(), content or ""))
+
+
+async def discord_client(command, channel_id: int, description: str,
+                         samples: Dict[str, List[float]], errors: List[str]):
+    sent: List[tuple] = []
+    start = time.perf_counter()
+    await command.callback(FakeContext(channel_id, sent), description=description)
+    end = time.perf_counter()
+    if any(str(content).startswith("❌") for _, content in sent):
+        errors.extend(content for _, content in sent if str(content).startswith("❌"))
+        return False
+
+    marks = []
+    for ts, content in sent:
+        for prefix, stage in DISCORD_MARKERS:
+            if str(content).startswith(prefix):
+                marks.append((ts, stage))
+    for (ts, stage), (next_ts, _) in zip(marks, marks[1:] + [(end, None)]):
+        samples[stage].append(next_ts - ts)
+    samples["first_event"].append(sent[0][0] - start if sent else end - start)
+    samples["total"].append(end - start)
+    samples["messages_sent"].append(len(sent))
+    return True
+
+
+async def drive(args, run_one) -> dict:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: List[str] = []
+    completed = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    descriptions = DESCRIPTIONS
+    if args.descriptions:
+        descriptions = [line.strip() for line in Path(args.descriptions).read_text().splitlines() if line.strip()]
+    for i in range(args.clients * args.requests):
+        queue.put_nowait(descriptions[i % len(descriptions)])
+
+    async def worker(worker_id: int):
+        nonlocal completed
+        while not queue.empty():
+            description = queue.get_nowait()
+            if await run_one(worker_id, description, samples, errors):
+                completed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.clients)))
+    wall = time.perf_counter() - start
+    return {"samples": samples, "errors": errors, "completed": completed, "wall_seconds": wall}
+
+
+async def run_api(args, fake_url: Optional[str]) -> dict:
+    port = free_port()
+    api_url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, **upstream_env(args, fake_url)}
+    # Run from an empty directory so a developer's .env never leaks real credentials into the run
+    workdir = tempfile.mkdtemp(prefix="plutus-bench-")
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", args.app, "--app-dir", str(API_DIR),
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    memory_peak = {}
+    try:
+        await wait_for(f"{api_url}/docs")
+        memory_start = read_memory(api.pid)
+
+        async def sample_memory():
+            while True:
+                current = read_memory(api.pid)
+                for key, value in current.items():
+                    if value is not None and value > memory_peak.get(key, 0):
+                        memory_peak[key] = value
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample_memory())
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            async def run_one(worker_id, description, samples, errors):
+                return await sse_client(client, api_url, description, samples, errors)
+
+            result = await drive(args, run_one)
+            result["loop_lag"] = loop_lag((await client.get(f"{api_url}/metrics")).json())
+        sampler.cancel()
+        result["memory"] = {"start": memory_start, "peak": memory_peak, "end": read_memory(api.pid)}
+        return result
+    finally:
+        api.terminate()
+        api.wait(timeout=10)
+
+
+async def run_discord(args, fake_url: Optional[str]) -> dict:
+    import tracemalloc
+
+    os.environ.update(upstream_env(args, fake_url))
+    os.chdir(tempfile.mkdtemp(prefix="plutus-bench-"))
+    sys.path.insert(0, str(API_DIR))
+    from app.config import get_settings
+    from app.loop_monitor import LoopMonitor
+    from app.metrics import metrics
+    from app.services.discord_service import DiscordBot
+
+    settings = get_settings()
+    monitor = LoopMonitor(settings.loop_monitor_interval, settings.loop_block_threshold if settings.debug else None)
+    monitor.start()
+
+    bot = DiscordBot()
+    await bot.setup_hook()
+    command = bot.get_command("search")
+
+    tracemalloc.start()
+
+    async def run_one(worker_id, description, samples, errors):
+        return await discord_client(command, 1000 + worker_id, description, samples, errors)
+
+    result = await drive(args, run_one)
+    await monitor.stop()
+    result["loop_lag"] = loop_lag(metrics.snapshot())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["memory"] = {"traced_peak_mb": peak / 2**20, "end": read_memory(os.getpid())}
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict):
+    print(f"\nCompared to {baseline['meta'].get('revision')} ({baseline['meta'].get('timestamp')}):")
+    for stage, stats in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old:
+            continue
+        for key in ("p50", "p95", "p99"):
+            if stats.get(key) and old.get(key):
+                change = (stats[key] - old[key]) / old[key] * 100
+                print(f"  {stage:>14} {key}: {old[key]*1000:9.1f}ms -> {stats[key]*1000:9.1f}ms ({change:+.1f}%)")
+    old_lag, new_lag = (baseline.get("loop_lag") or {}).get("p99"), (current.get("loop_lag") or {}).get("p99")
+    if old_lag and new_lag:
+        print(f"  event loop lag p99: {old_lag*1000:.1f}ms -> {new_lag*1000:.1f}ms")
+    old_rps, new_rps = baseline.get("throughput_rps"), current.get("throughput_rps")
+    if old_rps and new_rps:
+        print(f"  throughput: {old_rps:.2f} -> {new_rps:.2f} reports/s ({(new_rps - old_rps) / old_rps * 100:+.1f}%)")
+
+
+async def main(args):
+    runner = run_discord if args.target == "discord" else run_api
+    if args.upstream != "fake":
+        result = await runner(args, None)
+        upstream_counters = {}
+    else:
+        fake_port = free_port()
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        fake_args = []
+        for name, value in vars(args).items():
+            if name in FAKE_OPTIONS:
+                fake_args += [f"--{name.replace('_', '-')}", str(value)]
+        fake = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_upstreams", "--port", str(fake_port), *fake_args],
+            cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            await wait_for(f"{fake_url}/health")
+            result = await runner(args, fake_url)
+            async with httpx.AsyncClient() as client:
+                upstream_counters = (await client.get(f"{fake_url}/health")).json()["counters"]
+        finally:
+            fake.terminate()
+            fake.wait(timeout=10)
+
+    samples = result["samples"]
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "target": args.target,
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "completed": result["completed"],
+        "errors": len(result["errors"]),
+        "error_samples": result["errors"][:10],
+        "wall_seconds": result["wall_seconds"],
+        "throughput_rps": result["completed"] / result["wall_seconds"] if result["wall_seconds"] else None,
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "memory": result["memory"],
+        "loop_lag": result["loop_lag"],
+        "upstream_calls": upstream_counters,
+    }
+
+    print(f"{report['completed']} reports in {report['wall_seconds']:.2f}s "
+          f"({report['throughput_rps']:.2f}/s), {report['errors']} errors")
+    for stage, stats in report["stages"].items():
+        if stats["p50"] is None:
+            continue
+        scale, unit = (1, "") if stage == "messages_sent" else (1000, "ms")
+        print(f"  {stage:>14}: p50 {stats['p50']*scale:9.1f}{unit}  p95 {stats['p95']*scale:9.1f}{unit}  "
+              f"p99 {stats['p99']*scale:9.1f}{unit}  (n={stats['count']})")
+    lag = report["loop_lag"]
+    if lag:
+        print(f"  event loop lag: p50 {lag['p50']*1000:.1f}ms  p99 {lag['p99']*1000:.1f}ms  "
+              f"max {lag['max']*1000:.1f}ms  (n={lag['count']})")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+    if args.max_loop_lag is not None and lag and lag["p99"] > args.max_loop_lag:
+        print(f"Event loop lag p99 {lag['p99']*1000:.1f}ms is over --max-loop-lag {args.max_loop_lag*1000:.1f}ms")
+        sys.exit(1)
+
+
+FAKE_OPTIONS = set()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PlutusAI end-to-end benchmark")
+    parser.add_argument("--target", choices=["api", "discord"], default="api")
+    parser.add_argument("--app", default="app.main:app", help="ASGI app to benchmark")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=3, help="reports per client")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--descriptions", help="file with one project description per line")
+    parser.add_argument("--upstream", choices=["fake", "live", "replay"], default="fake",
+                        help="local stand-ins, the real APIs, or a recorded archive")
+    parser.add_argument("--record", action="store_true", help="record upstream traffic into --archive")
+    parser.add_argument("--archive", default="http_archive.jsonl.gz")
+    parser.add_argument("--replay-time-scale", type=float, default=1.0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    parser.add_argument("--loop-lag-interval", type=float, default=0.05, help="seconds between event loop lag samples")
+    parser.add_argument("--max-loop-lag", type=float, help="fail when the event loop lag p99 is over this many seconds")
+    parser.add_argument("--debug-loop", type=float, metavar="SECONDS",
+                        help="log the stack of anything blocking the event loop for longer than this")
+    before = {action.dest for action in parser._actions}
+    add_arguments(parser)
+    FAKE_OPTIONS.update({action.dest for action in parser._actions} - before)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""Cold-start measurement for the API.
+
+Reports, over several fresh interpreter runs, how long `import <module>` takes
+and how long uvicorn needs from process spawn to the first successful
+response, which is what an autoscaled instance pays before serving traffic:
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from .run_benchmark import API_DIR, free_port, git_revision, summarize
+
+IMPORT_SNIPPET = (
+    "import sys, time; sys.path.insert(0, {api_dir!r}); t = time.perf_counter(); "
+    "import {module}; print(time.perf_counter() - t)"
+)
+
+# Minimal environment: no Discord, dummy credentials, nothing read from a developer's .env
+ENV = {"OPENAI_API_KEY": "startup", "CONTACT_EMAIL": "startup@example.org", "DISCORD_BOT_TOKEN": ""}
+
+
+def measure_import(module: str, workdir: str) -> float:
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(api_dir=str(API_DIR), module=module)],
+        cwd=workdir, env={**os.environ, **ENV}, stderr=subprocess.DEVNULL,
+    )
+    return float(output.decode().strip().splitlines()[-1])
+
+
+async def measure_first_response(app: str, path: str, workdir: str) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--app-dir", str(API_DIR), "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env={**os.environ, **ENV}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient() as client:
+            while True:
+                try:
+                    response = await client.get(f"http://127.0.0.1:{port}{path}")
+                    if response.status_code < 500:
+                        return time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None:
+                    raise RuntimeError(f"{app} exited with status {server.returncode}")
+                await asyncio.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="plutus-startup-")
+    module = args.app.split(":")[0]
+    imports = [measure_import(module, workdir) for _ in range(args.runs)]
+    first_response = [await measure_first_response(args.app, args.path, workdir) for _ in range(args.runs)]
+    report = {
+        "meta": {"revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "app": args.app},
+        "import_seconds": summarize(imports),
+        "first_response_seconds": summarize(first_response),
+    }
+    print(f"{args.app}: import p50 {report['import_seconds']['p50']*1000:.0f}ms, "
+          f"spawn to first response p50 {report['first_response_seconds']['p50']*1000:.0f}ms "
+          f"({args.runs} runs)")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API cold start")
+    parser.add_argument("--app", default="app.main:app")
+    parser.add_argument("--path", default="/health", help="endpoint polled until the server answers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write results JSON here")
+    asyncio.run(main(parser.parse_args()))
@@ -1,17 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import requests
-from typing import List, Dict
-from openai import AsyncOpenAI, RateLimitError
-from time import sleep
-import json
-import os
+
+from app.config import get_settings
+from app.dependencies import get_openai_service, get_openalex_service, select_report_format, select_term_extractor
+from app.main import generate_funding_reports, get_metrics, lifespan
+from app.models import ProjectDescription
+from app.pipeline import NoPapersError, ReportError, ReportPipeline, format_report
+from app.serialization import FastJSONResponse
 
 app = FastAPI(
     title="PlutusAI API",
     description="API for PlutusAI Research Funding Assistant",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Configure CORS
@@ -23,15 +25,6 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# OpenAI and OpenAlex configuration
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
-print(f"API Key starts with: {OPENAI_API_KEY[:10]}...")  # Debug print - only show first few chars
-
-client = AsyncOpenAI()  # Will automatically use OPENAI_API_KEY from environment
-OPENALEX_API_URL = "https://api.openalex.org/works"
-
 @app.get("/")
 async def root():
     """Root endpoint to verify API is running"""
@@ -50,12 +43,12 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     try:
-        # Test OpenAI connection
-        api_key_status = "valid" if OPENAI_API_KEY else "missing"
+        openai_api_key = get_settings().openai_api_key
+        api_key_status = "valid" if openai_api_key else "missing"
         return {
             "status": "healthy",
             "openai_api_key": api_key_status,
-            "key_starts_with": OPENAI_API_KEY[:10] if OPENAI_API_KEY else None
+            "key_starts_with": openai_api_key[:10] if openai_api_key else None
         }
     except Exception as e:
         return {
@@ -63,120 +56,38 @@ async def health_check():
             "error": str(e)
         }
 
-class ProjectDescription(BaseModel):
-    description: str
-    max_results: int = 50  # Allow customizing result size
-
-class FundingData(BaseModel):
-    funder_name: str
-    funder_id: str
-    award_id: str | None
-    award_amount: float | None
-    paper_title: str
-    paper_doi: str
-
 @app.post("/generate_funding_report")
-async def generate_funding_report(project: ProjectDescription):
+async def generate_funding_report(
+    project: ProjectDescription,
+    openai_service=Depends(get_openai_service),
+    openalex_service=Depends(get_openalex_service),
+    term_extractor=Depends(select_term_extractor),
+    report_format: str = Depends(select_report_format),
+):
+    """Same pipeline as the SSE endpoint in app.main, returned as a single JSON report"""
+    settings = get_settings()
+    pipeline = ReportPipeline.for_total_results(
+        openai_service,
+        openalex_service,
+        project.max_results,
+        speculative=settings.speculative_prefetch,
+        speculative_overlap=settings.speculative_overlap,
+        term_extractor=term_extractor,
+        deadline_seconds=settings.report_deadline,
+        stage_budgets=settings.stage_budgets
+    )
     try:
-        search_terms = await extract_search_terms(project.description)
-        funders_data = await search_openalex_for_grants(search_terms, project.max_results)
-        
-        summary = await generate_summary(project.description, funders_data)
-        
-        result = {
-            "search_terms": search_terms,
-            "funders_data": funders_data,
-            "summary": summary
-        }
-        
-        return result
-
-    except Exception as e:
+        report = await pipeline.run(project.description)
+    except NoPapersError as e:
+        # Nothing found is a valid (empty) report, not a server error
+        report = e.empty_report()
+    except ReportError as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return FastJSONResponse(format_report(report, report_format))
 
-async def extract_search_terms(description: str) -> List[str]:
-    """Uses OpenAI to extract relevant search terms with better prompt."""
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": """Extract 5-10 highly relevant search terms for academic research funding.
-                Focus on specific technical terms and methodologies that funding agencies typically look for."""},
-                {"role": "user", "content": description}
-            ]
-        )
-        return [term.strip() for term in response.choices[0].message.content.split(",")]
-    except RateLimitError:
-        sleep(1)  # Basic rate limit handling
-        return await extract_search_terms(description)
-
-async def search_openalex_for_grants(search_terms: List[str], max_results: int) -> List[Dict]:
-    """Enhanced OpenAlex search with better filtering and rate limiting."""
-    funders_data = []
-    papers_found = 0
-    
-    for term in search_terms:
-        if papers_found >= max_results:
-            break
-            
-        page = 1
-        while papers_found < max_results:
-            params = {
-                "search": term,
-                "per_page": 50,
-                "page": page,
-                "sort": "cited_by_count:desc"  # Get influential papers first
-            }
-            
-            try:
-                response = requests.get(OPENALEX_API_URL, params=params)
-                response.raise_for_status()
-                works = response.json().get("results", [])
-                
-                if not works:
-                    break
-                    
-                for work in works:
-                    if "grants" in work and work["grants"]:
-                        funders_data.append({
-                            "title": work.get("title"),
-                            "grants": work.get("grants"),
-                            "doi": work.get("doi"),
-                            "cited_by_count": work.get("cited_by_count"),
-                            "publication_year": work.get("publication_year")
-                        })
-                        papers_found += 1
-                        
-                        if papers_found >= max_results:
-                            break
-                
-                page += 1
-                sleep(0.1)  # Rate limiting
-                
-            except requests.exceptions.RequestException as e:
-                print(f"Error fetching data for term {term}: {e}")
-                break
-                
-    return funders_data
-
-async def generate_summary(description: str, funders_data):
-    """Uses OpenAI to summarize findings and recommend next steps."""
-    prompt = f"""
-    Project Description: {description}
-    
-    Funding Sources Identified:
-    {funders_data}
-    
-    Provide an insightful summary on potential next steps for acquiring funding based on this data.
-    """
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Summarize funding insights and provide next steps for grant acquisition."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return response.choices[0].message.content
+# Batch reports and metrics are shared with app.main
+app.add_api_route("/generate_funding_reports", generate_funding_reports, methods=["POST"])
+app.add_api_route("/metrics", get_metrics, methods=["GET"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,6 @@
+import os
+
+# Settings the app requires; tests never reach the real upstreams or Discord
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CONTACT_EMAIL", "test@example.com")
+os.environ["DISCORD_BOT_TOKEN"] = ""
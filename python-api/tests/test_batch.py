@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from app.models import BatchProjectDescriptions, Grant, Work
+from app.pipeline import ReportPipeline
+from app.services.term_extractors import TermExtractor
+
+
+class Terms(TermExtractor):
+    async def stream_terms(self, description, max_terms):
+        yield description
+
+
+class OpenAlex:
+    async def search_for_grants(self, terms, max_results, deadline=None):
+        return [Work(id=f"W-{terms[0]}", grants=[Grant(funder="F1", funder_display_name="NIH")])]
+
+    async def enrich_funders_data(self, works, deadline=None):
+        return works
+
+
+class OpenAI:
+    """The summary for "fast" is instant; the others take a minute."""
+
+    def __init__(self):
+        self.cancelled = 0
+
+    async def generate_summary(self, description, works, stats):
+        if description != "fast":
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return f"Summary of {description}"
+
+
+def test_closing_a_batch_cancels_the_summaries_still_running():
+    openai = OpenAI()
+    pipeline = ReportPipeline(openai, OpenAlex(), term_extractor=Terms())
+
+    async def main():
+        reports = pipeline.batch(["slow", "fast", "slower"])
+        first = await reports.__anext__()
+        await reports.aclose()  # The NDJSON client went away
+        # Checked before asyncio.run cancels whatever is left over
+        return first, openai.cancelled
+
+    first, cancelled = asyncio.run(main())
+    assert first["summary"] == "Summary of fast"
+    assert cancelled == 2
+
+
+@pytest.mark.parametrize("body", [
+    {"descriptions": ["ok"], "max_results_per_term": -5},
+    {"descriptions": ["ok"], "max_results_per_term": 0},
+    {"descriptions": ["ok", "  "]},
+    {"descriptions": [""]},
+])
+def test_invalid_batches_are_rejected(body):
+    with pytest.raises(ValidationError):
+        BatchProjectDescriptions(**body)
+
+
+def test_valid_batch():
+    assert BatchProjectDescriptions(descriptions=["crispr"]).max_results_per_term == 10
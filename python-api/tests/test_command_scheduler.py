@@ -0,0 +1,87 @@
+import asyncio
+
+from app.services.command_scheduler import CommandScheduler
+
+
+def test_channel_runs_commands_one_at_a_time_in_order():
+    async def main():
+        scheduler = CommandScheduler(max_concurrent=4, guild_limit=4)
+        log = []
+
+        def command(name):
+            async def call():
+                log.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                log.append(f"{name} end")
+            return call
+
+        await asyncio.gather(*(scheduler.run("guild", "channel", "ask", command(n)) for n in ("a", "b", "c")))
+        return log
+
+    assert asyncio.run(main()) == ["a start", "a end", "b start", "b end", "c start", "c end"]
+
+
+def test_guild_limit_and_round_robin_between_guilds():
+    async def main():
+        scheduler = CommandScheduler(max_concurrent=2, guild_limit=1)
+        started = []
+        release = asyncio.Event()
+
+        def command(name):
+            async def call():
+                started.append(name)
+                await release.wait()
+            return call
+
+        # Guild "busy" queues three commands before "quiet" queues one
+        jobs = [scheduler.submit("busy", f"busy-{n}", "ask", command(f"busy-{n}")) for n in range(3)]
+        jobs.append(scheduler.submit("quiet", "quiet-0", "ask", command("quiet-0")))
+        await asyncio.sleep(0)
+        running = list(started)
+        release.set()
+        await asyncio.gather(*(job.future for job in jobs))
+        return running, started
+
+    running, started = asyncio.run(main())
+    # One per guild at a time, so the quiet guild isn't stuck behind the busy one
+    assert running == ["busy-0", "quiet-0"]
+    assert started == ["busy-0", "quiet-0", "busy-1", "busy-2"]
+
+
+def test_new_search_supersedes_the_running_one():
+    async def main():
+        scheduler = CommandScheduler()
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        async def fast():
+            return None
+
+        first = asyncio.create_task(scheduler.run("guild", "channel", "search", slow, supersede=True))
+        await asyncio.sleep(0)
+        second = await scheduler.run("guild", "channel", "search", fast, supersede=True)
+        await asyncio.sleep(0)  # The finished job frees its slot in a done callback
+        return await first, second, scheduler.running
+
+    first, second, running = asyncio.run(main())
+    assert first is False
+    assert second is True
+    assert running == 0
+
+
+def test_position_of_queued_jobs():
+    async def main():
+        scheduler = CommandScheduler(max_concurrent=1)
+        release = asyncio.Event()
+        running = scheduler.submit("a", "a-1", "ask", release.wait)
+        queued = [
+            scheduler.submit("a", "a-2", "ask", release.wait),
+            scheduler.submit("b", "b-1", "ask", release.wait),
+        ]
+        positions = [scheduler.position(job) for job in [running, *queued]]
+        release.set()
+        await asyncio.gather(*(job.future for job in [running, *queued]))
+        return positions
+
+    assert asyncio.run(main()) == [0, 1, 2]
@@ -0,0 +1,79 @@
+from app.models import Grant, Work
+from app.services.funder_stats import compute_funder_stats, format_funder_stats_for_summary, funder_picture_changes
+
+
+def work(work_id, year, citations, *grants):
+    return Work(id=work_id, title=f"Paper {work_id}", publication_year=year, cited_by_count=citations, grants=list(grants))
+
+
+def grant(funder, name, award_id=None, amount=None):
+    return Grant(funder=funder, funder_display_name=name, award_id=award_id, award_amount=amount)
+
+
+WORKS = [
+    work("W1", 2020, 10, grant("F1", "NIH", "A1", 100.0), grant("F1", "NIH", "A2")),
+    work("W2", 2021, 30, grant("F1", "NIH", amount=300.0), grant("F2", "NSF", "B1")),
+    work("W3", 2022, 5, grant("F2", "NSF")),
+    work("W4", None, 1, Grant(funder_display_name="Wellcome Trust")),
+]
+
+
+def test_counts_and_ranking():
+    stats = compute_funder_stats(WORKS)
+    assert (stats["total_works"], stats["total_grants"], stats["total_funders"]) == (4, 6, 3)
+    nih, nsf, wellcome = stats["funders"]
+    assert (nih["name"], nsf["name"], wellcome["name"]) == ("NIH", "NSF", "Wellcome Trust")
+    # NIH funds W1 twice: three grants, but two works and their citations counted once
+    assert (nih["grants"], nih["works"], nih["share"]) == (3, 2, 0.5)
+    assert nih["citations"] == {"total": 40, "median": 10.0, "p90": 10.0}
+    assert nih["grants_with_award_id"] == 2
+    assert nih["award_amounts"]["count"] == 2
+    assert nih["award_amounts"]["total"] == 400.0
+    assert nsf["award_amounts"] is None
+    assert [paper["title"] for paper in nih["top_papers"]] == ["Paper W2", "Paper W1"]
+
+
+def test_years():
+    stats = compute_funder_stats(WORKS)
+    nih, nsf, wellcome = stats["funders"]
+    assert nih["years"] == {"first": 2020, "last": 2021, "histogram": {"2020": 1, "2021": 1}}
+    assert nsf["years"]["histogram"] == {"2021": 1, "2022": 1}
+    assert wellcome["years"] == {"first": None, "last": None, "histogram": {}}
+    assert stats["years"] == {"2020": 1, "2021": 2, "2022": 1}
+
+
+def test_top_n_and_no_grants():
+    assert [f["name"] for f in compute_funder_stats(WORKS, top_n=1)["funders"]] == ["NIH"]
+    assert compute_funder_stats([work("W1", 2020, 3)]) == {
+        "total_works": 1, "total_grants": 0, "total_funders": 0, "funders": [], "years": {}
+    }
+
+
+def test_summary_text_mentions_every_funder():
+    text = format_funder_stats_for_summary(compute_funder_stats(WORKS))
+    assert text.startswith("Funding Organizations Analysis (4 funded papers, 6 grants, 3 funders):")
+    for name in ("NIH", "NSF", "Wellcome Trust"):
+        assert f"\n{name}\n" in text
+
+
+def stats(*shares):
+    return {"funders": [{"name": name, "share": share} for name, share in shares]}
+
+
+def test_picture_unchanged_by_growth_alone():
+    assert funder_picture_changes(stats(("NIH", 0.5), ("NSF", 0.3)), stats(("NIH", 0.52), ("NSF", 0.29))) == []
+
+
+def test_picture_changes():
+    changes = funder_picture_changes(stats(("NIH", 0.5), ("NSF", 0.3)), stats(("NSF", 0.45), ("NIH", 0.4), ("ERC", 0.1)))
+    assert changes == [
+        "Leading funder is now NSF (was NIH)",
+        "New among the top 5 funders: ERC",
+        "NIH: 50% -> 40% of grants",
+        "NSF: 30% -> 45% of grants",
+        "ERC: 0% -> 10% of grants",
+    ]
+
+
+def test_picture_from_nothing():
+    assert funder_picture_changes({}, stats(("NIH", 1.0)))[0] == "Leading funder is now NIH"
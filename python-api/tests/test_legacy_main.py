@@ -0,0 +1,56 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.dependencies import get_openai_service, get_openalex_service, select_term_extractor
+from app.services.term_extractors import TermExtractor
+
+
+class Terms(TermExtractor):
+    async def stream_terms(self, description, max_terms):
+        yield "crispr"
+
+
+class OpenAlex:
+    def __init__(self, fail):
+        self.fail = fail
+
+    async def search_for_grants(self, terms, max_results, deadline=None):
+        if self.fail:
+            raise RuntimeError("OpenAlex is down")
+        return []
+
+    async def enrich_funders_data(self, works, deadline=None):
+        return works
+
+
+class OpenAI:
+    async def generate_summary(self, description, works, stats):
+        return "Written summary"
+
+
+@pytest.fixture
+def client():
+    def using(fail):
+        main.app.dependency_overrides.update({
+            get_openai_service: OpenAI,
+            get_openalex_service: lambda: OpenAlex(fail),
+            select_term_extractor: Terms,
+        })
+        return TestClient(main.app)
+    yield using
+    main.app.dependency_overrides.clear()
+
+
+def test_no_papers_is_an_empty_report(client):
+    response = client(fail=False).post("/generate_funding_report", json={"description": "gene editing"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["search_terms"] == ["crispr"]
+    assert body["funders_data"] == []
+    assert body["funder_stats"]["total_works"] == 0
+
+
+def test_failed_searches_are_still_a_server_error(client):
+    response = client(fail=True).post("/generate_funding_report", json={"description": "gene editing"})
+    assert response.status_code == 500
@@ -0,0 +1,42 @@
+import asyncio
+
+from app.services.openai_service import OpenAIService
+
+
+def service_streaming(deltas, consumed):
+    """An OpenAIService whose search-terms stream yields `deltas`, recording how many were read."""
+    service = OpenAIService.__new__(OpenAIService)
+
+    async def stream(stage, messages, **kwargs):
+        for delta in deltas:
+            consumed.append(delta)
+            yield delta
+
+    service._stream = stream
+    return service
+
+
+def stream_terms(deltas, max_terms):
+    consumed = []
+
+    async def main():
+        service = service_streaming(deltas, consumed)
+        return [term async for term in service.stream_search_terms("description", max_terms)]
+
+    return asyncio.run(main()), consumed
+
+
+def test_terms_split_on_commas_across_deltas():
+    terms, _ = stream_terms(["1. gene ed", "iting, CRIS", "PR,  base editing"], 5)
+    assert terms == ["gene editing", "CRISPR", "base editing"]
+
+
+def test_duplicates_and_blanks_skipped():
+    terms, _ = stream_terms(["CRISPR, crispr,, gene editing,", " CRISPR"], 5)
+    assert terms == ["CRISPR", "gene editing"]
+
+
+def test_generation_cut_off_at_max_terms():
+    terms, consumed = stream_terms(["a, b,", " c, d,", " e, f"], 2)
+    assert terms == ["a", "b"]
+    assert consumed == ["a, b,"]
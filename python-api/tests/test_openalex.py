@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.models import Grant, Work
+from app.services.openalex import DeadlineExceeded, FunderSaturation, LatencyWindow, OpenAlexService, work_record
+
+
+def papers(*funders):
+    return [Work(id=f"W{i}", grants=[Grant(funder=funder)]) for i, funder in enumerate(funders)]
+
+
+def test_saturation_after_patience_pages_without_new_funders():
+    saturation = FunderSaturation(patience=2)
+    assert not saturation.observe(papers("F1", "F2"))
+    assert not saturation.observe(papers("F1"))
+    assert not saturation.observe(papers("F3"))  # A new funder resets the count
+    assert not saturation.observe(papers("F2"))
+    assert saturation.observe(papers("F3", "F1"))
+    assert saturation.funders == {"F1", "F2", "F3"}
+
+
+def test_saturation_disabled_and_empty_pages():
+    disabled = FunderSaturation(patience=0)
+    assert not any(disabled.observe(papers("F1")) for _ in range(5))
+    # Pages before the first funder don't count towards saturation
+    waiting = FunderSaturation(patience=1)
+    assert not waiting.observe([])
+    assert not waiting.observe(papers("F1"))
+    assert waiting.observe([])
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100)
+    assert window.percentile(0.95) is None
+    for ms in range(1, 101):
+        window.add(ms / 1000)
+    assert len(window) == 100
+    assert window.percentile(0.95) == 0.096
+    assert window.percentile(1.0) == 0.1
+    # Only the most recent `size` samples count
+    for _ in range(100):
+        window.add(1.0)
+    assert window.percentile(0.5) == 1.0
+
+
+def service(hedging=True, min_samples=3):
+    openalex = OpenAlexService()
+    openalex.base_url = "http://openalex.test"
+    openalex.request_timeout = 5.0
+    openalex.hedging = hedging
+    openalex.hedge_percentile = 0.95
+    openalex.hedge_min_samples = min_samples
+    for _ in range(min_samples):
+        openalex._latency["works"].add(0.05)
+    return openalex
+
+
+def slow_first_request(delay):
+    """Transport whose first request takes `delay` seconds and later ones answer at once."""
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        if len(requests) == 1:
+            await asyncio.sleep(delay)
+            return httpx.Response(200, json={"answer": "primary"})
+        return httpx.Response(200, json={"answer": "hedge"})
+
+    return httpx.MockTransport(handler), requests
+
+
+def get(openalex, transport, deadline=None):
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await openalex._get(client, "works", f"{openalex.base_url}/works", deadline=deadline)
+    return asyncio.run(main())
+
+
+def test_slow_request_is_hedged_after_p95():
+    transport, requests = slow_first_request(1.0)
+    started = time.monotonic()
+    response = get(service(), transport)
+    assert response.json() == {"answer": "hedge"}
+    assert len(requests) == 2
+    assert time.monotonic() - started < 0.5
+
+
+@pytest.mark.parametrize("hedging, samples_needed", [(False, 3), (True, 4)])
+def test_no_hedge_when_disabled_or_too_few_samples(hedging, samples_needed):
+    openalex = service(hedging)
+    openalex.hedge_min_samples = samples_needed
+    transport, requests = slow_first_request(0.2)
+    assert get(openalex, transport).json() == {"answer": "primary"}
+    assert len(requests) == 1
+
+
+def test_no_time_left_before_the_request():
+    transport, requests = slow_first_request(0)
+    with pytest.raises(DeadlineExceeded):
+        get(service(), transport, deadline=time.monotonic() - 1)
+    assert requests == []
+
+
+def test_deadline_covers_a_slowly_trickling_response():
+    async def trickle():
+        for _ in range(20):
+            await asyncio.sleep(0.1)  # Each read is quick enough for httpx's per-read timeout
+            yield b" "
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=trickle()))
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        get(service(hedging=False), transport, deadline=started + 0.3)
+    assert time.monotonic() - started < 1.0
+
+
+def test_work_record_keeps_the_report_fields_only():
+    work = Work(id="W1", doi="https://doi.org/10.1/x", title="T", publication_year=2020, cited_by_count=3,
+                grants=[Grant(funder="F1")], abstract="dropped")
+    record = work_record(work)
+    assert record.id == "https://openalex.org/W1"
+    assert record.model_dump(exclude_unset=True, exclude={"grants"}) == {
+        "id": "https://openalex.org/W1", "doi": "https://doi.org/10.1/x", "title": "T",
+        "publication_year": 2020, "cited_by_count": 3
+    }
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models import Funder, Grant, Work
+from app.pipeline import DEFAULT_STAGE_BUDGETS, ReportPipeline, compact_report, earliest, format_report, seconds_left
+from app.serialization import Encoded
+from app.services.saved_reports import FULL_REFRESH_SINCE, MAX_SAVED_WORKS
+
+NIH = Funder(id="https://openalex.org/F1", display_name="NIH", works_count=10, cited_by_count=100)
+
+
+def report():
+    return {
+        "search_terms": ["crispr"],
+        "summary": "Summary",
+        "funder_stats": {"total_works": 2},
+        "funders_data": [
+            Work.model_construct(id="W1", title="One", grants=[
+                Grant(funder=NIH.id, funder_display_name="NIH", award_id="A1", funder_details=NIH),
+                Grant(funder="https://openalex.org/F2", funder_display_name="NSF"),
+            ]),
+            Work.model_construct(id="W2", title="Two", grants=[Grant(funder=NIH.id, funder_display_name="NIH")]),
+        ],
+    }
+
+
+def test_compact_report_lists_each_funder_once():
+    compact = compact_report(report())
+    assert isinstance(compact, Encoded)
+    assert compact["format"] == "compact"
+    assert "funders_data" not in compact
+    assert compact["summary"] == "Summary"
+    assert [funder.get("display_name") for funder in compact["funders"]] == ["NIH", "NSF"]
+    assert compact["funders"][0] == NIH.model_dump(mode="json")
+    assert compact["funders"][1] == {"id": "https://openalex.org/F2", "display_name": "NSF"}
+    assert compact["works"] == [
+        {"id": "W1", "title": "One", "grants": [{"award_id": "A1", "funder": 0}, {"funder": 1}]},
+        {"id": "W2", "title": "Two", "grants": [{"funder": 0}]},
+    ]
+
+
+def test_format_report():
+    full = report()
+    assert format_report(full) is full
+    assert format_report(full, "compact")["format"] == "compact"
+    # Progress events and errors pass through whatever the format
+    event = {"stage": "summary", "status": "started"}
+    assert format_report(event, "compact") is event
+
+
+def pipeline(**budgets):
+    return ReportPipeline(openai_service=None, openalex_service=None, stage_budgets=budgets)
+
+
+def test_stage_deadline():
+    assert pipeline()._stage_deadline("fundingData", 100.0) == 100.0 + DEFAULT_STAGE_BUDGETS["fundingData"]
+    assert pipeline(fundingData=5)._stage_deadline("fundingData", 100.0) == 105.0
+    assert pipeline(fundingData=None)._stage_deadline("fundingData", 100.0) is None
+
+
+@pytest.mark.parametrize("budgets, deadline, expected", [
+    ({"searchTerms": 20, "paperSearch": 60}, None, 180.0),
+    # The paper search budget runs on from the terms budget...
+    ({"searchTerms": 20, "paperSearch": 60}, 150.0, 150.0),
+    # ...or from the start, when terms have no budget
+    ({"searchTerms": None, "paperSearch": 60}, None, 160.0),
+    ({"searchTerms": 20, "paperSearch": None}, None, None),
+    ({"searchTerms": None, "paperSearch": None}, 150.0, 150.0),
+])
+def test_crawl_deadline(budgets, deadline, expected):
+    p = pipeline(**budgets)
+    start = 100.0
+    assert p._crawl_deadline(deadline, p._stage_deadline("searchTerms", start), start) == expected
+
+
+def test_deadline_helpers():
+    assert earliest(None, 5.0, 3.0) == 3.0
+    assert earliest(None, None) is None
+    assert seconds_left(None) is None
+    assert seconds_left(time.monotonic() - 1) == 0.0
+    assert 9 < seconds_left(time.monotonic() + 10) <= 10
+
+
+def test_results_spread_across_terms():
+    assert pipeline().max_results_per_term == 10
+    assert ReportPipeline.for_total_results(None, None, 50, max_terms=3).max_results_per_term == 17
+
+
+class FakeOpenAlex:
+    def __init__(self, works_per_term):
+        self.works_per_term = works_per_term
+        self.limits = []
+
+    async def search_since(self, terms, since, limit, deadline=None):
+        self.limits.append(limit)
+        return {term: [Work(id=f"{term}{i}") for i in range(min(self.works_per_term, limit))] for term in terms}
+
+    async def enrich_funders_data(self, works, deadline=None):
+        return works
+
+
+def saved(last_run):
+    return {"description": "d", "search_terms": ["a", "b"], "funders_data": [], "funder_stats": {},
+            "summary": "Saved summary", "last_run": last_run}
+
+
+@pytest.mark.parametrize("works_per_term, last_run, limit, partial", [
+    (3, "2024-01-01", MAX_SAVED_WORKS, []),
+    # A term with as many new works as a saved report keeps may have more: don't move last_run on
+    (MAX_SAVED_WORKS + 1, "2024-01-01", MAX_SAVED_WORKS, ["paperSearch"]),
+    # A full refresh redoes the first run's capped search
+    (MAX_SAVED_WORKS + 1, FULL_REFRESH_SINCE, 10, []),
+])
+def test_refresh_partial_when_new_works_hit_the_cap(works_per_term, last_run, limit, partial):
+    openalex = FakeOpenAlex(works_per_term)
+    p = ReportPipeline(openai_service=None, openalex_service=openalex)
+    report = asyncio.run(p.refresh(saved(last_run)))
+    assert openalex.limits == [limit]
+    assert report["partial"] == partial
+    assert report["refresh"]["fetched_works"] == 2 * min(works_per_term, limit)
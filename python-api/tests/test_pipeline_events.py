@@ -0,0 +1,122 @@
+import asyncio
+
+from app.models import Grant, Work
+from app.pipeline import ReportPipeline, is_final, stats_only_summary
+from app.services.funder_stats import compute_funder_stats
+from app.services.term_extractors import TermExtractor
+
+WORKS = [Work(id="W1", title="One", cited_by_count=1, grants=[Grant(funder="F1", funder_display_name="NIH")])]
+
+
+class Terms(TermExtractor):
+    def __init__(self, *terms):
+        self.terms = terms
+
+    async def stream_terms(self, description, max_terms):
+        for term in self.terms[:max_terms]:
+            yield term
+
+
+class OpenAlex:
+    """Searches for "slow" never finish; any other term finds WORKS."""
+
+    def __init__(self):
+        self.cancelled = []
+
+    async def search_for_grants(self, terms, max_results, deadline=None):
+        if terms == ["slow"]:
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                self.cancelled.append("search")
+                raise
+        return list(WORKS)
+
+    async def enrich_funders_data(self, works, deadline=None):
+        return works
+
+
+class OpenAI:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.cancelled = []
+
+    async def generate_summary(self, description, works, stats):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append("summary")
+            raise
+        return "Written summary"
+
+
+def pipeline(terms, openai=None, **budgets):
+    return ReportPipeline(openai or OpenAI(), OpenAlex(), term_extractor=Terms(*terms), stage_budgets=budgets)
+
+
+def test_closing_the_stream_cancels_outstanding_searches():
+    report = pipeline(["fast", "slow"])
+
+    async def main():
+        events = report.events("description")
+        async for event in events:
+            if event.get("stage") == "paperSearch" and event.get("status") == "completed":
+                break  # The client disconnects while "slow" is still being searched
+        await events.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert report.openalex_service.cancelled == ["search"]
+
+
+def test_disconnect_during_the_summary_cancels_it():
+    openai = OpenAI(delay=60)
+    report = pipeline(["fast"], openai)
+
+    async def consume(summary_started: asyncio.Event):
+        async for event in report.events("description"):
+            if event.get("stage") == "summary" and event.get("status") == "started":
+                summary_started.set()
+
+    async def main():
+        summary_started = asyncio.Event()
+        client = asyncio.create_task(consume(summary_started))
+        await summary_started.wait()
+        await asyncio.sleep(0.01)
+        client.cancel()  # What the SSE response does when its client goes away
+        await asyncio.gather(client, return_exceptions=True)
+
+    asyncio.run(main())
+    assert openai.cancelled == ["summary"]
+
+
+def test_exhausted_summary_budget_gives_a_partial_report_with_statistics_only():
+    report = pipeline(["fast"], OpenAI(delay=60), summary=0.05)
+
+    async def main():
+        return [event async for event in report.events("description")]
+
+    events = asyncio.run(main())
+    final = events[-1]
+    assert is_final(final)
+    assert final["partial"] == ["summary"]
+    assert final["summary"] == stats_only_summary(compute_funder_stats(WORKS))
+    assert {"stage": "summary", "status": "completed", "partial": True} in events
+
+
+def test_exhausted_search_terms_budget_falls_back_to_local_keyphrases():
+    class SlowTerms(TermExtractor):
+        async def stream_terms(self, description, max_terms):
+            await asyncio.sleep(60)
+            yield "never"
+
+    report = ReportPipeline(OpenAI(), OpenAlex(), term_extractor=SlowTerms(), stage_budgets={"searchTerms": 0.05})
+
+    async def main():
+        return [event async for event in report.events("gene editing of drought tolerant crops")]
+
+    final = asyncio.run(main())[-1]
+    assert is_final(final)
+    assert final["partial"] == ["searchTerms"]
+    assert final["search_terms"] and "never" not in final["search_terms"]
+    assert final["summary"] == "Written summary"
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.dependencies import require_saved_report_store
+from app.main import app
+from app.models import Funder, Grant, Work
+from app.pipeline import format_report
+from app.serialization import to_json
+from app.services.openalex import work_record
+from app.services.saved_reports import MAX_SAVED_WORKS, SavedReportStore, merge_works
+
+
+def test_refetched_work_replaces_saved_copy():
+    saved = [Work(id="W1", cited_by_count=1), Work(id="W2", cited_by_count=2)]
+    merged = merge_works(saved, [Work(id="W1", cited_by_count=9), Work(id="W3")])
+    assert [(w.id, w.cited_by_count) for w in merged] == [("W1", 9), ("W2", 2), ("W3", 0)]
+
+
+def test_cap_keeps_newest_then_most_cited():
+    saved = [Work(id=f"old{i}", publication_year=2000, cited_by_count=i) for i in range(MAX_SAVED_WORKS)]
+    new = [Work(id="new", publication_year=2024), Work(id="cited", publication_year=2000, cited_by_count=10_000)]
+    merged = merge_works(saved, new)
+    ids = {w.id for w in merged}
+    assert len(merged) == MAX_SAVED_WORKS
+    assert {"new", "cited"} <= ids
+    assert not {"old0", "old1"} & ids
+
+
+def test_explicit_limit():
+    works = [Work(id=f"W{i}", publication_year=2000 + i) for i in range(5)]
+    assert [w.id for w in merge_works(works, [], limit=2)] == ["W4", "W3"]
+
+
+@pytest.fixture
+def client_and_store(tmp_path):
+    store = SavedReportStore(str(tmp_path / "saved.db"))
+    app.dependency_overrides[require_saved_report_store] = lambda: store
+    yield TestClient(app), store
+    app.dependency_overrides.clear()
+
+
+def report():
+    funder = Funder(id="https://openalex.org/F1", display_name="NIH", works_count=1, cited_by_count=2)
+    return {
+        "search_terms": ["crispr"],
+        "funders_data": [work_record(Work(
+            id="W1", doi="https://doi.org/10.1/x", title="One", publication_year=2020, cited_by_count=3,
+            grants=[Grant(funder=funder.id, funder_display_name="NIH", award_id="A1", funder_details=funder)]
+        ))],
+        "funder_stats": {"total_works": 1},
+        "summary": "Summary",
+    }
+
+
+@pytest.mark.parametrize("report_format", ["full", "compact"])
+def test_saved_report_matches_the_streamed_report_shape(client_and_store, report_format):
+    client, store = client_and_store
+    report_id = asyncio.run(store.create("crispr", 10, report(), "2024-01-01"))
+    response = client.get(f"/saved_reports/{report_id}", params={"format": report_format})
+    assert response.status_code == 200
+    saved = response.json()
+    assert (saved.pop("id"), saved.pop("description"), saved.pop("last_run")) == (report_id, "crispr", "2024-01-01")
+    streamed = json.loads(to_json(format_report(report(), report_format)))
+    # Only the report's own fields are compared; the store adds its bookkeeping
+    assert {key: saved[key] for key in streamed} == streamed
+    if report_format == "full":
+        assert set(saved["funders_data"][0]) == {"id", "doi", "title", "publication_year", "cited_by_count", "grants"}
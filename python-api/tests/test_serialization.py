@@ -0,0 +1,40 @@
+import pytest
+
+from app import serialization
+from app.serialization import negotiate_encoding
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(serialization, "brotli", None)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(serialization, "brotli", object())
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZip, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=0.5", "gzip"),
+    ("gzip;q=nonsense", None),
+    ("*", "gzip"),
+    ("*;q=0, gzip", "gzip"),
+    ("br", None),
+])
+def test_without_brotli(without_brotli, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("*", "br"),
+])
+def test_with_brotli(with_brotli, header, expected):
+    assert negotiate_encoding(header) == expected
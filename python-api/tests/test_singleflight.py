@@ -0,0 +1,68 @@
+import asyncio
+
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.do("key", call) for _ in range(3)))
+        return results, len(flights)
+
+    results, in_flight = asyncio.run(main())
+    assert results == ["result"] * 3
+    assert len(calls) == 1
+    assert in_flight == 0
+
+
+def test_cancelled_waiter_leaves_the_call_running_for_the_others():
+    async def main():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "result"
+
+        leaving = asyncio.create_task(flights.do("key", call))
+        staying = asyncio.create_task(flights.do("key", call))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leaving, await staying
+
+    leaving, result = asyncio.run(main())
+    assert leaving.cancelled()
+    assert result == "result"
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def main():
+        flights = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.create_task(flights.do("key", call))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # A later caller starts afresh instead of joining the cancelled call
+        return len(flights), await flights.do("key", lambda: asyncio.sleep(0, "fresh"))
+
+    in_flight, result = asyncio.run(main())
+    assert in_flight == 0
+    assert result == "fresh"